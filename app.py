@@ -9,10 +9,10 @@ Original file is located at
 import streamlit as st
 import pandas as pd
 from datetime import datetime 
+import math
 import os
-import requests 
+import tempfile
 from PIL import Image  # For resizing images
-from io import BytesIO, StringIO  # For handling file-like objects
 
 # Import pipeline functions (ensure they are implemented in `pipeline.py`)
 from pipeline import (
@@ -20,8 +20,13 @@ from pipeline import (
     calculate_trend_momentum,
     visualize_trends,
     generate_investigative_report,
-    categorize_momentum
+    categorize_momentum,
+    stage_memo,
+    diagnostics
 )
+from ingest import load_raw_posts
+from storage import REPORT_COLUMNS, ReportIndex, ReportStore, to_csv_frame
+from http_cache import HTTPCache
 
 # Configure page
 st.set_page_config(
@@ -31,66 +36,142 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# GitHub raw CSV URL for default dataset
-DEFAULT_DATASET_URL = "https://raw.githubusercontent.com/hanna-tes/RadarSystem/refs/heads/main/Gabon_intelligence_reportMarch.csv"
+# GitHub raw URLs for the default dataset and heatmap; overridable to point at a mirror or local stand-in
+DEFAULT_DATASET_URL = os.environ.get(
+    "RADAR_DEFAULT_DATASET_URL",
+    "https://raw.githubusercontent.com/hanna-tes/RadarSystem/refs/heads/main/Gabon_intelligence_reportMarch.csv"
+)
+HEATMAP_URL = os.environ.get(
+    "RADAR_HEATMAP_URL",
+    "https://raw.githubusercontent.com/hanna-tes/RadarSystem/main/trend_visualization_March_AP.png"
+)
+HTTP_CACHE_DIR = os.path.join(".cache", "http")
+
+# Reports are converted to Parquet once and read column by column from here
+REPORT_CACHE_DIR = os.path.join(".cache", "reports")
+
+# Columns each tab reads; the heavy source/URL/summary text stays on disk until needed
+OVERVIEW_COLUMNS = ['Cluster ID', 'First Detected', 'Last Updated', 'Momentum Score',
+                    'Total Posts', 'Peak Activity', 'Thread Categorization']
+PAGE_SIZES = [25, 50, 100, 250]
+MAX_CHART_CLUSTERS = 50  # Charts of every cluster in a large report are unreadable and slow to draw
+
+@st.cache_resource
+def get_http_cache():
+    """One pooled session and on-disk cache shared by every session and rerun"""
+    return HTTPCache(HTTP_CACHE_DIR, timeout=10, max_age=300)
 
 def load_default_dataset():
-    """Load default preprocessed dataset from GitHub"""
+    """Load default preprocessed dataset from GitHub, revalidating the local copy conditionally"""
     try:
-        response = requests.get(DEFAULT_DATASET_URL)
-        if response.status_code == 200:
-            df = pd.read_csv(BytesIO(response.content))
-            
-            # Validate required columns
-            expected_columns = {
-                'Cluster ID',
-                'First Detected',
-                'Last Updated',
-                'Momentum Score',
-                'Total Posts',
-                'Peak Activity',
-                'Unique Sources',
-                'Report Summary',
-                'All URLs',
-                'Thread Categorization'
-            }
-            
-            missing_cols = expected_columns - set(df.columns)
-            if missing_cols:
-                st.error(f"❌ Default dataset missing required columns: {missing_cols}")
-                return pd.DataFrame()
-                
-            # Convert timestamps
-            df['First Detected'] = pd.to_datetime(df['First Detected'], errors='coerce')
-            df['Last Updated'] = pd.to_datetime(df['Last Updated'], errors='coerce')
-            
-            return df
-        else:
-            st.error(f"❌ Failed to fetch default dataset. Status code: {response.status_code}")
-            return pd.DataFrame()
+        with open(get_http_cache().fetch(DEFAULT_DATASET_URL), 'rb') as f:
+            store = ReportStore.from_bytes(f.read(), "default.csv", REPORT_CACHE_DIR)
+
+        # Validate required columns
+        missing_cols = set(REPORT_COLUMNS) - set(store.columns)
+        if missing_cols:
+            st.error(f"❌ Default dataset missing required columns: {missing_cols}")
+            return None
+
+        return store
     except Exception as e:
         st.error(f"❌ Error loading default dataset: {str(e)}")
-        return pd.DataFrame()
-
-def display_results(df):
-    expected_columns = {
-        'Cluster ID',
-        'First Detected',
-        'Last Updated',
-        'Momentum Score',
-        'Total Posts',
-        'Peak Activity',
-        'Unique Sources',
-        'Report Summary',
-        'All URLs',
-        'Thread Categorization'
-    }
-
-    if not expected_columns.issubset(df.columns):
-        missing_columns = expected_columns - set(df.columns)
-        st.error(f"❌ Missing required columns: {missing_columns}. Found: {list(df.columns)}")
+        return None
+
+def load_heatmap_image():
+    """Path of the resized heatmap, re-rendered only when the remote image changes"""
+    http_cache = get_http_cache()
+    body_path = http_cache.fetch(HEATMAP_URL)
+    resized_path = http_cache.derived_path(HEATMAP_URL, "800x600.png")
+    if not os.path.exists(resized_path):
+        # Rendered aside and moved into place, so a concurrent session never reads a half-written PNG
+        fd, tmp_path = tempfile.mkstemp(suffix=".png.tmp", dir=http_cache.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                Image.open(body_path).resize((800, 600)).save(f, format="PNG")
+            os.replace(tmp_path, resized_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return resized_path
+
+def show_cache_stats():
+    """Sidebar view of memoized pipeline stages, with a reset alongside Streamlit's own caches"""
+    with st.sidebar.expander("⚙️ Pipeline cache"):
+        stats = stage_memo.stats()
+        if stats.empty:
+            st.caption("No pipeline stages have run yet.")
+        else:
+            st.dataframe(stats.round(3), hide_index=True)
+        if st.button("Clear cached results"):
+            stage_memo.clear()
+            st.cache_data.clear()
+            st.rerun()
+
+def show_diagnostics():
+    """Opt-in per-stage metrics and profiles; full DataFrame dumps need a second, explicit switch"""
+    with st.sidebar.expander("🩺 Diagnostics"):
+        # Switches live in this session's state; another user's choice never changes what this session records
+        enabled = st.checkbox("Record stage metrics", key="diagnostics_enabled")
+        trace_memory = st.checkbox("Trace peak memory (slower)", key="diagnostics_trace_memory", disabled=not enabled)
+        dump_frames = st.checkbox("Dump full DataFrames (slow)", key="diagnostics_dump_frames", disabled=not enabled)
+        diagnostics.use_flags(enabled=enabled, trace_memory=trace_memory, dump_frames=dump_frames)
+        records = diagnostics.records()
+        if records.empty:
+            st.caption("No stage metrics recorded.")
+            return
+        st.markdown("**Where the time went**")
+        st.dataframe(diagnostics.summary(), hide_index=True)
+        with st.popover("All records"):
+            st.dataframe(records, hide_index=True)
+        st.download_button("📥 Profile (JSON)", data=diagnostics.to_json(),
+                           file_name="radar_profile.json", mime="application/json")
+        st.download_button("📥 Profile (Prometheus)", data=diagnostics.to_prometheus(),
+                           file_name="radar_profile.prom", mime="text/plain")
+        if st.button("Clear metrics"):
+            diagnostics.clear()
+            st.rerun()
+
+@st.cache_resource(max_entries=8)
+def get_report_index(path):
+    """Light columns of a stored report, indexed by Cluster ID, built once per report file"""
+    return ReportIndex(ReportStore(path), OVERVIEW_COLUMNS)
+
+def report_filters(index):
+    """Tier, date and momentum filters, applied to the index rather than the full report"""
+    with st.expander("🔎 Filter clusters", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        tiers = col1.multiselect("Threat tier", index.tiers)
+        first, last = index.date_range()
+        start = end = None
+        if first is not None:
+            dates = col2.date_input("First detected", value=(first.date(), last.date()))
+            if len(dates) == 2:
+                start, end = dates
+        min_score = col3.number_input("Min momentum", value=0.0, min_value=0.0)
+        max_score = col3.number_input("Max momentum (0 = no limit)", value=0.0, min_value=0.0)
+    return index.filter(tiers=tiers, start=start, end=end, min_score=min_score or None, max_score=max_score or None)
+
+def paginate(selection, key):
+    """Page controls for a selection; returns the visible page, highest momentum first"""
+    col1, col2 = st.columns([1, 3])
+    page_size = col1.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}_page_size")
+    pages = max(1, math.ceil(len(selection) / page_size))
+    page = col2.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page") - 1
+    return ReportIndex.page(selection, page, page_size)
+
+def display_results(store):
+    expected_columns = set(REPORT_COLUMNS)
+
+    if not expected_columns.issubset(store.columns):
+        missing_columns = expected_columns - set(store.columns)
+        st.error(f"❌ Missing required columns: {missing_columns}. Found: {store.columns}")
         return
 
+    index = get_report_index(store.path)
+    selection = report_filters(index)
+    st.caption(f"{len(selection):,} of {len(index):,} clusters match the filters")
+
     tab1, tab2, tab3 = st.tabs([
         "📊 Cluster Analytics",
         "📜 Threat Reports",
@@ -99,47 +180,70 @@ def display_results(df):
 
     with tab1:
         st.markdown("### Cluster Overview")
-        st.dataframe(df)
+        light_columns = list(index.frame.columns)
+        columns = st.multiselect("Columns", light_columns, default=light_columns)
+        page_rows = paginate(selection, "overview")
+        st.dataframe(page_rows[columns])
 
         # Fallback image visualization
-        heatmap_url = "https://raw.githubusercontent.com/hanna-tes/RadarSystem/main/trend_visualization_March_AP.png"
+        top = selection.nlargest(MAX_CHART_CLUSTERS, 'Momentum Score')
         try:
-            response = requests.get(heatmap_url)
-            if response.status_code == 200:
-                img = Image.open(BytesIO(response.content))
-                resized_img = img.resize((800, 600))
-                st.image(resized_img, caption="Narrative Growth vs Momentum Intensity", use_container_width=True)
-            else:
-                st.warning("⚠️ Heatmap unavailable — using fallback visualization")
-                st.line_chart(df.set_index('Cluster ID')['Momentum Score'])
+            st.image(load_heatmap_image(), caption="Narrative Growth vs Momentum Intensity", use_container_width=True)
         except Exception as e:
             st.warning("⚠️ Heatmap unavailable — using fallback visualization")
-            st.line_chart(df.set_index('Cluster ID')['Momentum Score'])
+            st.line_chart(top['Momentum Score'])
 
-        st.markdown("### Total Posts and Peak Activity by Cluster")
-        bar_data = df.groupby('Cluster ID')[['Total Posts', 'Peak Activity']].sum().reset_index()
-        st.bar_chart(bar_data.set_index('Cluster ID'))
+        st.markdown(f"### Total Posts and Peak Activity (top {MAX_CHART_CLUSTERS} clusters by momentum)")
+        st.bar_chart(top[['Total Posts', 'Peak Activity']])
 
     with tab2:
-        cluster_selector = st.selectbox(
-            "Select Cluster for Detailed Analysis",
-            options=df['Cluster ID'].unique(),
-            format_func=lambda x: f"Cluster {x}"
-        )
-        cluster_data = df[df['Cluster ID'] == cluster_selector]
-        st.markdown(f"#### Report Summary for Cluster {cluster_selector}")
-        st.info(cluster_data['Report Summary'].iloc[0] if not cluster_data.empty else "No summary available")
+        if page_rows.empty:
+            st.info("No clusters match the filters")
+        else:
+            cluster_selector = st.selectbox(
+                "Select Cluster for Detailed Analysis (from the current page)",
+                options=page_rows.index.tolist(),
+                format_func=lambda x: f"Cluster {x}"
+            )
+            # Heavy cells are read for the selected cluster only, and sources/URLs only when asked for
+            cluster_data = index.detail(cluster_selector, ['Report Summary'])
+            st.markdown(f"#### Report Summary for Cluster {cluster_selector}")
+            st.info(cluster_data['Report Summary'].iloc[0] if not cluster_data.empty else "No summary available")
+            if st.toggle("Show unique sources"):
+                sources = index.detail(cluster_selector, ['Unique Sources'])['Unique Sources']
+                st.dataframe(pd.Series(sources.iloc[0] if len(sources) else [], name='Source'), hide_index=True)
+            if st.toggle("Show all URLs"):
+                urls = index.detail(cluster_selector, ['All URLs'])['All URLs']
+                st.dataframe(pd.Series(urls.iloc[0] if len(urls) else [], name='URL'), hide_index=True,
+                             column_config={'URL': st.column_config.LinkColumn()})
 
     with tab3:
-        categorization_df = df[['Cluster ID', 'Thread Categorization']]
-        st.dataframe(categorization_df)
-
-        st.download_button(
-            label="📥 Download Full Report",
-            data=df.to_csv(index=False).encode('utf-8'),
-            file_name=f"threat_report_{datetime.now().date()}.csv",
-            mime="text/csv"
-        )
+        st.bar_chart(selection['Thread Categorization'].value_counts())
+        st.dataframe(paginate(selection, "categorization")[['Thread Categorization']])
+
+        # Serializing every text cell is the slowest thing on this page; only do it on request
+        if st.button("Prepare full CSV report"):
+            st.session_state.report_csv = (store.path, to_csv_frame(store.load()).to_csv(index=False).encode('utf-8'))
+        prepared = st.session_state.get('report_csv')
+        if prepared and prepared[0] == store.path:
+            st.download_button(
+                label="📥 Download Full Report",
+                data=prepared[1],
+                file_name=f"threat_report_{datetime.now().date()}.csv",
+                mime="text/csv"
+            )
+        # The Parquet file is read into the page only on request too, not on every filter or page click
+        if st.button("Prepare full Parquet report"):
+            with open(store.path, 'rb') as f:
+                st.session_state.report_parquet = (store.path, f.read())
+        prepared = st.session_state.get('report_parquet')
+        if prepared and prepared[0] == store.path:
+            st.download_button(
+                label="📥 Download Full Report (Parquet)",
+                data=prepared[1],
+                file_name=f"threat_report_{datetime.now().date()}.parquet",
+                mime="application/octet-stream"
+            )
 
 def fetch_files_from_drive(folder_id):
     """Mock function for Google Drive file listing"""
@@ -154,6 +258,8 @@ def download_csv_from_drive(file_id):
 def main():
     st.title("🇬🇦 Gabon Election Threat Intelligence Dashboard")
     st.markdown("### Real-time Narrative Monitoring & FIMI Detection")
+    show_cache_stats()
+    show_diagnostics()
 
     analysis_option = st.radio(
         "Choose an option:",
@@ -163,8 +269,8 @@ def main():
 
     if analysis_option == "📊 Analyze Raw Data (Real-Time)":
         uploaded_file = st.file_uploader(
-            "Upload Social Media Data (CSV/Excel)",
-            type=["csv", "xlsx"],
+            "Upload Social Media Data (CSV/Excel/Parquet)",
+            type=["csv", "xlsx", "parquet"],
             help="Requires columns: 'text', 'Timestamp', 'URL', 'Source'"
         )
 
@@ -172,16 +278,10 @@ def main():
             @st.cache_data
             def load_data(file):
                 try:
-                    if file.name.endswith('.csv'):
-                        try:
-                            df = pd.read_csv(file, encoding='utf-16', sep='\t', low_memory=False)
-                        except UnicodeError:
-                            file.seek(0)
-                            df = pd.read_csv(file, encoding='utf-8', low_memory=False)
-                    else:
-                        df = pd.read_excel(file)
-                    df['Timestamp'] = pd.to_datetime(df['Timestamp'], errors='coerce')
-                    return df
+                    # Encoding and delimiter are sniffed once; only the pipeline columns are kept.
+                    # Every view below works on the whole upload, so the compacted chunks from
+                    # iter_raw_batches are joined here; peak memory is that frame plus one raw chunk
+                    return load_raw_posts(file)
                 except Exception as e:
                     st.error(f"❌ Error reading file: {str(e)}")
                     return pd.DataFrame()
@@ -197,12 +297,12 @@ def main():
 
         else:
             st.info("Using default dataset...")
-            df = load_default_dataset()
-            if df.empty:
+            store = load_default_dataset()
+            if store is None:
                 st.error("❌ Failed to load default dataset from GitHub")
                 return
             st.success("✅ Default dataset loaded successfully!")
-            st.dataframe(df.head())
+            st.dataframe(store.load(columns=OVERVIEW_COLUMNS).head())
 
     elif analysis_option == "📈 View Preprocessed Data Results":
         upload_option = st.radio(
@@ -212,17 +312,17 @@ def main():
 
         if upload_option == "Upload Locally":
             uploaded_file = st.file_uploader(
-                "Upload Preprocessed Report (CSV)",
-                type=["csv"],
+                "Upload Preprocessed Report (CSV/Parquet)",
+                type=["csv", "parquet"],
                 help="Requires columns: 'Cluster ID', 'First Detected', 'Last Updated', 'Momentum Score', 'Unique Sources', 'Report Summary', 'All URLs', 'Thread Categorization'"
             )
             if uploaded_file:
                 try:
-                    df = pd.read_csv(uploaded_file, encoding='utf-8')
+                    store = ReportStore.from_upload(uploaded_file, REPORT_CACHE_DIR)
                     st.success("✅ Preprocessed report loaded successfully!")
-                    display_results(df)
+                    display_results(store)
                 except Exception as e:
-                    st.error(f"❌ Error reading CSV: {str(e)}")
+                    st.error(f"❌ Error reading report: {str(e)}")
 
         elif upload_option == "Fetch from Google Drive":
             project_name = st.text_input("Enter Project Name", help="Example: GIZ")
@@ -268,14 +368,14 @@ def main():
                             st.error("❌ Failed to load data from Google Drive.")
                         else:
                             st.success("✅ CSV file loaded successfully!")
-                            display_results(df)
+                            display_results(ReportStore.from_frame(df, REPORT_CACHE_DIR))
 
         elif upload_option == "Use Default Dataset":
             with st.spinner("📥 Loading default preprocessed dataset from GitHub..."):
-                df = load_default_dataset()
-                if not df.empty:
+                store = load_default_dataset()
+                if store is not None:
                     st.success("✅ Default dataset loaded successfully!")
-                    display_results(df)
+                    display_results(store)
                 else:
                     st.error("❌ Failed to load default dataset.")
 
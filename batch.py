@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""Headless batch runner producing the preprocessed threat report.
+
+Runs the full pipeline outside Streamlit: clustering, momentum, one LLM
+report per emerging cluster, and the report file that the dashboard's
+"View Preprocessed Data Results" mode reads. Every stage checkpoints its
+output under the work directory, and each finished cluster report is
+appended as soon as it arrives, so a rerun after a crash or an LLM
+rate-limit failure resumes where the last one stopped.
+
+A checkpoint is reused only while its input and the CONFIG sections it
+depends on are unchanged; changing either recomputes that stage and every
+stage after it.
+
+Usage:
+    python batch.py run --data raw_posts.csv --out report.parquet [--workdir .cache/batch]
+                        [--report-workers 4] [--restart]
+    python batch.py status --data raw_posts.csv [--workdir .cache/batch]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import sys
+
+import pandas as pd
+
+from pipeline import (CONFIG, bertrend_analysis, calculate_trend_momentum, generate_reports, categorize_momentum,
+                      stage_memo, valid_posts, projection_version, media_version)
+from ingest import load_raw_posts, write_raw_parquet
+from stage_memo import fingerprint
+from storage import normalize_report, to_csv_frame, write_report_parquet
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("posts", "clusters", "momentum", "reports")
+EXAMPLES = 3
+# Column order of the reports the dashboard has always been given
+OUTPUT_COLUMNS = [
+    'Cluster ID', 'First Detected', 'Last Updated', 'Momentum Score', 'Total Posts', 'Peak Activity',
+    'Unique Sources', 'Report Summary',
+    *[column for i in range(1, EXAMPLES + 1) for column in (f'Example Text {i}', f'Example URL {i}')],
+    'All URLs', 'Thread Categorization'
+]
+
+def file_digest(path, block_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def stage_settings():
+    """What each stage's output depends on besides its input; a stage's key also chains in the previous stage's key.
+
+    The saved projection and the media manifest live outside CONFIG, so
+    their versions are part of the keys too.
+    """
+    return {
+        "posts": {},
+        "clusters": {
+            **{s: CONFIG[s] for s in ("bertrend", "gpu_params", "cpu_inference", "near_duplicates")},
+            "projection_version": projection_version()
+        },
+        "momentum": {
+            **{s: CONFIG[s] for s in ("analysis", "bertrend", "media_reuse")},
+            "media_version": media_version()
+        },
+        "reports": {"model_id": CONFIG["model_id"]}
+    }
+
+class Checkpoints:
+    """Stage outputs under one directory, with a manifest of the key each was produced under"""
+    def __init__(self, root, input_digest):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        os.makedirs(root, exist_ok=True)
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        self.input_digest = input_digest
+        self.rekey()
+
+    def rekey(self):
+        """Recompute every stage's key from the current settings and versions"""
+        settings = stage_settings()
+        self.keys, previous = {}, self.input_digest
+        for stage in STAGES:
+            previous = self.keys[stage] = fingerprint(previous, settings[stage])
+
+    def path(self, stage):
+        suffix = {"posts": "parquet", "clusters": "parquet", "momentum": "pkl", "reports": "jsonl"}[stage]
+        return os.path.join(self.root, f"{stage}.{suffix}")
+
+    def done(self, stage):
+        """True if the stage's output on disk was produced under its current key.
+
+        For "reports" this only means the finished reports on disk are
+        reusable; the stage itself completes cluster by cluster.
+        """
+        return self.manifest.get(stage) == self.keys[stage] and os.path.exists(self.path(stage))
+
+    def mark(self, stage):
+        self.manifest[stage] = self.keys[stage]
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def save(self, stage, write):
+        """Write a stage's output atomically, then record it as done"""
+        path = self.path(stage)
+        tmp_path = f"{path}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        self.mark(stage)
+
+def run_stage(checkpoints, stage, compute, write, read):
+    if checkpoints.done(stage):
+        logger.info(f"Resuming: {stage} already done")
+        return read(checkpoints.path(stage))
+    logger.info(f"Running {stage}")
+    result = compute()
+    # The stage may have fitted and saved the projection itself: key its output by the version it used
+    checkpoints.rekey()
+    checkpoints.save(stage, lambda path: write(result, path))
+    return result
+
+def _write_pickle(obj, path):
+    with open(path, 'wb') as f:
+        pickle.dump(obj, f)
+
+def _read_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def load_posts(data):
+    """Raw upload with the rows the pipeline cannot use dropped"""
+    posts = load_raw_posts(data)
+    # Empty and whitespace-only texts are dropped by the embedder; keeping them would misalign the clusters
+    posts = valid_posts(posts.dropna(subset=['Timestamp'])).reset_index(drop=True)
+    if posts.empty:
+        raise ValueError(f"No posts with both text and a Timestamp in {data}")
+    logger.info(f"Loaded {len(posts)} posts from {data}")
+    return posts
+
+def cluster_posts(posts):
+    clustered = bertrend_analysis(posts)
+    if clustered.empty:
+        # bertrend_analysis has already logged why
+        raise RuntimeError("Clustering produced no clusters")
+    return clustered
+
+def read_finished_reports(path):
+    """Completed report rows by cluster id; a line cut off by a crash is dropped"""
+    rows = {}
+    if not os.path.exists(path):
+        return rows
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping a truncated line in {path}")
+                continue
+            rows[row['Cluster ID']] = row
+    return rows
+
+def report_row(cluster_id, cluster_data, score, report):
+    """One report row in the dashboard's layout"""
+    peak = cluster_data['Timestamp'].dt.floor(CONFIG["analysis"]["time_window"]).value_counts().max()
+    row = {
+        'Cluster ID': int(cluster_id),
+        'First Detected': cluster_data['Timestamp'].min().strftime('%Y-%m-%d %H:%M'),
+        'Last Updated': cluster_data['Timestamp'].max().strftime('%Y-%m-%d %H:%M'),
+        'Momentum Score': round(float(score), 4),
+        'Total Posts': int(len(cluster_data)),
+        'Peak Activity': int(peak),
+        'Unique Sources': sorted(cluster_data['Source'].dropna().astype(str).unique().tolist()),
+        'Report Summary': report['report'],
+        'All URLs': cluster_data['URL'].dropna().astype(str).unique().tolist(),
+        'Thread Categorization': categorize_momentum(score)
+    }
+    for i in range(EXAMPLES):
+        texts, urls = report['sample_texts'], report['sample_urls']
+        row[f'Example Text {i + 1}'] = texts[i] if i < len(texts) else None
+        row[f'Example URL {i + 1}'] = urls[i] if i < len(urls) else None
+    return row
+
+def write_cluster_reports(checkpoints, clustered, emerging, momentum_states, report_workers=None):
+    """Generate reports for the emerging clusters not yet on disk; returns (rows, failed cluster ids)"""
+    path = checkpoints.path("reports")
+    if checkpoints.manifest.get("reports") != checkpoints.keys["reports"] and os.path.exists(path):
+        # Produced for other clusters or another model: start over
+        os.remove(path)
+    rows = read_finished_reports(path)
+    scores = {}
+    for cluster_id, score in emerging:
+        scores.setdefault(cluster_id, score)
+    pending = [(cluster_id, score) for cluster_id, score in emerging if cluster_id not in rows]
+    logger.info(f"{len(rows)} of {len(scores)} cluster reports already done")
+    failed = []
+    if not pending:
+        return rows, failed
+    groups = clustered.groupby('Cluster')
+    with open(path, 'a', encoding='utf-8') as f:
+        for cluster_id, report in generate_reports(clustered, pending, momentum_states, max_workers=report_workers):
+            if 'error' in report:
+                logger.error(f"Report for cluster {cluster_id} failed: {report['error']}")
+                failed.append(cluster_id)
+                continue
+            row = report_row(cluster_id, groups.get_group(cluster_id), scores[cluster_id], report)
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            # On disk before the next report arrives, so a crash loses at most the reports in flight
+            f.flush()
+            os.fsync(f.fileno())
+            rows[cluster_id] = row
+            if checkpoints.manifest.get("reports") != checkpoints.keys["reports"]:
+                # Marked once a report is on disk, so status never counts reports that were not written
+                checkpoints.mark("reports")
+    return rows, failed
+
+def write_report(rows, out):
+    """Highest momentum first, as Parquet or as the CSV layout older tooling expects"""
+    report = pd.DataFrame(list(rows), columns=OUTPUT_COLUMNS)
+    report = report.sort_values('Momentum Score', ascending=False, ignore_index=True)
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    tmp_path = f"{out}.tmp"
+    if out.endswith('.parquet'):
+        write_report_parquet(report, tmp_path)
+    else:
+        to_csv_frame(normalize_report(report)).to_csv(tmp_path, index=False, encoding='utf-8')
+    os.replace(tmp_path, out)
+    return report
+
+def run(data, out, workdir, report_workers=None, restart=False):
+    """Run or resume the pipeline for one input; returns the number of clusters whose report failed"""
+    digest = file_digest(data)
+    root = os.path.join(workdir, digest[:16])
+    if restart and os.path.exists(root):
+        shutil.rmtree(root)
+    checkpoints = Checkpoints(root, digest)
+    # A single pass: holding deep copies of every stage result would only cost memory.
+    # Scoped to the run, so a caller in the same process (the dashboard, tests) keeps its setting
+    with stage_memo.disabled():
+        return _run_stages(checkpoints, data, out, report_workers)
+
+def _run_stages(checkpoints, data, out, report_workers):
+    posts = run_stage(checkpoints, "posts", lambda: load_posts(data), write_raw_parquet, pd.read_parquet)
+    clustered = run_stage(
+        checkpoints, "clusters", lambda: cluster_posts(posts),
+        lambda df, path: df.to_parquet(path, index=False), pd.read_parquet
+    )
+    emerging, momentum_states = run_stage(
+        checkpoints, "momentum", lambda: calculate_trend_momentum(clustered), _write_pickle, _read_pickle
+    )
+    logger.info(f"{len({cluster_id for cluster_id, _ in emerging})} emerging clusters")
+    rows, failed = write_cluster_reports(checkpoints, clustered, emerging, momentum_states, report_workers)
+    if failed:
+        logger.error(f"{len(failed)} cluster reports failed ({sorted(failed)}); rerun the same command to resume")
+        return len(failed)
+    report = write_report(rows.values(), out)
+    logger.info(f"Wrote {len(report)} cluster reports to {out}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="run or resume the pipeline and write the report")
+    run_parser.add_argument("--data", required=True, help="raw posts (CSV/Excel/Parquet)")
+    run_parser.add_argument("--out", required=True, help="report path; .parquet, anything else is written as CSV")
+    run_parser.add_argument("--report-workers", type=int, help="concurrent LLM reports (default: reports.max_workers)")
+    run_parser.add_argument("--restart", action="store_true", help="discard this input's checkpoints first")
+    status = sub.add_parser("status", help="show which stages are checkpointed for an input")
+    status.add_argument("--data", required=True)
+    for p in (run_parser, status):
+        p.add_argument("--workdir", default=os.path.join(".cache", "batch"), help="checkpoint directory")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        digest = file_digest(args.data)
+        checkpoints = Checkpoints(os.path.join(args.workdir, digest[:16]), digest)
+        for stage in STAGES[:-1]:
+            print(f"{stage:10s} {'done' if checkpoints.done(stage) else 'pending'}")
+        reports = read_finished_reports(checkpoints.path("reports")) if checkpoints.done("reports") else {}
+        print(f"{'reports':10s} {len(reports)} cluster reports on disk")
+        return
+    sys.exit(1 if run(args.data, args.out, args.workdir, args.report_workers, args.restart) else 0)
+
+if __name__ == "__main__":
+    main()
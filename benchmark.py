@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for the Radar pipeline.
+
+Usage:
+    python benchmark.py padding [--rows 20000] [--data raw_posts.csv]
+    python benchmark.py ann [--rows 20000] [--dim 64]
+    python benchmark.py momentum [--clusters 2000] [--windows 200]
+    python benchmark.py startup [--module pipeline] [--with-model] [--json startup.json]
+                                [--max-seconds 10] [--max-rss-mb 1500]
+    python benchmark.py pipeline [--rows 10000 100000 1000000] [--clusters 200] [--sources 2000]
+                                 [--burstiness 0.7] [--tiny-model] [--trace-memory]
+                                 [--json run.json] [--baseline previous.json]
+    python benchmark.py cpu [--rows 20000] [--engines torch int8 onnx] [--workers 4] [--min-ari 0.9]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import annoy
+from sklearn.metrics import adjusted_rand_score
+
+import pipeline
+from pipeline import (CONFIG, DRCDataset, encode_texts, calculate_trend_momentum, momentum_decay,
+                      cluster_candidates, get_cpu_encoder)
+from projection import Projection
+from neighbors import ExactNeighborIndex, AnnoyNeighborIndex
+
+# Vocabulary mixing the languages we see in Gabon/DRC scrapes
+WORDS = (
+    "élection gabon libreville président vote campagne oligui nguema ceci est une vidéo "
+    "france afrique politique transition militaire opposition peuple liberté démocratie "
+    "the election results fraud protest police news breaking today people country "
+    "mbolo bonjour merci frère soeur #gabon #election2025 #afrique #rdc @gabonnews 🇬🇦 🔥 💯"
+).split()
+
+def sample_texts(n, data=None, seed=0):
+    """Real posts from a raw upload if given, otherwise tweet-shaped synthetic text"""
+    if data:
+        texts = pd.read_csv(data, usecols=['text'])['text'].dropna().astype(str).tolist()
+        return texts[:n]
+    rng = np.random.default_rng(seed)
+    # Post lengths are heavily right-skewed: most are short, a few are long comments
+    lengths = np.clip(rng.lognormal(mean=3.0, sigma=0.7, size=n).astype(int), 3, 300)
+    return [" ".join(rng.choice(WORDS, size=k)) for k in lengths]
+
+def bench_padding(texts):
+    """Tokens/sec of fixed max_length padding against length-bucketed dynamic padding"""
+    # The multi-process CPU engine ignores dynamic_padding, so both paths would time the same encoder
+    CONFIG["cpu_inference"]["enabled"] = False
+    real_tokens = int(DRCDataset(texts).token_lengths().sum())
+    rows = []
+    for label, dynamic in [("fixed", False), ("dynamic", True)]:
+        start = time.perf_counter()
+        encode_texts(texts, dynamic_padding=dynamic)
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "path": label,
+            "texts": len(texts),
+            "real_tokens": real_tokens,
+            "seconds": round(elapsed, 2),
+            "tokens_per_sec": round(real_tokens / elapsed, 1)
+        })
+    result = pd.DataFrame(rows)
+    result["speedup"] = (result["tokens_per_sec"] / result["tokens_per_sec"].iloc[0]).round(2)
+    return result
+
+def sample_embeddings(n, dim=64, n_clusters=200, seed=0):
+    """Gaussian blobs standing in for PCA-reduced post embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=3.0, size=(n_clusters, dim))
+    labels = rng.integers(0, n_clusters, size=n)
+    return (centers[labels] + rng.normal(size=(n, dim))).astype(np.float32)
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+def bench_ann(embeddings, k=None):
+    """Recall@k and latency of the old per-item annoy loop against the batched backends"""
+    k = k or CONFIG["bertrend"]["ann_neighbors"]
+    n_trees, search_k = CONFIG["bertrend"]["ann_trees"], CONFIG["bertrend"]["ann_search_k"]
+    items = np.arange(len(embeddings))
+    rows = []
+
+    start = time.perf_counter()
+    exact = ExactNeighborIndex(embeddings)
+    truth, _ = exact.query_items(items, k)
+    rows.append({"backend": "exact (batched)", "search_k": "-", "build_s": 0.0,
+                 "query_s": time.perf_counter() - start, "recall": 1.0})
+
+    # Previous bertrend_analysis path: add_item loop, single-threaded build, per-item queries
+    start = time.perf_counter()
+    index = annoy.AnnoyIndex(embeddings.shape[1], 'euclidean')
+    for i, emb in enumerate(embeddings):
+        index.add_item(i, emb)
+    index.build(n_trees)
+    built = time.perf_counter()
+    found = [index.get_nns_by_item(int(i), k, search_k=search_k) for i in items]
+    rows.append({"backend": "annoy (loop, current)", "search_k": search_k, "build_s": built - start,
+                 "query_s": time.perf_counter() - built, "recall": recall(found, truth)})
+
+    start = time.perf_counter()
+    batched = AnnoyNeighborIndex.build(embeddings, n_trees=n_trees)
+    build_s = time.perf_counter() - start
+    for sk in [search_k // 100, search_k // 10, search_k]:
+        batched.search_k = sk
+        start = time.perf_counter()
+        found, _ = batched.query_items(items, k)
+        rows.append({"backend": "annoy (batched)", "search_k": sk, "build_s": build_s,
+                     "query_s": time.perf_counter() - start, "recall": recall(found, truth)})
+    return pd.DataFrame(rows).round(3)
+
+def reference_trend_momentum(clustered_df):
+    """The original iterrows implementation of calculate_trend_momentum, kept as the parity baseline"""
+    df = clustered_df.copy()
+    df['time_window'] = df['Timestamp'].dt.floor(CONFIG["analysis"]["time_window"])
+    grouped = df.groupby(['Cluster', 'time_window']).agg(
+        count=('text', 'size'),
+        sources=('Source', 'unique'),
+        last_time=('Timestamp', 'max')
+    ).reset_index()
+    emerging = []
+    momentum_states = {}
+    for cluster, cluster_group in grouped.groupby('Cluster'):
+        if cluster == -1:
+            continue
+        cluster_group = cluster_group.sort_values('time_window')
+        cumulative_sources = set()
+        momentum = 0
+        last_update = None
+        for idx, row in cluster_group.iterrows():
+            if last_update is not None:
+                delta_hours = (row['last_time'] - last_update).total_seconds() / 3600
+                momentum *= momentum_decay(delta_hours)
+            momentum += row['count']
+            cumulative_sources.update(row['sources'])
+            momentum_score = momentum * len(cumulative_sources) * np.log1p(row['count'])
+            if (momentum_score > CONFIG["bertrend"]["growth_threshold"] and
+                len(cumulative_sources) >= CONFIG["analysis"]["min_sources"]):
+                emerging.append((cluster, momentum_score))
+            last_update = row['last_time']
+        momentum_states[cluster] = {
+            'momentum': momentum,
+            'last_update': last_update,
+            'sources': cumulative_sources
+        }
+    return sorted(emerging, key=lambda x: -x[1]), momentum_states
+
+def sample_clustered(n_clusters, n_windows, posts_per_window=3, n_sources=500, seed=0):
+    """Clustered posts spread over n_windows analysis windows, with noise rows and bursty clusters"""
+    rng = np.random.default_rng(seed)
+    window_hours = pd.Timedelta(CONFIG["analysis"]["time_window"]).total_seconds() / 3600
+    n = n_clusters * n_windows * posts_per_window
+    hours = rng.uniform(0, n_windows * window_hours, size=n)
+    return pd.DataFrame({
+        'text': "post",
+        'Timestamp': pd.Timestamp("2025-03-01") + pd.to_timedelta(hours, unit='h'),
+        'Source': rng.integers(0, n_sources, size=n).astype(str),
+        'Cluster': rng.integers(-1, n_clusters, size=n)
+    })
+
+def check_momentum_parity(clustered_df):
+    """Raise AssertionError unless both implementations agree exactly"""
+    expected_emerging, expected_states = reference_trend_momentum(clustered_df)
+    emerging, states = calculate_trend_momentum(clustered_df)
+    assert emerging == expected_emerging, "emerging lists differ"
+    assert states.keys() == expected_states.keys(), "momentum_states clusters differ"
+    for cluster, expected in expected_states.items():
+        assert states[cluster] == expected, f"momentum_states differ for cluster {cluster}"
+
+def bench_momentum(clustered_df):
+    rows = []
+    # A memo hit after check_momentum_parity would time a fingerprint and a copy, not the vectorized code
+    with pipeline.stage_memo.disabled():
+        for label, func in [("iterrows (reference)", reference_trend_momentum),
+                            ("vectorized", calculate_trend_momentum)]:
+            start = time.perf_counter()
+            func(clustered_df)
+            rows.append({"implementation": label, "rows": len(clustered_df), "seconds": time.perf_counter() - start})
+    result = pd.DataFrame(rows)
+    result["speedup"] = result["seconds"].iloc[0] / result["seconds"]
+    return result.round(3)
+
+STARTUP_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+if sys.argv[2] == "1":
+    module.get_tokenizer()
+    module.get_bert_model()
+print(json.dumps({
+    "import_s": imported - start,
+    "total_s": time.perf_counter() - start,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+}))
+"""
+
+def bench_startup(module="pipeline", with_model=False, repeats=3):
+    """Cold import time and peak RSS, each measured in a fresh interpreter"""
+    runs = []
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE, module, "1" if with_model else "0"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    result = pd.DataFrame(runs)
+    # Best of N filters out noise from other processes on shared CI runners
+    return {"module": module, "with_model": with_model, **result.min().round(3).to_dict()}
+
+# Extra vocabulary for synthetic streams: Lingala, Swahili, Arabic and Portuguese alongside WORDS
+STREAM_WORDS = WORDS + (
+    "mboka bato kongo kinshasa maloba uchaguzi serikali watu habari kura "
+    "انتخابات الشعب الحكومة الرئيس eleição povo governo notícias"
+).split()
+TINY_MODEL = "prajjwal1/bert-tiny"  # 2 layers, 128 hidden: exercises the full path in seconds on CPU
+PIPELINE_STAGES = ["get_bert_embeddings", "bertrend_analysis", "calculate_trend_momentum", "visualize_trends"]
+
+def sample_posts(n, n_clusters=200, n_sources=2000, burstiness=0.7, noise=0.2, days=14, seed=0):
+    """Synthetic post stream in the raw upload schema (text, Timestamp, URL, Source).
+
+    Each cluster has its own vocabulary and a burst centre; burstiness is the
+    share of a cluster's posts packed into a few hours around that centre, the
+    rest are spread over the whole period. Sources follow a Zipf law, so a
+    few accounts post most of the content, and a noise share of posts belongs
+    to no cluster.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = np.array(STREAM_WORDS)
+    topics = [rng.choice(vocab, size=12, replace=False) for _ in range(n_clusters)]
+    templates = [[" ".join(rng.choice(topic, size=rng.integers(6, 20))) for _ in range(50)] for topic in topics]
+    clusters = np.where(rng.random(n) < noise, -1, rng.integers(0, n_clusters, size=n))
+
+    period_hours = days * 24
+    centres = rng.uniform(0, period_hours, size=n_clusters)
+    bursty = rng.random(n) < burstiness
+    hours = rng.uniform(0, period_hours, size=n)
+    in_burst = (clusters >= 0) & bursty
+    hours[in_burst] = np.mod(centres[clusters[in_burst]] + rng.normal(scale=3.0, size=in_burst.sum()), period_hours)
+
+    popularity = 1.0 / np.arange(1, n_sources + 1) ** 1.1
+    sources = rng.choice(n_sources, size=n, p=popularity / popularity.sum())
+    template_ids = rng.integers(0, 50, size=n)
+    suffixes = rng.choice(vocab, size=n)
+    noise_texts = [" ".join(rng.choice(vocab, size=10)) for _ in range(200)]
+    texts = [
+        f"{templates[c][t] if c >= 0 else noise_texts[t % 200]} {w} {i}"
+        for i, (c, t, w) in enumerate(zip(clusters.tolist(), template_ids.tolist(), suffixes.tolist()))
+    ]
+    return pd.DataFrame({
+        'text': texts,
+        'Timestamp': pd.Timestamp("2025-03-01") + pd.to_timedelta(hours, unit='h'),
+        'URL': [f"https://x.com/user{s}/status/{i}" for i, s in enumerate(sources.tolist())],
+        'Source': pd.Categorical([f"user{s}" for s in sources.tolist()])
+    }).sort_values('Timestamp', ignore_index=True)
+
+def bench_pipeline(rows, n_clusters, n_sources, burstiness, tiny_model=False, trace_memory=False):
+    """Per-stage time, throughput and memory for one corpus size, using the pipeline's own profiler"""
+    if tiny_model:
+        CONFIG["bertrend"]["model_name"] = TINY_MODEL
+    # Fresh caches: stage results must be recomputed, and embeddings computed once then reused by clustering.
+    # The projection and ANN indexes go to the scratch directory, so benchmarks never replace or crowd out saved ones
+    pipeline.stage_memo.enabled = False
+    scratch = tempfile.mkdtemp(prefix="radar-bench-")
+    CONFIG["embedding_cache"]["path"] = os.path.join(scratch, "embeddings")
+    CONFIG["projection"]["path"] = os.path.join(scratch, "projection.npz")
+    CONFIG["bertrend"]["ann_cache_dir"] = os.path.join(scratch, "ann")
+    pipeline._embedding_cache = None
+    pipeline.diagnostics.enabled = True
+    pipeline.diagnostics.trace_memory = trace_memory
+    pipeline.diagnostics.clear()
+
+    start = time.perf_counter()
+    df = sample_posts(rows, n_clusters, n_sources, burstiness)
+    generate_s = time.perf_counter() - start
+    pipeline.get_bert_embeddings(df['text'].tolist())
+    clustered_df = pipeline.bertrend_analysis(df.copy())
+    emerging, momentum_states = calculate_trend_momentum(clustered_df)
+    pipeline.visualize_trends(clustered_df, momentum_states)
+
+    summary = pipeline.diagnostics.summary()
+    summary.insert(0, "corpus_rows", rows)
+    return {
+        "commit": git_commit(),
+        "rows": rows,
+        "model": CONFIG["bertrend"]["model_name"],
+        "device": str(pipeline.device),
+        "generate_s": round(generate_s, 3),
+        "clusters_found": int(clustered_df['Cluster'].nunique()) if not clustered_df.empty else 0,
+        "emerging": len(emerging),
+        "stages": summary.to_dict(orient="records")
+    }
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def pipeline_table(results, stages=PIPELINE_STAGES):
+    """Throughput and memory table across corpus sizes; sub-stages are listed after the four entry points"""
+    table = pd.DataFrame([stage for result in results for stage in result["stages"]])
+    if table.empty:
+        return table
+    order = {stage: i for i, stage in enumerate(stages)}
+    table["order"] = table["stage"].map(order).fillna(len(stages))
+    table = table.sort_values(["corpus_rows", "order", "seconds"], ascending=[True, True, False])
+    return table.drop(columns="order")[["corpus_rows", "stage", "calls", "seconds", "rows_per_sec",
+                                        "peak_mb", "max_rss_mb"]]
+
+def compare_runs(current, baseline):
+    """Join two pipeline tables on (corpus_rows, stage) with a speedup column (>1 is faster now)"""
+    merged = current.merge(baseline, on=["corpus_rows", "stage"], how="left", suffixes=("", "_base"))
+    merged["speedup"] = (merged["seconds_base"] / merged["seconds"]).round(2)
+    merged["max_rss_delta_mb"] = (merged["max_rss_mb"] - merged["max_rss_mb_base"]).round(1)
+    return merged[["corpus_rows", "stage", "seconds_base", "seconds", "speedup",
+                   "max_rss_mb", "max_rss_delta_mb"]]
+
+def run_pipeline_sizes(args):
+    """Each corpus size in its own interpreter so max RSS is not inherited from a smaller run"""
+    results = []
+    for rows in args.rows:
+        command = [sys.executable, os.path.abspath(__file__), "pipeline", "--rows", str(rows),
+                   "--clusters", str(args.clusters), "--sources", str(args.sources),
+                   "--burstiness", str(args.burstiness), "--single"]
+        command += ["--tiny-model"] if args.tiny_model else []
+        command += ["--trace-memory"] if args.trace_memory else []
+        out = subprocess.run(command, capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+def bench_cpu(texts, timestamps, engines, workers=None):
+    """Throughput of each CPU engine against the current single-process path, with cluster-assignment parity.
+
+    Parity clusters both embedding sets through the same projection and
+    cluster_candidates and reports the adjusted Rand index against the
+    current path's labels, plus the worst per-post cosine similarity.
+    """
+    CONFIG["cpu_inference"]["enabled"] = False
+    start = time.perf_counter()
+    reference = encode_texts(texts)
+    reference_s = time.perf_counter() - start
+    projection = Projection.fit(reference, CONFIG["bertrend"]["pca_components"])
+    reference_labels = cluster_candidates(projection.transform(reference), timestamps)
+    rows = [{"engine": "current (1 process)", "workers": 1, "startup_s": 0.0, "seconds": reference_s,
+             "texts_per_sec": len(texts) / reference_s, "min_cosine": 1.0, "ari": 1.0,
+             "clusters": len(set(reference_labels) - {-1})}]
+
+    CONFIG["cpu_inference"]["enabled"] = True
+    CONFIG["cpu_inference"]["workers"] = workers
+    unit = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    for engine in engines:
+        CONFIG["cpu_inference"]["engine"] = engine
+        start = time.perf_counter()
+        encoder = get_cpu_encoder()
+        # Pool start-up and model loading are paid once per process, not per call
+        encoder.encode(texts[:min(len(texts), max(encoder.min_rows_for_pool, encoder.workers * encoder.batch_size))])
+        startup_s = time.perf_counter() - start
+        start = time.perf_counter()
+        embeddings = encoder.encode(texts)
+        seconds = time.perf_counter() - start
+        encoder.close()
+        labels = cluster_candidates(projection.transform(embeddings), timestamps)
+        cosine = np.einsum("ij,ij->i", unit, embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True))
+        rows.append({"engine": engine, "workers": encoder.workers, "startup_s": startup_s, "seconds": seconds,
+                     "texts_per_sec": len(texts) / seconds, "min_cosine": float(cosine.min()),
+                     "ari": adjusted_rand_score(reference_labels, labels), "clusters": len(set(labels) - {-1})})
+    result = pd.DataFrame(rows)
+    result["speedup"] = result["texts_per_sec"] / result["texts_per_sec"].iloc[0]
+    return result.round(3)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+    padding = sub.add_parser("padding", help="fixed vs dynamic padding throughput")
+    padding.add_argument("--rows", type=int, default=20000)
+    padding.add_argument("--data", help="raw CSV with a 'text' column")
+    ann = sub.add_parser("ann", help="neighbor search recall vs latency")
+    ann.add_argument("--rows", type=int, default=20000)
+    ann.add_argument("--dim", type=int, default=CONFIG["bertrend"]["pca_components"])
+    momentum = sub.add_parser("momentum", help="vectorized momentum parity and speed")
+    momentum.add_argument("--clusters", type=int, default=2000)
+    momentum.add_argument("--windows", type=int, default=200)
+    startup = sub.add_parser("startup", help="cold import time and RSS, for CI tracking")
+    startup.add_argument("--module", default="pipeline")
+    startup.add_argument("--with-model", action="store_true", help="also load the tokenizer and BERT model")
+    startup.add_argument("--json", help="write the measurement to this file")
+    startup.add_argument("--max-seconds", type=float, help="fail if the import takes longer")
+    startup.add_argument("--max-rss-mb", type=float, help="fail if peak RSS is higher")
+    cpu = sub.add_parser("cpu", help="CPU inference engines: throughput and cluster parity")
+    cpu.add_argument("--rows", type=int, default=20000)
+    cpu.add_argument("--engines", nargs="+", default=["torch", "int8"], help="any of torch, int8, onnx")
+    cpu.add_argument("--workers", type=int, help="encoder processes (default: cores // threads_per_worker)")
+    cpu.add_argument("--tiny-model", action="store_true", help=f"embed with {TINY_MODEL} instead of mBERT")
+    cpu.add_argument("--min-ari", type=float, help="fail if any engine's clusters agree less than this")
+    full = sub.add_parser("pipeline", help="end-to-end stage throughput and memory on synthetic streams")
+    full.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    full.add_argument("--clusters", type=int, default=200)
+    full.add_argument("--sources", type=int, default=2000)
+    full.add_argument("--burstiness", type=float, default=0.7, help="share of cluster posts inside its burst")
+    full.add_argument("--tiny-model", action="store_true", help=f"embed with {TINY_MODEL} instead of mBERT")
+    full.add_argument("--trace-memory", action="store_true", help="per-stage tracemalloc peaks (slower)")
+    full.add_argument("--json", help="write all results to this file")
+    full.add_argument("--baseline", help="results file from an earlier commit to compare against")
+    full.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.bench == "padding":
+        texts = sample_texts(args.rows, args.data)
+        print(f"device={pipeline.device} batch_size={CONFIG['gpu_params']['batch_size']} "
+              f"max_seq_length={CONFIG['gpu_params']['max_seq_length']}")
+        print(bench_padding(texts).to_string(index=False))
+    elif args.bench == "ann":
+        print(bench_ann(sample_embeddings(args.rows, args.dim)).to_string(index=False))
+    elif args.bench == "momentum":
+        clustered_df = sample_clustered(args.clusters, args.windows)
+        check_momentum_parity(clustered_df)
+        print("parity: emerging and momentum_states identical")
+        print(bench_momentum(clustered_df).to_string(index=False))
+    elif args.bench == "startup":
+        result = bench_startup(args.module, args.with_model)
+        print(json.dumps(result, indent=2))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(result, f, indent=2)
+        if args.max_seconds is not None and result["import_s"] > args.max_seconds:
+            sys.exit(f"import took {result['import_s']}s, budget {args.max_seconds}s")
+        if args.max_rss_mb is not None and result["max_rss_mb"] > args.max_rss_mb:
+            sys.exit(f"peak RSS {result['max_rss_mb']}MB, budget {args.max_rss_mb}MB")
+    elif args.bench == "cpu":
+        if args.tiny_model:
+            CONFIG["bertrend"]["model_name"] = TINY_MODEL
+        posts = sample_posts(args.rows)
+        result = bench_cpu(posts['text'].tolist(), posts['Timestamp'].astype(np.int64).values,
+                           args.engines, args.workers)
+        print(f"model={CONFIG['bertrend']['model_name']} cores={os.cpu_count()} "
+              f"threads_per_worker={CONFIG['cpu_inference']['threads_per_worker']}")
+        print(result.to_string(index=False))
+        if args.min_ari is not None and result["ari"].min() < args.min_ari:
+            sys.exit(f"cluster parity {result['ari'].min()} below {args.min_ari}")
+    elif args.bench == "pipeline":
+        if args.single:
+            result = bench_pipeline(args.rows[0], args.clusters, args.sources, args.burstiness,
+                                    args.tiny_model, args.trace_memory)
+            print(json.dumps(result, default=str))
+            return
+        results = run_pipeline_sizes(args)
+        table = pipeline_table(results)
+        print(f"commit={results[0]['commit']} model={results[0]['model']} device={results[0]['device']}")
+        print(table.to_string(index=False))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2, default=str)
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = pipeline_table(json.load(f))
+            print()
+            print(compare_runs(table, baseline).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""CPU inference engine for post embeddings.
+
+Texts are sorted by length, cut into small batches padded only to their
+longest member, and sharded over a pool of worker processes. Each worker
+loads the model once and is pinned to a fixed number of intra-op threads,
+so workers do not oversubscribe the cores. The model can run as plain fp32
+torch, with dynamically quantized int8 Linear layers, or as an ONNX export
+under onnxruntime (optional dependency).
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from transformers import BertTokenizerFast, BertModel
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("torch", "int8", "onnx")
+POOLING = ("mean", "cls", "max")
+
+def pool_hidden_states(hidden_states, attention_mask, strategy="mean"):
+    """Sentence vector from token states; pad positions never contribute, so results do not depend on pad length"""
+    if strategy == "cls":
+        return hidden_states[:, 0]
+    mask = attention_mask.unsqueeze(-1).to(hidden_states.dtype)
+    if strategy == "max":
+        return hidden_states.masked_fill(mask == 0, float("-inf")).max(dim=1).values
+    if strategy == "mean":
+        return (hidden_states * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+    raise ValueError(f"Unknown pooling {strategy!r}; expected one of {POOLING}")
+
+def export_onnx(model_name, onnx_dir):
+    """Export the model once with dynamic batch and sequence axes; later calls reuse the file"""
+    path = os.path.join(onnx_dir, f"{model_name.replace('/', '--')}.onnx")
+    if os.path.exists(path):
+        return path
+    os.makedirs(onnx_dir, exist_ok=True)
+    logger.info(f"Exporting {model_name} to {path}")
+    model = BertModel.from_pretrained(model_name).eval()
+    sample = BertTokenizerFast.from_pretrained(model_name)(["onnx export"], return_tensors="pt")
+    tmp_path = f"{path}.tmp"
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        tmp_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "last_hidden_state": {0: "batch", 1: "sequence"}
+        },
+        opset_version=14
+    )
+    os.replace(tmp_path, path)
+    return path
+
+def _load_engine(settings):
+    """(tokenizer, run) where run maps a tokenized batch to last_hidden_state"""
+    tokenizer = BertTokenizerFast.from_pretrained(settings["model_name"])
+    if settings["engine"] == "onnx":
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx CPU engine needs onnxruntime: pip install onnxruntime") from e
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = settings["threads"] or 0
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(settings["onnx_path"], options, providers=["CPUExecutionProvider"])
+
+        def run(batch):
+            inputs = {"input_ids": batch["input_ids"].numpy(), "attention_mask": batch["attention_mask"].numpy()}
+            return torch.from_numpy(session.run(["last_hidden_state"], inputs)[0])
+    else:
+        model = BertModel.from_pretrained(settings["model_name"]).eval()
+        if settings["engine"] == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        def run(batch):
+            return model(input_ids=batch["input_ids"], attention_mask=batch["attention_mask"]).last_hidden_state
+    return tokenizer, run
+
+# Per-process engine: set by the pool initializer in workers, lazily in the parent for in-process runs
+_engine = None
+_engine_settings = None
+
+def _init_worker(settings):
+    global _engine, _engine_settings
+    torch.set_num_threads(settings["threads"])
+    torch.set_num_interop_threads(1)
+    _engine, _engine_settings = _load_engine(settings), settings
+
+def _encode_batch(texts):
+    tokenizer, run = _engine
+    batch = tokenizer(
+        texts,
+        return_tensors="pt",
+        padding="longest",
+        truncation=True,
+        max_length=_engine_settings["max_seq_length"],
+        return_token_type_ids=False
+    )
+    with torch.inference_mode():
+        hidden = run(batch)
+        return pool_hidden_states(hidden, batch["attention_mask"], _engine_settings["pooling"]).float().numpy()
+
+class CPUEncoder:
+    """Length-sorted batches sharded over a process pool of pinned, single-model workers"""
+    def __init__(self, model_name, max_seq_length, pooling="mean", engine="torch", workers=None,
+                 threads_per_worker=2, batch_size=64, min_rows_for_pool=2000, onnx_dir=os.path.join(".cache", "onnx")):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown CPU engine {engine!r}; expected one of {ENGINES}")
+        if pooling not in POOLING:
+            raise ValueError(f"Unknown pooling {pooling!r}; expected one of {POOLING}")
+        cores = os.cpu_count() or 1
+        threads = max(1, min(threads_per_worker, cores))
+        self.workers = workers or max(1, cores // threads)
+        self.batch_size = batch_size
+        self.min_rows_for_pool = min_rows_for_pool
+        self.settings = {
+            "model_name": model_name,
+            "max_seq_length": max_seq_length,
+            "pooling": pooling,
+            "engine": engine,
+            "threads": threads
+        }
+        if engine == "onnx":
+            self.settings["onnx_path"] = export_onnx(model_name, onnx_dir)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                logger.info(f"Starting {self.workers} {self.settings['engine']} encoder processes "
+                            f"x {self.settings['threads']} threads")
+                # spawn, not fork: forking a process that already runs OpenMP/MKL threads can deadlock
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.settings,)
+                )
+            return self._pool
+
+    def _encode_local(self, batches):
+        global _engine, _engine_settings
+        with self._lock:
+            if _engine is None or _engine_settings != self.settings:
+                # In-process: keep torch's default thread count, there is nothing to share the cores with
+                _engine, _engine_settings = _load_engine(self.settings), self.settings
+        return [_encode_batch(batch) for batch in batches]
+
+    def encode(self, texts):
+        """Pooled float32 embeddings, one row per text in input order"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Character length is a cheap stand-in for token length when bucketing
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        batches = [[texts[i] for i in order[start:start + self.batch_size]]
+                   for start in range(0, len(order), self.batch_size)]
+        if self.workers == 1 or len(texts) < self.min_rows_for_pool:
+            parts = self._encode_local(batches)
+        else:
+            parts = list(self._executor().map(_encode_batch, batches))
+        sorted_embeddings = np.concatenate(parts)
+        restored = np.empty_like(sorted_embeddings)
+        restored[order] = sorted_embeddings
+        return restored
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
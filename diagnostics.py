@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""Structured diagnostics and profiling for pipeline stages.
+
+When enabled, each instrumented stage records wall and CPU time, rows
+processed and throughput, peak memory, and the shape and memory of the frames
+it sees. Frames themselves are never kept; a caller that wants full dumps has
+to ask for them with dump_frames. Records export as JSON or as Prometheus
+text exposition for regression tracking and hardware sizing.
+"""
+import contextvars
+import functools
+import json
+import logging
+import math
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+def frame_metrics(df):
+    """Shape and shallow memory of a DataFrame, without touching its contents"""
+    if df is None:
+        return {"rows": None, "columns": None, "memory_mb": None}
+    # Shallow: object columns count pointers only, so this stays O(columns)
+    memory = df.memory_usage(deep=False)
+    if isinstance(df, pd.DataFrame):
+        memory = memory.sum()
+    return {"rows": len(df), "columns": df.shape[1] if df.ndim > 1 else 1, "memory_mb": round(memory / 1e6, 3)}
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _json_value(value):
+    """Plain Python value with NaN, inf and NaT as None, so the output is strict JSON"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if value is pd.NaT:
+        return None
+    return value
+
+def _json_rows(df):
+    return [{key: _json_value(value) for key, value in row.items()} for row in df.to_dict(orient="records")]
+
+def _count_rows(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray, list, tuple)):
+        return len(obj)
+    return None
+
+class _Frame:
+    __slots__ = ("peak", "base")
+
+    def __init__(self, base):
+        self.peak = base
+        self.base = base
+
+class Diagnostics:
+    """Bounded log of per-stage metrics, off unless enabled.
+
+    enabled, trace_memory and dump_frames are process-wide defaults;
+    use_flags() overrides them for the calling context only, so each
+    Streamlit session keeps its own switches.
+    """
+    def __init__(self, enabled=False, dump_frames=False, trace_memory=False, max_records=500):
+        self._defaults = {"enabled": enabled, "dump_frames": dump_frames, "trace_memory": trace_memory}
+        self._flags = contextvars.ContextVar(f"diagnostics_flags_{id(self)}", default=None)
+        self._records = deque(maxlen=max_records)
+        self._local = threading.local()
+        self._trace_lock = threading.Lock()
+        self._traced_blocks = 0
+        self._started_tracing = False
+
+    def _flag(self, name):
+        flags = self._flags.get()
+        return self._defaults[name] if flags is None else flags[name]
+
+    @property
+    def enabled(self):
+        return self._flag("enabled")
+
+    @enabled.setter
+    def enabled(self, value):
+        self._defaults["enabled"] = value
+
+    @property
+    def dump_frames(self):
+        return self._flag("dump_frames")
+
+    @dump_frames.setter
+    def dump_frames(self, value):
+        self._defaults["dump_frames"] = value
+
+    @property
+    def trace_memory(self):
+        return self._flag("trace_memory")
+
+    @trace_memory.setter
+    def trace_memory(self, value):
+        self._defaults["trace_memory"] = value
+
+    def use_flags(self, enabled=False, trace_memory=False, dump_frames=False):
+        """Switches for the current context (a Streamlit script run's thread) instead of the process defaults"""
+        self._flags.set({"enabled": enabled, "trace_memory": trace_memory, "dump_frames": dump_frames})
+
+    def record(self, stage, event, df=None, **fields):
+        if not self.enabled:
+            return
+        entry = {"time": pd.Timestamp.now(), "stage": stage, "event": event, **frame_metrics(df), **fields}
+        self._records.append(entry)
+        logger.debug(f"{stage} {event}: {entry}")
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _start_tracing(self):
+        with self._trace_lock:
+            if self._traced_blocks == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._traced_blocks += 1
+
+    def _stop_tracing(self):
+        """Stop tracemalloc once no traced block is left, unless someone else had started it"""
+        with self._trace_lock:
+            self._traced_blocks -= 1
+            if self._traced_blocks == 0 and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    @contextmanager
+    def profile(self, stage, rows=None, df=None):
+        """Time a block and record wall/CPU seconds, peak memory and rows/s; yields a dict for extra fields.
+
+        Peak memory comes from tracemalloc when trace_memory is on (Python and
+        NumPy allocations; noticeably slows allocation-heavy code), otherwise
+        only the process-wide max RSS is reported. Tracing runs only while a
+        traced block is open, so turning trace_memory off stops the overhead.
+        Nested blocks fold their peak into the enclosing one; concurrent
+        threads share tracemalloc's peak, so figures for parallel stages are
+        upper bounds.
+
+        CPU seconds are process-wide (time.process_time) on purpose: most
+        stages hand their work to BLAS, torch or a thread pool, which the
+        calling thread's own time would miss. The flip side is that another
+        stage or session running at the same time is counted as well.
+        """
+        if not self.enabled:
+            yield {}
+            return
+        tracing = self.trace_memory
+        if tracing:
+            self._start_tracing()
+        stack = self._stack()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            stack.append(_Frame(current))
+        extra = {}
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield extra
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak_mb = None
+            if tracing:
+                frame = stack.pop()
+                frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+                if stack:
+                    stack[-1].peak = max(stack[-1].peak, frame.peak)
+                peak_mb = round((frame.peak - frame.base) / 1e6, 3)
+                self._stop_tracing()
+            rows = extra.pop("rows", rows)
+            self.record(
+                stage, "profile", df,
+                rows_processed=rows,
+                seconds=round(wall, 4),
+                cpu_seconds=round(cpu, 4),
+                rows_per_sec=round(rows / wall, 1) if rows and wall > 0 else None,
+                peak_mb=peak_mb,
+                max_rss_mb=_max_rss_mb(),
+                **extra
+            )
+
+    def instrument(self, func):
+        """Decorator profiling every call; rows are taken from the first argument's length"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            first = args[0] if args else None
+            frame = first if isinstance(first, (pd.DataFrame, pd.Series)) else None
+            with self.profile(func.__name__, rows=_count_rows(first), df=frame) as extra:
+                result = func(*args, **kwargs)
+                if isinstance(result, (pd.DataFrame, pd.Series)):
+                    metrics = frame_metrics(result)
+                    extra["rows_out"] = metrics["rows"]
+                    extra["memory_out_mb"] = metrics["memory_mb"]
+            return result
+        return wrapper
+
+    def records(self):
+        return pd.DataFrame(list(self._records))
+
+    def summary(self):
+        """Per-stage totals: calls, wall/CPU seconds, rows, throughput and worst peak memory"""
+        records = self.records()
+        if records.empty or "seconds" not in records:
+            return pd.DataFrame(columns=["stage", "calls", "seconds", "cpu_seconds", "rows",
+                                         "rows_per_sec", "peak_mb", "max_rss_mb"])
+        profiled = records[records["event"] == "profile"].copy()
+        for column in ["rows_processed", "peak_mb", "max_rss_mb"]:
+            profiled[column] = pd.to_numeric(profiled.get(column), errors="coerce")
+        summary = profiled.groupby("stage", sort=False).agg(
+            calls=("seconds", "size"),
+            seconds=("seconds", "sum"),
+            cpu_seconds=("cpu_seconds", "sum"),
+            rows=("rows_processed", "sum"),
+            peak_mb=("peak_mb", "max"),
+            max_rss_mb=("max_rss_mb", "max")
+        ).reset_index()
+        summary["rows_per_sec"] = (summary["rows"] / summary["seconds"]).where(summary["seconds"] > 0)
+        summary = summary[["stage", "calls", "seconds", "cpu_seconds", "rows", "rows_per_sec", "peak_mb", "max_rss_mb"]]
+        return summary.sort_values("seconds", ascending=False, ignore_index=True).round(4)
+
+    def to_json(self):
+        return json.dumps({
+            "summary": _json_rows(self.summary()),
+            "records": _json_rows(self.records())
+        }, default=str, allow_nan=False, indent=2)
+
+    def to_prometheus(self, prefix="radar_stage"):
+        """Per-stage summary in the Prometheus text exposition format"""
+        metrics = [
+            ("calls", "counter", "Instrumented calls"),
+            ("seconds", "counter", "Wall-clock seconds spent in the stage"),
+            ("cpu_seconds", "counter", "Process-wide CPU seconds while the stage ran, worker threads included"),
+            ("rows", "counter", "Rows processed by the stage"),
+            ("rows_per_sec", "gauge", "Rows processed per wall-clock second"),
+            ("peak_mb", "gauge", "Largest traced allocation peak during one call, MB"),
+            ("max_rss_mb", "gauge", "Process max resident set size after the stage, MB")
+        ]
+        summary = self.summary()
+        lines = []
+        for column, kind, help_text in metrics:
+            name = f"{prefix}_{column}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for stage, value in zip(summary["stage"], summary[column]):
+                if pd.notna(value):
+                    lines.append(f'{name}{{stage="{stage}"}} {float(value)}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write to path as Prometheus text if it ends in .prom or .txt, JSON otherwise"""
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        with open(path, "w") as f:
+            f.write(text)
+
+    def clear(self):
+        self._records.clear()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""Temporal graph clustering, partitioned over time and run in parallel.
+
+Posts are sorted by time and cut into contiguous partitions. Each partition
+is widened with the ANN neighbors of its posts that fall within
+time_window_hours of it, so partitions overlap at their boundaries. Every
+partition is clustered independently, with HDBSCAN over a sparse temporal
+k-NN graph, in a process pool. A union-find pass then stitches the
+partition-local clusters into global ones: clusters sharing enough members,
+and clusters in neighbouring partitions whose centroids are close, are
+merged. Each post takes the label from the partition it belongs to.
+
+Only NumPy/SciPy/HDBSCAN live here, so spawned workers start quickly
+without importing the model stack. HDBSCAN itself is imported on first
+use, so importing this module for NS_PER_HOUR stays cheap.
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix, csgraph, coo_matrix
+
+logger = logging.getLogger(__name__)
+
+NS_PER_HOUR = 3.6e12
+GRAPH_MIN_DIST = 1e-8  # Keeps exact duplicates from vanishing as implicit sparse zeros
+
+def temporal_knn_graph(embeddings, timestamps, n_neighbors, temporal_weight, window_hours, block_size=256):
+    """Sparse k-NN graph of combined distances, holding only pairs inside window_hours"""
+    n = len(embeddings)
+    k = min(n_neighbors, n - 1)
+    if k <= 0:
+        return csr_matrix((n, n))
+    # Sort on timestamp so every post's window is one contiguous slice
+    order = np.argsort(timestamps, kind="stable")
+    hours = (np.asarray(timestamps, dtype=np.int64)[order] - int(np.min(timestamps))) / NS_PER_HOUR
+    emb = np.asarray(embeddings, dtype=np.float32)[order]
+    sq_norms = np.einsum("ij,ij->i", emb, emb)
+    lo = np.searchsorted(hours, hours - window_hours, side="right")
+    hi = np.searchsorted(hours, hours + window_hours, side="left")
+    rows, cols, vals = [], [], []
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        c_lo, c_hi = lo[start], hi[stop - 1]
+        sq = sq_norms[start:stop, None] + sq_norms[None, c_lo:c_hi] - 2 * emb[start:stop] @ emb[c_lo:c_hi].T
+        semantic = np.sqrt(np.maximum(sq, 0))
+        time_diff = np.abs(hours[start:stop, None] - hours[None, c_lo:c_hi])
+        combined = temporal_weight * time_diff + (1 - temporal_weight) * semantic
+        combined[time_diff >= window_hours] = np.inf
+        local = np.arange(start, stop)
+        combined[local - start, local - c_lo] = np.inf
+        kk = min(k, c_hi - c_lo - 1)
+        if kk <= 0:
+            continue
+        nearest = np.argpartition(combined, kk - 1, axis=1)[:, :kk]
+        dists = np.take_along_axis(combined, nearest, axis=1)
+        keep = np.isfinite(dists)
+        rows.append(np.repeat(local, kk)[keep.ravel()])
+        cols.append((nearest + c_lo)[keep])
+        vals.append(dists[keep])
+    if not rows:
+        return csr_matrix((n, n))
+    rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+    graph = csr_matrix((np.maximum(vals, GRAPH_MIN_DIST), (order[rows], order[cols])), shape=(n, n))
+    # k-NN is asymmetric; keep an edge if either endpoint selected it
+    return graph.maximum(graph.T).tocsr()
+
+def bridge_components(graph):
+    """Chain disconnected components with one heavy edge each so HDBSCAN sees a single graph"""
+    n_components, labels = csgraph.connected_components(graph, directed=False)
+    bridge = float(graph.data.max()) * 2 + 1 if graph.nnz else 1.0
+    if n_components <= 1:
+        return graph, bridge
+    _, reps = np.unique(labels, return_index=True)
+    links = csr_matrix((np.full(len(reps) - 1, bridge), (reps[:-1], reps[1:])), shape=graph.shape)
+    return (graph + links + links.T).tocsr(), bridge
+
+def cluster_graph(embeddings, timestamps, params, n_jobs=4):
+    """HDBSCAN over the sparse temporal graph of one candidate set; -1 marks noise.
+
+    params holds the bertrend settings graph_neighbors, temporal_weight,
+    time_window_hours, min_cluster_size and cluster_threshold.
+    """
+    from hdbscan import HDBSCAN
+
+    if len(embeddings) < params["min_cluster_size"]:
+        return np.full(len(embeddings), -1, dtype=int)
+    graph, bridge = bridge_components(temporal_knn_graph(
+        embeddings, timestamps, params["graph_neighbors"], params["temporal_weight"], params["time_window_hours"]
+    ))
+    clusterer = HDBSCAN(
+        min_cluster_size=params["min_cluster_size"],
+        metric="precomputed",
+        cluster_selection_epsilon=params["cluster_threshold"],
+        core_dist_n_jobs=n_jobs,
+        max_dist=bridge  # Reachability for posts with too few in-window neighbors
+    )
+    return clusterer.fit_predict(graph)
+
+def time_partitions(timestamps, neighbors, partition_size, window_hours):
+    """(cores, members) per partition: cores tile the posts in time order, members add in-window ANN neighbors"""
+    order = np.argsort(timestamps, kind="stable")
+    window_ns = window_hours * NS_PER_HOUR
+    cores, members = [], []
+    for start in range(0, len(order), partition_size):
+        core = order[start:start + partition_size]
+        lo, hi = timestamps[core[0]] - window_ns, timestamps[core[-1]] + window_ns
+        candidates = np.unique(np.concatenate([core, neighbors[core].ravel()]))
+        candidates = candidates[(timestamps[candidates] >= lo) & (timestamps[candidates] <= hi)]
+        cores.append(core)
+        members.append(candidates)
+    return cores, members
+
+def _init_worker():
+    from threadpoolctl import threadpool_limits
+    # One BLAS/OpenMP thread per process: the pool already uses every core
+    threadpool_limits(1)
+
+def _cluster_task(task):
+    embeddings, timestamps, params = task
+    return cluster_graph(embeddings, timestamps, params, n_jobs=1)
+
+def cluster_partitions(embeddings, timestamps, members, params, workers=None, min_rows=5000):
+    """Labels for every partition, in order; fanned out over a process pool for large inputs"""
+    tasks = [(embeddings[m], timestamps[m], params) for m in members]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) < 2 or len(embeddings) < min_rows:
+        return [cluster_graph(e, t, p) for e, t, p in tasks]
+    logger.info(f"Clustering {len(tasks)} partitions on {min(workers, len(tasks))} processes")
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(tasks)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker
+    ) as pool:
+        return list(pool.map(_cluster_task, tasks))
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # Lower id wins, so the earliest partition's cluster names the merged one
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+    def roots(self):
+        return np.array([self.find(x) for x in range(len(self.parent))], dtype=np.int64)
+
+def stitch_partitions(n, embeddings, timestamps, cores, members, labels, min_overlap=0.3, merge_scale=1.0):
+    """Global cluster id per post (-1 for noise) from overlapping partition-local labels"""
+    offsets = np.cumsum([0] + [int(l.max()) + 1 if len(l) and l.max() >= 0 else 0 for l in labels])
+    n_local = int(offsets[-1])
+    if n_local == 0:
+        return np.full(n, -1, dtype=int)
+    posts = np.concatenate([m[l >= 0] for m, l in zip(members, labels)])
+    local = np.concatenate([l[l >= 0] + offset for l, offset in zip(labels, offsets[:-1])])
+    sizes = np.bincount(local, minlength=n_local)
+    uf = UnionFind(n_local)
+
+    # Shared members: consecutive labels of the same post link its clusters
+    by_post = np.lexsort((local, posts))
+    posts, local = posts[by_post], local[by_post]
+    same = posts[1:] == posts[:-1]
+    if same.any():
+        pairs, shared = np.unique(np.stack([local[:-1][same], local[1:][same]], axis=1), axis=0, return_counts=True)
+        smaller = np.minimum(sizes[pairs[:, 0]], sizes[pairs[:, 1]])
+        for a, b in pairs[shared >= min_overlap * smaller]:
+            uf.union(a, b)
+
+    # Close centroids in neighbouring partitions: a narrative split where the overlap was thin
+    membership = coo_matrix((np.ones(len(posts)), (local, posts)), shape=(n_local, n)).tocsr()
+    emb = np.asarray(embeddings, dtype=np.float64)
+    centroids = (membership @ emb) / np.maximum(sizes, 1)[:, None]
+    radii = np.zeros(n_local)
+    np.add.at(radii, local, np.linalg.norm(emb[posts] - centroids[local], axis=1))
+    radii /= np.maximum(sizes, 1)
+    for p in range(len(labels) - 1):
+        a = np.arange(offsets[p], offsets[p + 1])
+        b = np.arange(offsets[p + 1], offsets[p + 2])
+        if len(a) == 0 or len(b) == 0:
+            continue
+        dist = np.linalg.norm(centroids[a][:, None] - centroids[b][None, :], axis=2)
+        limit = merge_scale * np.maximum(radii[a][:, None], radii[b][None, :])
+        for i, j in zip(*np.nonzero(dist <= limit)):
+            uf.union(a[i], b[j])
+
+    # Each post takes its core partition's label; posts that were noise there take any other label they got
+    assigned = np.full(n, -1, dtype=np.int64)
+    assigned[posts[::-1]] = local[::-1]
+    for core, member, label, offset in zip(cores, members, labels, offsets[:-1]):
+        own = label[np.searchsorted(member, core)]  # members are sorted and contain the core
+        assigned[core[own >= 0]] = own[own >= 0] + offset
+    roots = uf.roots()
+    clusters = np.where(assigned >= 0, roots[np.maximum(assigned, 0)], -1)
+
+    # Dense ids numbered by each cluster's first post in time, so they are stable for a given input
+    in_time = np.argsort(timestamps, kind="stable")
+    in_time = in_time[clusters[in_time] >= 0]
+    found, first = np.unique(clusters[in_time], return_index=True)
+    mapping = np.full(n_local, -1, dtype=np.int64)
+    mapping[found[np.argsort(first)]] = np.arange(len(found))
+    return np.where(clusters >= 0, mapping[np.maximum(clusters, 0)], -1).astype(int)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Conditional HTTP fetching with an on-disk cache.
+
+Bodies are stored under cache_dir with their ETag/Last-Modified, revalidated
+at most once per max_age seconds, and served from disk when the remote is
+unreachable, so dashboard reruns are instant and work offline.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+class HTTPCache:
+    def __init__(self, cache_dir, timeout=10, max_age=300, session=None):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.max_age = max_age
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=2))
+            session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=2))
+        self.session = session
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.body"), os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_meta(self, meta_path):
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _write_atomic(self, path, data):
+        """Write bytes aside and move them into place; each writer has its own temp file, so
+        concurrent fetches of one URL never interleave. Temp names do not start with a cache key,
+        so _clear_derived leaves them alone."""
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _write_meta(self, meta_path, meta):
+        self._write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def derived_path(self, url, suffix):
+        """Location for an artifact computed from the body; it is deleted whenever the body changes"""
+        body_path, _ = self._paths(url)
+        return f"{body_path[:-len('.body')]}.{suffix}"
+
+    def _clear_derived(self, url):
+        prefix = os.path.basename(self._paths(url)[0])[:-len(".body")]
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix + ".") and not name.endswith((".body", ".json")):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def fetch(self, url):
+        """Path of an up-to-date local copy of url; raises only if there is neither network nor cache"""
+        body_path, meta_path = self._paths(url)
+        meta = self._read_meta(meta_path)
+        cached = os.path.exists(body_path)
+        if cached and time.time() - meta.get("checked", 0) < self.max_age:
+            return body_path
+        headers = {}
+        if cached and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if cached and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            if cached:
+                logger.warning(f"Serving cached copy of {url}: {e}")
+                return body_path
+            raise
+        if response.status_code == 304 and cached:
+            meta["checked"] = time.time()
+            self._write_meta(meta_path, meta)
+            return body_path
+        if response.status_code != 200:
+            if cached:
+                logger.warning(f"Serving cached copy of {url}: HTTP {response.status_code}")
+                return body_path
+            response.raise_for_status()
+            raise requests.HTTPError(f"Unexpected status {response.status_code} for {url}")
+        self._write_atomic(body_path, response.content)
+        self._clear_derived(url)
+        self._write_meta(meta_path, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "checked": time.time()
+        })
+        return body_path
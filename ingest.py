@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Streaming ingest of raw social media exports.
+
+The encoding and delimiter are sniffed once from the first bytes, then the
+file is parsed in chunks keeping only the columns the pipeline uses, with
+compact dtypes, so multi-GB scrape exports fit on small dashboard pods.
+Parquet uploads are read batch by batch with column pruning.
+"""
+import codecs
+import logging
+
+import pandas as pd
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+logger = logging.getLogger(__name__)
+
+RAW_COLUMNS = ['text', 'Timestamp', 'URL', 'Source']
+DELIMITERS = [',', '\t', ';', '|']
+
+def sniff_csv(buffer, sample_size=65536):
+    """Return (encoding, delimiter) from the head of a binary buffer, leaving it rewound"""
+    head = buffer.read(sample_size)
+    buffer.seek(0)
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+    elif head.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
+        try:
+            head.decode('utf-8')
+            encoding = 'utf-8'
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut off by the sample boundary is still UTF-8
+            encoding = 'utf-8' if e.start >= len(head) - 3 else 'latin-1'
+    header = head.decode(encoding, errors='ignore').lstrip('\ufeff').splitlines()[0] if head else ''
+    delimiter = max(DELIMITERS, key=header.count)
+    return encoding, delimiter
+
+def _compact(chunk):
+    """Coerce one chunk to the pipeline schema with small dtypes"""
+    # Offsets are folded into naive UTC, so tz-aware and mixed-offset exports parse instead of raising.
+    # Exports mix formats row to row, so each value is parsed on its own rather than by a format
+    # inferred from the first one. Nanosecond datetimes: int64 underneath, and the unit the
+    # pipeline's time arithmetic assumes
+    timestamps = pd.to_datetime(chunk['Timestamp'], errors='coerce', utc=True, format='mixed').dt.tz_convert(None)
+    chunk['Timestamp'] = timestamps.astype('datetime64[ns]')
+    chunk['Source'] = chunk['Source'].astype('category')
+    return chunk
+
+def _check_columns(columns):
+    missing = set(RAW_COLUMNS) - set(columns)
+    if missing:
+        raise ValueError(f"Missing required columns: {sorted(missing)}. Found: {list(columns)}")
+
+def iter_raw_batches(file, chunksize=50000):
+    """Yield DataFrames of at most chunksize rows with only the text/Timestamp/URL/Source columns"""
+    name = getattr(file, 'name', str(file))
+    if name.endswith('.parquet'):
+        # Column pruning happens in the Parquet reader; only these four columns are decoded
+        parquet = pq.ParquetFile(file)
+        _check_columns(parquet.schema_arrow.names)
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=RAW_COLUMNS):
+            yield _compact(batch.to_pandas())
+        return
+    if name.endswith('.xlsx'):
+        # openpyxl cannot stream, but only the needed columns are materialized
+        df = pd.read_excel(file, usecols=lambda c: c in RAW_COLUMNS)
+        _check_columns(df.columns)
+        for start in range(0, len(df), chunksize):
+            yield _compact(df.iloc[start:start + chunksize].copy())
+        return
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            yield from _iter_csv(f, name, chunksize)
+    else:
+        yield from _iter_csv(file, name, chunksize)
+
+def _iter_csv(buffer, name, chunksize):
+    encoding, delimiter = sniff_csv(buffer)
+    logger.info(f"Reading {name} as {encoding} with delimiter {delimiter!r}")
+    reader = pd.read_csv(
+        buffer,
+        encoding=encoding,
+        sep=delimiter,
+        usecols=lambda c: c in RAW_COLUMNS,
+        dtype={'text': 'object', 'URL': 'object', 'Source': 'object'},
+        chunksize=chunksize
+    )
+    with reader:
+        for chunk in reader:
+            _check_columns(chunk.columns)
+            yield _compact(chunk)
+
+def write_raw_parquet(df, path):
+    """Persist posts in the compact schema so later runs skip CSV parsing entirely"""
+    df[RAW_COLUMNS].to_parquet(path, index=False)
+
+def load_raw_posts(file, chunksize=50000):
+    """Whole upload as one compact DataFrame, assembled chunk by chunk"""
+    chunks = list(iter_raw_batches(file, chunksize))
+    if not chunks:
+        return pd.DataFrame({c: pd.Series(dtype='object') for c in RAW_COLUMNS})
+    # Chunks carry their own Source categories; merge them without falling back to object
+    sources = union_categoricals([chunk['Source'] for chunk in chunks])
+    df = pd.concat([chunk.drop(columns='Source') for chunk in chunks], ignore_index=True)
+    df['Source'] = sources
+    return df[RAW_COLUMNS]
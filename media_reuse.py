@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Reused-media detection over the images attached to posts.
+
+Every image is decoded once, in a process pool, into a 64-bit pHash, a
+64-bit dHash and a small grayscale thumbnail. Candidate pairs come from a
+multi-index Hamming structure over the pHashes: the hash is split into
+blocks, and by the pigeonhole principle two hashes within max_distance
+bits agree on at least one block up to a small per-block radius, so only
+hashes sharing a (near-)equal block are ever compared. Candidates that
+also pass the dHash check are confirmed with SSIM on their thumbnails and
+joined into reuse groups with connected components.
+
+Images are read from local files listed in a manifest with one row per
+(URL, Media Path), so groups attach to posts, and through them to
+clusters, by URL.
+"""
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+from scipy.fft import dctn
+from scipy.sparse import coo_matrix, csgraph
+
+logger = logging.getLogger(__name__)
+
+MEDIA_COLUMNS = ['URL', 'Media Path']
+HASH_BITS = 64
+
+def _pack_bits(bits):
+    """64 booleans, most significant first, as one uint64"""
+    return np.packbits(bits.ravel()).view('>u8')[0].astype(np.uint64)
+
+def phash(gray32):
+    """DCT hash of a 32x32 grayscale image: low 8x8 frequencies against their median, DC excluded"""
+    low = dctn(np.asarray(gray32, dtype=np.float64), norm="ortho")[:8, :8].ravel()
+    return _pack_bits(low > np.median(low[1:]))
+
+def dhash(gray9x8):
+    """Gradient hash of a 9-wide, 8-high grayscale image: is each pixel brighter than its left neighbour"""
+    gray = np.asarray(gray9x8, dtype=np.int16)
+    return _pack_bits(gray[:, 1:] > gray[:, :-1])
+
+def hamming(a, b):
+    """Bitwise distance between uint64 hash arrays, elementwise"""
+    x = np.atleast_1d(np.bitwise_xor(a, b)).astype(np.uint64)
+    return np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+def hash_image(path, thumb_size=64):
+    """(phash, dhash, thumbnail) for one image file, or None if it cannot be decoded"""
+    try:
+        with Image.open(path) as image:
+            # JPEGs are decoded straight at a reduced scale, still no smaller than the thumbnail
+            image.draft("L", (thumb_size, thumb_size))
+            gray = image.convert("L")
+            return (
+                phash(np.asarray(gray.resize((32, 32), Image.LANCZOS))),
+                dhash(np.asarray(gray.resize((9, 8), Image.LANCZOS))),
+                np.asarray(gray.resize((thumb_size, thumb_size), Image.LANCZOS), dtype=np.uint8)
+            )
+    except (OSError, ValueError) as e:
+        logger.warning(f"Skipping unreadable image {path}: {e}")
+        return None
+
+def _hash_chunk(task):
+    paths, thumb_size = task
+    return [hash_image(path, thumb_size) for path in paths]
+
+def compute_hashes(paths, thumb_size=64, workers=None, chunk_size=256, min_rows=500):
+    """(phashes, dhashes, thumbnails, ok) for every path; decoding is fanned out over a process pool"""
+    tasks = [(paths[start:start + chunk_size], thumb_size) for start in range(0, len(paths), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) < 2 or len(paths) < min_rows:
+        results = [r for task in tasks for r in _hash_chunk(task)]
+    else:
+        logger.info(f"Hashing {len(paths)} images on {min(workers, len(tasks))} processes")
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = [r for chunk in pool.map(_hash_chunk, tasks) for r in chunk]
+    n = len(paths)
+    phashes, dhashes = np.zeros(n, dtype=np.uint64), np.zeros(n, dtype=np.uint64)
+    thumbs = np.zeros((n, thumb_size, thumb_size), dtype=np.uint8)
+    ok = np.zeros(n, dtype=bool)
+    for i, result in enumerate(results):
+        if result is not None:
+            phashes[i], dhashes[i], thumbs[i] = result
+            ok[i] = True
+    return phashes, dhashes, thumbs, ok
+
+class MultiIndexHamming:
+    """Sub-linear Hamming range search over 64-bit hashes by exact lookup of flipped hash blocks"""
+    def __init__(self, hashes, max_distance, blocks=4):
+        if HASH_BITS % blocks:
+            raise ValueError(f"blocks ({blocks}) must divide {HASH_BITS}")
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.max_distance = max_distance
+        self.bits = HASH_BITS // blocks
+        # Within max_distance overall means within this radius on at least one of the blocks
+        radius = math.ceil((max_distance + 1) / blocks) - 1
+        flips = [0]
+        for r in range(1, radius + 1):
+            flips += [sum(1 << b for b in combo) for combo in combinations(range(self.bits), r)]
+        self.flips = np.array(flips, dtype=np.uint64)
+        mask = np.uint64((1 << self.bits) - 1)
+        self.block_values, self.orders, self.sorted_values = [], [], []
+        for block in range(blocks):
+            values = (self.hashes >> np.uint64(block * self.bits)) & mask
+            order = np.argsort(values, kind="stable")
+            self.block_values.append(values)
+            self.orders.append(order)
+            self.sorted_values.append(values[order])
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _candidates(self, order, sorted_values, probes):
+        """(probe row, indexed item) for every probe matching an indexed block value exactly"""
+        left = np.searchsorted(sorted_values, probes, side="left")
+        counts = np.searchsorted(sorted_values, probes, side="right") - left
+        rows = np.repeat(np.arange(len(probes)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return rows, order[np.repeat(left, counts) + offsets]
+
+    def query(self, h):
+        """Indexed items within max_distance of hash h, nearest first"""
+        mask = np.uint64((1 << self.bits) - 1)
+        found = []
+        for block, (order, sorted_values) in enumerate(zip(self.orders, self.sorted_values)):
+            probes = ((np.uint64(h) >> np.uint64(block * self.bits)) & mask) ^ self.flips
+            found.append(self._candidates(order, sorted_values, probes)[1])
+        found = np.unique(np.concatenate(found))
+        distances = hamming(self.hashes[found], np.uint64(h))
+        keep = distances <= self.max_distance
+        order = np.argsort(distances[keep], kind="stable")
+        return found[keep][order]
+
+    def pairs(self):
+        """(i, j) with i < j for every indexed pair within max_distance, and their distances"""
+        sources, targets = [], []
+        for values, order, sorted_values in zip(self.block_values, self.orders, self.sorted_values):
+            for flip in self.flips:
+                rows, items = self._candidates(order, sorted_values, values ^ flip)
+                keep = rows < items
+                sources.append(rows[keep])
+                targets.append(items[keep])
+        if not sources:
+            return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64)
+        pairs = np.unique(np.stack([np.concatenate(sources), np.concatenate(targets)], axis=1), axis=0)
+        distances = hamming(self.hashes[pairs[:, 0]], self.hashes[pairs[:, 1]])
+        keep = distances <= self.max_distance
+        return pairs[keep], distances[keep]
+
+def ssim_scores(thumbs, pairs):
+    """SSIM of each thumbnail pair; the only per-pair image comparison, run on candidates alone"""
+    from skimage.metrics import structural_similarity
+    return np.array([structural_similarity(thumbs[i], thumbs[j], data_range=255) for i, j in pairs])
+
+def reuse_groups(paths, max_distance=6, dhash_distance=12, ssim_threshold=0.85, thumb_size=64, workers=None,
+                 blocks=4):
+    """Reuse group per image (-1 when it is not reused or unreadable)"""
+    n = len(paths)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    phashes, dhashes, thumbs, ok = compute_hashes(list(paths), thumb_size=thumb_size, workers=workers)
+    readable = np.flatnonzero(ok)
+    # Identical pHashes collapse to one representative before indexing; copies are checked against it
+    unique_hashes, first, inverse = np.unique(phashes[readable], return_index=True, return_inverse=True)
+    reps = readable[first]
+    copies = np.stack([readable, reps[inverse]], axis=1)
+    copies = copies[copies[:, 0] != copies[:, 1]]
+    index = MultiIndexHamming(unique_hashes, max_distance, blocks=blocks)
+    near, _ = index.pairs()
+    near = reps[near] if len(near) else near
+    near = near[hamming(dhashes[near[:, 0]], dhashes[near[:, 1]]) <= dhash_distance] if len(near) else near
+    candidates = np.concatenate([copies, near]).astype(np.int64)
+    logger.info(f"Media: {len(readable)} of {n} images hashed, {len(candidates)} candidate pairs for SSIM")
+    confirmed = candidates[ssim_scores(thumbs, candidates) >= ssim_threshold] if len(candidates) else candidates
+    graph = coo_matrix((np.ones(len(confirmed), dtype=np.int8), (confirmed[:, 0], confirmed[:, 1])), shape=(n, n))
+    _, labels = csgraph.connected_components(graph, directed=False)
+    sizes = np.bincount(labels)
+    groups = np.where(sizes[labels] > 1, labels, -1)
+    logger.info(f"Media: {int((groups >= 0).sum())} images in {len(np.unique(groups[groups >= 0]))} reuse groups")
+    return groups
+
+def load_manifest(path):
+    """URL -> local image rows from a CSV or Parquet manifest; relative paths are resolved against its folder"""
+    manifest = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+    missing = set(MEDIA_COLUMNS) - set(manifest.columns)
+    if missing:
+        raise ValueError(f"Media manifest missing columns: {sorted(missing)}. Found: {list(manifest.columns)}")
+    manifest = manifest[MEDIA_COLUMNS].dropna().drop_duplicates().reset_index(drop=True)
+    base = os.path.dirname(os.path.abspath(path))
+    manifest['Media Path'] = [p if os.path.isabs(p) else os.path.join(base, p) for p in manifest['Media Path']]
+    return manifest
+
+def media_groups(manifest, **settings):
+    """Manifest rows with a 'Media Group' column; each distinct file is hashed once however many posts use it"""
+    files = manifest['Media Path'].unique()
+    groups = pd.Series(reuse_groups(files, **settings), index=files)
+    return manifest.assign(**{'Media Group': manifest['Media Path'].map(groups).to_numpy()})
+
+def media_stats(df, media):
+    """Per-cluster reused-media signals, joining posts to their images by URL.
+
+    reused_ratio: share of the cluster's posts carrying an image reused elsewhere.
+    media_groups: distinct reuse groups among them.
+    max_sources_per_image: most distinct Sources posting one (near-)identical image.
+    cross_cluster_groups: of those groups, how many also appear in other clusters.
+    top_media: a file of the group with the most sources.
+    """
+    if media is None or media.empty or df.empty:
+        return {}
+    reused = media[media['Media Group'] >= 0]
+    posts = df[['Cluster', 'URL', 'Source']].merge(reused[['URL', 'Media Group', 'Media Path']], on='URL')
+    if posts.empty:
+        return {}
+    clusters_per_group = posts.groupby('Media Group')['Cluster'].nunique()
+    per_group = posts.groupby(['Cluster', 'Media Group']).agg(
+        sources=('Source', 'nunique'),
+        path=('Media Path', 'first')
+    ).reset_index()
+    per_group['cross_cluster'] = per_group['Media Group'].map(clusters_per_group) > 1
+    per_group = per_group.sort_values(['Cluster', 'sources'], ascending=[True, False])
+    top = per_group.groupby('Cluster').head(1).set_index('Cluster')
+    summary = per_group.groupby('Cluster').agg(media_groups=('sources', 'size'),
+                                               cross_cluster_groups=('cross_cluster', 'sum'))
+    totals = df.groupby('Cluster')['URL'].nunique()
+    reused_posts = posts.groupby('Cluster')['URL'].nunique()
+    return {
+        cluster: {
+            'reused_ratio': float(reused_posts[cluster] / totals[cluster]),
+            'media_groups': int(summary.at[cluster, 'media_groups']),
+            'max_sources_per_image': int(top.at[cluster, 'sources']),
+            'cross_cluster_groups': int(summary.at[cluster, 'cross_cluster_groups']),
+            'top_media': top.at[cluster, 'path']
+        }
+        for cluster in top.index
+    }
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Near-duplicate detection over the whole corpus with MinHash LSH.
+
+Posts are reduced to hashed word shingles, summarized by MinHash signatures
+and bucketed band by band, so only posts that collide in some band are
+compared. Candidate pairs are confirmed by their estimated Jaccard
+similarity and joined into groups with connected components. Cost is close
+to linear in the number of posts, which makes copy-paste campaigns across
+thousands of accounts visible without pairwise comparison.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix, csgraph
+from sklearn.feature_extraction.text import HashingVectorizer
+
+logger = logging.getLogger(__name__)
+
+MERSENNE_PRIME = np.uint64(4294967311)  # First prime above 2**32: a * x + b stays below 2**64
+SHINGLE_SPACE = 2 ** 31
+EMPTY = np.iinfo(np.uint64).max
+ALL_PAIRS_BUCKET = 32  # Buckets up to this size compare every pair; larger ones chain neighbours in signature order
+
+def shingle_matrix(texts, shingle_size=3):
+    """Binary CSR of hashed word shingles; texts shorter than shingle_size fall back to shorter n-grams"""
+    texts = ["" if not isinstance(t, str) else t for t in texts]
+    common = dict(n_features=SHINGLE_SPACE, alternate_sign=False, norm=None, binary=True, lowercase=True,
+                  token_pattern=r"(?u)\b\w+\b|[#@]\w+")
+    shingles = HashingVectorizer(ngram_range=(shingle_size, shingle_size), **common).transform(texts)
+    short = shingles.getnnz(axis=1) == 0
+    if short.any() and shingle_size > 1:
+        fallback = HashingVectorizer(ngram_range=(1, shingle_size - 1), **common).transform(
+            [t if is_short else "" for t, is_short in zip(texts, short)]
+        )
+        shingles = (shingles + fallback).tocsr()
+        shingles.data[:] = 1
+    return shingles
+
+def minhash_signatures(shingles, num_perm=64, seed=0):
+    """num_perm universal-hash minima per row; rows without shingles are all EMPTY"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+    n = shingles.shape[0]
+    signatures = np.full((n, num_perm), EMPTY, dtype=np.uint64)
+    nonempty = np.flatnonzero(np.diff(shingles.indptr) > 0)
+    if len(nonempty) == 0:
+        return signatures
+    ids = shingles.indices.astype(np.uint64)
+    starts = shingles.indptr[nonempty]
+    for p in range(num_perm):
+        hashed = (a[p] * ids + b[p]) % MERSENNE_PRIME
+        signatures[nonempty, p] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+def bucket_pairs(members, bucket, rank, all_pairs_bucket=ALL_PAIRS_BUCKET):
+    """Candidate pairs within each LSH bucket.
+
+    Every pair in buckets of up to all_pairs_bucket members; in larger
+    buckets, each member with the next one in signature order (rank), so
+    similar signatures sit side by side and the cost stays linear.
+    """
+    order = np.lexsort((rank, bucket))
+    bucket, members = bucket[order], members[order]
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    sizes = np.diff(np.r_[starts, len(bucket)])
+    shared = np.repeat(sizes, sizes) > 1
+    bucket, members, size = bucket[shared], members[shared], np.repeat(sizes, sizes)[shared]
+    sources, targets = [], []
+    for step in range(1, all_pairs_bucket):
+        left = np.arange(len(bucket) - step)
+        same = bucket[left] == bucket[left + step]
+        if step > 1:
+            same &= size[left] <= all_pairs_bucket
+        if not same.any():
+            break
+        sources.append(members[left[same]])
+        targets.append(members[left[same] + step])
+    if not sources:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(sources), np.concatenate(targets)
+
+def near_duplicate_groups(texts, threshold=0.8, num_perm=64, bands=8, shingle_size=3, seed=0):
+    """Group id per text (-1 when it has no near duplicate), from banded LSH plus signature verification"""
+    if num_perm % bands:
+        raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+    n = len(texts)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    signatures = minhash_signatures(shingle_matrix(texts, shingle_size), num_perm, seed)
+    valid = signatures[:, 0] != EMPTY
+    members = np.flatnonzero(valid)
+    rows = num_perm // bands
+
+    def row_keys(block):
+        """Lexicographic rank of each row of a signature block"""
+        block = np.ascontiguousarray(block)
+        return np.unique(block.view(np.dtype((np.void, block.dtype.itemsize * block.shape[1]))).ravel(),
+                         return_inverse=True)[1].ravel()
+
+    # Members are verified against each other, not only against one leader, which would miss pairs that
+    # both pass the threshold while the leader is further from each of them
+    rank = row_keys(signatures[valid])
+    sources, targets = [], []
+    for band in range(bands):
+        bucket = row_keys(signatures[valid, band * rows:(band + 1) * rows])
+        band_sources, band_targets = bucket_pairs(members, bucket, rank)
+        sources.append(band_sources)
+        targets.append(band_targets)
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    if len(sources):
+        pairs = np.unique(np.sort(np.stack([sources, targets], axis=1), axis=1), axis=0)
+        sources, targets = pairs[:, 0], pairs[:, 1]
+        # Estimated Jaccard = share of agreeing signature slots, checked in blocks to bound memory
+        agree = np.concatenate([
+            (signatures[sources[i:i + 100000]] == signatures[targets[i:i + 100000]]).mean(axis=1)
+            for i in range(0, len(sources), 100000)
+        ])
+        confirmed = agree >= threshold
+        sources, targets = sources[confirmed], targets[confirmed]
+    graph = coo_matrix((np.ones(len(sources), dtype=np.int8), (sources, targets)), shape=(n, n))
+    _, labels = csgraph.connected_components(graph, directed=False)
+    sizes = np.bincount(labels)
+    groups = np.where(sizes[labels] > 1, labels, -1)
+    logger.info(f"Near duplicates: {int((groups >= 0).sum())} of {n} posts in {len(np.unique(groups[groups >= 0]))} groups")
+    return groups
+
+def duplicate_stats(df, group_column='Duplicate Group'):
+    """Per-cluster coordination signals from near-duplicate groups.
+
+    duplicate_ratio: share of the cluster's posts that have a near duplicate.
+    duplicate_groups: distinct near-duplicate groups among them.
+    max_sources_per_text: most distinct Sources posting one (near-)identical text.
+    largest_group: most posts sharing one text.
+    time_spread_hours: first-to-last post of the group with the most sources.
+    top_text: a sample of that group's text.
+    """
+    if group_column not in df.columns or df.empty:
+        return {}
+    duplicated = df[df[group_column] >= 0]
+    per_group = duplicated.groupby(['Cluster', group_column]).agg(
+        posts=('text', 'size'),
+        sources=('Source', 'nunique'),
+        first=('Timestamp', 'min'),
+        last=('Timestamp', 'max'),
+        text=('text', 'first')
+    ).reset_index()
+    per_group = per_group.sort_values(['Cluster', 'sources', 'posts'], ascending=[True, False, False])
+    top = per_group.groupby('Cluster').head(1).set_index('Cluster')
+    summary = per_group.groupby('Cluster').agg(duplicate_groups=('posts', 'size'), largest_group=('posts', 'max'))
+    totals = df.groupby('Cluster').size()
+    duplicated_posts = duplicated.groupby('Cluster').size().reindex(totals.index, fill_value=0)
+    stats = {}
+    for cluster, total in totals.items():
+        entry = {
+            'duplicate_ratio': float(duplicated_posts[cluster] / total),
+            'duplicate_groups': 0,
+            'max_sources_per_text': 0,
+            'largest_group': 0,
+            'time_spread_hours': 0.0,
+            'top_text': None
+        }
+        if cluster in top.index:
+            entry.update(
+                duplicate_groups=int(summary.at[cluster, 'duplicate_groups']),
+                max_sources_per_text=int(top.at[cluster, 'sources']),
+                largest_group=int(summary.at[cluster, 'largest_group']),
+                time_spread_hours=float((top.at[cluster, 'last'] - top.at[cluster, 'first']) / pd.Timedelta(hours=1)),
+                top_text=top.at[cluster, 'text']
+            )
+        stats[cluster] = entry
+    return stats
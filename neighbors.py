@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""Nearest-neighbor search backends for bertrend_analysis.
+
+Every backend answers batched queries by item id and returns
+(indices, distances) arrays of shape (n_queries, k), nearest first, with the
+queried item itself included like annoy's get_nns_by_item.
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import annoy
+
+logger = logging.getLogger(__name__)
+
+def _query_threads(n_threads):
+    return n_threads or os.cpu_count() or 1
+
+class ExactNeighborIndex:
+    """Brute-force euclidean search through BLAS matrix products; exact and fast for small N"""
+    name = "exact"
+
+    def __init__(self, vectors, n_threads=None, block_size=256):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        self.n_threads = _query_threads(n_threads)
+        self.block_size = block_size
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _query_block(self, items, k):
+        sq = self.sq_norms[items, None] + self.sq_norms[None, :] - 2 * self.vectors[items] @ self.vectors.T
+        sq[np.arange(len(items)), items] = 0  # Rounding must not push an item behind its own neighbors
+        nearest = np.argpartition(sq, k - 1, axis=1)[:, :k]
+        dists = np.take_along_axis(sq, nearest, axis=1)
+        order = np.argsort(dists, axis=1, kind="stable")
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        return nearest, np.sqrt(np.maximum(np.take_along_axis(dists, order, axis=1), 0))
+
+    def query_items(self, items, k):
+        items = np.asarray(items, dtype=np.int64)
+        k = min(k, len(self))
+        blocks = [items[i:i + self.block_size] for i in range(0, len(items), self.block_size)]
+        # NumPy releases the GIL inside BLAS, so threads overlap the matrix products
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            results = list(pool.map(lambda block: self._query_block(block, k), blocks))
+        if not results:
+            return np.zeros((0, k), dtype=np.int64), np.zeros((0, k), dtype=np.float32)
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+    def save(self, path):
+        np.save(path, self.vectors)
+
+    @classmethod
+    def load(cls, path, n_threads=None):
+        return cls(np.load(path, mmap_mode="r"), n_threads=n_threads)
+
+class AnnoyNeighborIndex:
+    """Random-projection forest from annoy; built on disk and memory-mapped when a path is given"""
+    name = "annoy"
+
+    def __init__(self, index, n_items, search_k=-1, n_threads=None, block_size=256):
+        self.index = index
+        self.n_items = n_items
+        self.search_k = search_k
+        self.n_threads = _query_threads(n_threads)
+        self.block_size = block_size
+
+    def __len__(self):
+        return self.n_items
+
+    @classmethod
+    def build(cls, vectors, n_trees=20, search_k=-1, path=None, n_threads=None):
+        index = annoy.AnnoyIndex(vectors.shape[1], 'euclidean')
+        if path:
+            # Trees are written straight to the file, which is then mmapped for queries
+            index.on_disk_build(path)
+        for i, vector in enumerate(vectors):
+            index.add_item(i, vector)
+        index.build(n_trees, n_jobs=-1)
+        return cls(index, len(vectors), search_k=search_k, n_threads=n_threads)
+
+    @classmethod
+    def load(cls, path, dim, search_k=-1, n_threads=None):
+        index = annoy.AnnoyIndex(dim, 'euclidean')
+        index.load(path)
+        return cls(index, index.get_n_items(), search_k=search_k, n_threads=n_threads)
+
+    def save(self, path):
+        self.index.save(path)
+
+    def _query_block(self, items, k):
+        indices = np.empty((len(items), k), dtype=np.int64)
+        dists = np.zeros((len(items), k), dtype=np.float32)
+        for row, item in enumerate(items.tolist()):
+            found, found_dists = self.index.get_nns_by_item(item, k, search_k=self.search_k, include_distances=True)
+            # Pad short answers with the item itself so rows stay rectangular
+            indices[row] = found + [item] * (k - len(found))
+            dists[row, :len(found_dists)] = found_dists
+        return indices, dists
+
+    def query_items(self, items, k):
+        items = np.asarray(items, dtype=np.int64)
+        k = min(k, len(self))
+        blocks = [items[i:i + self.block_size] for i in range(0, len(items), self.block_size)]
+        # annoy drops the GIL while searching, so a thread pool scales across cores
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            results = list(pool.map(lambda block: self._query_block(block, k), blocks))
+        if not results:
+            return np.zeros((0, k), dtype=np.int64), np.zeros((0, k), dtype=np.float32)
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+BACKENDS = {
+    ExactNeighborIndex.name: ExactNeighborIndex,
+    AnnoyNeighborIndex.name: AnnoyNeighborIndex,
+}
+
+def vectors_fingerprint(vectors):
+    """Content hash used to reuse a saved index for identical embeddings"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    digest = hashlib.sha1(vectors.tobytes())
+    digest.update(str(vectors.shape).encode())
+    return digest.hexdigest()
+
+def evict_indexes(cache_dir, max_bytes, keep=None):
+    """Delete the least recently used saved indexes until cache_dir holds at most max_bytes; keep is never deleted"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith(".ann") and path != keep:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # Evicted by another process meanwhile
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep and os.path.exists(keep) else 0)
+    # Reuse touches an index, so the oldest mtime is the least recently used
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            # Processes still holding the file mapped keep reading it; only the directory entry goes
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        logger.info(f"Evicted ANN index {path} ({size / 1e6:.0f} MB)")
+
+def make_neighbor_index(vectors, backend="auto", exact_max_rows=20000, n_trees=20, search_k=-1,
+                        cache_dir=None, cache_max_mb=None, n_threads=None):
+    """Pick a backend for the data size and reuse an index saved under cache_dir when possible.
+
+    With cache_max_mb, least recently used indexes are evicted once the
+    directory grows beyond that size.
+    """
+    if backend == "auto":
+        backend = "exact" if len(vectors) <= exact_max_rows else "annoy"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown neighbor backend: {backend}. Expected one of {sorted(BACKENDS)} or 'auto'")
+    if backend == "exact":
+        return ExactNeighborIndex(vectors, n_threads=n_threads)
+    path = None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"{vectors_fingerprint(vectors)}_{n_trees}.ann")
+        if os.path.exists(path):
+            logger.info(f"Reusing ANN index {path}")
+            os.utime(path)
+            return AnnoyNeighborIndex.load(path, vectors.shape[1], search_k=search_k, n_threads=n_threads)
+    # Build under a temporary name so a crash never leaves a truncated index to be reused
+    tmp_path = f"{path}.tmp" if path else None
+    index = AnnoyNeighborIndex.build(vectors, n_trees=n_trees, search_k=search_k, path=tmp_path, n_threads=n_threads)
+    if path:
+        index.index.unload()
+        os.replace(tmp_path, path)
+        if cache_max_mb is not None:
+            evict_indexes(cache_dir, cache_max_mb * 1024 * 1024, keep=path)
+        return AnnoyNeighborIndex.load(path, vectors.shape[1], search_k=search_k, n_threads=n_threads)
+    return index
@@ -18,93 +18,56 @@ Original file is located at
 """
 
 # Package Loading
-import openai
-import streamlit as st
-import numpy as np
-import spacy
-import pandas as pd
-import matplotlib.pyplot as plt
-import altair as alt
-import seaborn as sns
-from sklearn.metrics import silhouette_score
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-from nltk.collocations import*
-from nltk import word_tokenize
-from nltk import bigrams
-from nltk.corpus import stopwords
-from nltk.tokenize import TweetTokenizer, word_tokenize, TweetTokenizer
-from nltk.tag import StanfordNERTagger
-from nltk.stem import WordNetLemmatizer
-from time import sleep
-from nltk import download
-from tenacity import retry, wait_exponential, stop_after_attempt
-from fastdtw import fastdtw
-from sklearn.cluster import AgglomerativeClustering
-from torch.utils.data import Dataset, DataLoader
-from matplotlib.dates import DateFormatter
-# Download necessary NLTK datasets (if not already installed)
-#download('punkt')
-#download('stopwords')
-#download('wordnet')
-#download('punkt_tab')
-import string
-import nltk.corpus
-from nltk import SnowballStemmer
-from sklearn.metrics import silhouette_samples, silhouette_score
-import re
-from stop_words import get_stop_words
-from wordcloud import WordCloud, STOPWORDS
-import tweepy
+# Only what the pipeline actually uses: every extra import here is paid by app.py on each cold start
+import contextlib
+import contextvars
+import hashlib
+import json
 import logging
-from sklearn import preprocessing
-from sklearn.cluster import KMeans
-from numpy import argmax
-from transformers import pipeline, AutoTokenizer, BertTokenizer, BartTokenizer, BartForConditionalGeneration, AutoModelForTokenClassification, BertModel
-import networkx as nx
-from datetime import timedelta
-from sentence_transformers import SentenceTransformer, util
-from bertopic import BERTopic
-from transformers import MarianMTModel, MarianTokenizer, GPT2Tokenizer
-import random
-# Initialize the tokenizer to manage token limits
-#tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
-import cv2
-from skimage.metrics import structural_similarity as ssim
-#from flair.data import Sentence
-#from flair.models import SequenceTagger
-import groq
-import concurrent.futures
-import time
-import groq
-from groq import Groq
-import random
-import multiprocessing
+import math
 import os
-import re
-import groq
-from multiprocessing import Manager, cpu_count, Pool
-import torch
-from sklearn.feature_extraction.text import CountVectorizer
-from umap import UMAP
-from hdbscan import HDBSCAN
-from bertopic.representation import MaximalMarginalRelevance
-from bertopic.vectorizers import ClassTfidfTransformer
-from bertopic.representation import TextGeneration, OpenAI, KeyBERTInspired
-import annoy
-from numba import njit, prange
+import sqlite3
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import repeat
+
+try:
+    import fcntl
+except ImportError:  # Windows: the embedding cache is then single-process only
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from tenacity import retry, retry_if_exception, wait_exponential
+
+from graph_clustering import NS_PER_HOUR
+from stage_memo import StageMemo
+from diagnostics import Diagnostics
+# torch, transformers, groq, matplotlib/seaborn, hdbscan, scikit-learn and PIL are imported inside the
+# functions that use them, so viewing a preprocessed report never loads them
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize GPU if available
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-logger.info(f"Using device: {device}")
+# GPU if available, resolved on first use
+_device = None
+
+def get_device():
+    global _device
+    if _device is None:
+        import torch
+        _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        logger.info(f"Using device: {_device}")
+    return _device
+
+def __getattr__(name):
+    # pipeline.device still works for callers, without importing torch at module import
+    if name == "device":
+        return get_device()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Configuration (now using Streamlit secrets)
 CONFIG = {
@@ -114,45 +77,224 @@ CONFIG = {
         "batch_size": 512,  # Increased batch size
         "max_seq_length": 128,
         "num_workers": 4,
-        "fp16": True  # Enable mixed precision
+        "fp16": True,  # Enable mixed precision
+        "dynamic_padding": True  # Pad each length bucket to its longest member
     },
     "bertrend": {
         "model_name": "bert-base-multilingual-cased",  # Explicitly set model name
+        "pooling": "mean",  # "mean" (attention-masked), "cls" or "max" over token states
         "temporal_weight": 0.5,
         "cluster_threshold": 0.35,  # Adjusted to a reasonable value
         "min_cluster_size": 4,
         "growth_threshold": 1.2,  # Adjusted to a reasonable value
         "pca_components": 64,  # Increased PCA components
-        "chunk_size": 500,  # Increased chunk size
+        "chunk_size": 500,  # Posts per time partition, before the in-window neighbors are added
+        "cluster_workers": None,  # Processes clustering partitions, None = all cores
+        "parallel_min_rows": 5000,  # Smaller corpora are clustered in-process, skipping pool start-up
+        "stitch_overlap": 0.3,  # Merge partition clusters sharing this share of the smaller one's posts
+        "stitch_scale": 1.0,  # ...or, in neighbouring partitions, with centroids this many radii apart
         "ann_neighbors": 50,  # Increased ANN neighbors
+        "graph_neighbors": 30,  # Edges kept per post in the sparse temporal graph
+        "ann_backend": "auto",  # "exact" (BLAS brute force), "annoy", or "auto" by size
+        "exact_max_rows": 20000,  # Largest corpus "auto" still searches exactly
+        "ann_trees": 20,  # More trees for better accuracy
+        "ann_search_k": 100000,  # Higher search effort
+        "ann_threads": None,  # Query threads, None = all cores
+        "ann_cache_dir": os.path.join(".cache", "ann"),  # Saved annoy indexes, reused across runs
+        "ann_cache_max_mb": 2048,  # Least recently used indexes are evicted beyond this size
         "time_window_hours": 12  # Reduced time window
     },
     "analysis": {  # Corrected indentation here
-        "time_window": "12H",  # Reduced time window
+        "time_window": "12h",  # Reduced time window
         "min_sources": 2,
         "decay_factor": 0.01,  # Slightly slower decay
         "decay_power": 1.5,  # Adjusted decay power
         "visualization": {
             "plot_size": (16, 10),  # Larger plot size
             "palette": "viridis",
-            "max_display_clusters": 20  # Increased max clusters
+            "max_display_clusters": 20,  # Increased max clusters
+            "time_bin": "6h",  # Width of the timeline and heatmap bins
+            "renderer": "altair"  # "altair" (Vega, drawn in the browser) or "matplotlib" (PNG)
         }
+    },
+    "reports": {
+        "base_url": None,  # Override to point the Groq client at a proxy or local stub server
+        "max_workers": 8,  # Concurrent report requests
+        "requests_per_minute": 30,  # Token-bucket refill rate, matches the Groq free tier
+        "burst": 5,  # Requests allowed back-to-back before the bucket throttles
+        "max_attempts": 5,  # Attempts per report; only rate limits, 5xx and connection errors are retried
+        "backoff_min": 2,  # Seconds before the first retry, doubling up to backoff_max
+        "backoff_max": 60
+    },
+    "streaming": {
+        "warmup_rows": 1000,  # Posts collected before the stream fits its projection
+        "radius_scale": 2.0,  # Assign a post if within this many mean radii of a centroid
+        "merge_scale": 1.0,  # Merge narratives whose centroids are this close relative to their radii
+        "reconsolidate_every": 20,  # Micro-batches between background reconsolidation passes
+        "retention_hours": 72  # Posts kept for clustered_df; centroids and momentum outlive them
+    },
+    "report_cache": {
+        "enabled": True,
+        "path": os.path.join(".cache", "reports.sqlite"),
+        "ttl_hours": 24 * 7,  # Regenerate reports older than a week even if nothing changed
+        "max_entries": 5000  # Least recently used reports are evicted beyond this
+    },
+    "embedding_cache": {
+        "enabled": True,
+        "path": os.path.join(".cache", "embeddings")  # Persistent across runs
+    },
+    "cpu_inference": {
+        "enabled": True,  # Used whenever no GPU is available
+        "engine": "torch",  # "torch" (fp32), "int8" (dynamically quantized Linear layers) or "onnx" (needs onnxruntime)
+        "workers": None,  # Encoder processes, None = cores // threads_per_worker
+        "threads_per_worker": 2,  # Intra-op threads pinned per process
+        "batch_size": 64,  # Small batches keep per-batch padding low and spread evenly over workers
+        "min_rows_for_pool": 2000,  # Smaller inputs are encoded in-process, skipping pool start-up
+        "onnx_dir": os.path.join(".cache", "onnx")  # Exported models, reused across runs
+    },
+    "near_duplicates": {
+        "enabled": True,  # MinHash LSH over all posts, for repeated-content stats per cluster
+        "threshold": 0.8,  # Estimated Jaccard similarity of word shingles to count as the same text
+        "num_perm": 64,  # MinHash signature length
+        "bands": 8,  # LSH bands; 8 bands of 8 rows catch pairs from about 0.77 similarity
+        "shingle_size": 3  # Words per shingle
+    },
+    "media_reuse": {
+        "enabled": False,  # Needs a manifest of locally downloaded post images
+        "manifest": None,  # CSV/Parquet with 'URL' and 'Media Path' columns, one row per image of a post
+        "max_distance": 6,  # pHash bits two images may differ by to be SSIM-checked
+        "dhash_distance": 12,  # ...and dHash bits, a cheap second filter before SSIM
+        "ssim_threshold": 0.85,  # Structural similarity of 64x64 thumbnails to count as the same image
+        "workers": None  # Image decoding processes, None = all cores
+    },
+    "projection": {
+        "path": os.path.join(".cache", "projection.npz"),  # Shared by every run; refit with `python projection.py refit`
+        "method": "incremental",  # "incremental" (IncrementalPCA) or "randomized" (randomized SVD)
+        "sample_rows": 50000,  # Reference sample the projection is fitted on
+        "min_fit_rows": 1000,  # Smaller corpora get a throwaway fit instead of becoming the saved projection
+        "batch_size": 4096  # IncrementalPCA rows per partial fit
+    },
+    "stage_memo": {
+        "enabled": True,
+        "max_entries": 32,  # Stage results kept in memory across reruns, least recently used evicted first
+        "max_mb": 1024  # Estimated memory budget for all memoized results
+    },
+    "diagnostics": {
+        "enabled": False,  # Record per-stage shapes, row counts, timings and memory
+        "dump_frames": False,  # Also send full DataFrames to the page; debugging only, slow on large uploads
+        "trace_memory": False  # Per-stage peak memory via tracemalloc; adds overhead to allocation-heavy stages
     }
 }
 
+# Stage Diagnostics and Profiling: metrics only, frames are shown on the page only when dumps are requested
+diagnostics = Diagnostics(
+    enabled=CONFIG["diagnostics"]["enabled"],
+    dump_frames=CONFIG["diagnostics"]["dump_frames"],
+    trace_memory=CONFIG["diagnostics"]["trace_memory"]
+)
+
+def diagnose(stage, event, df):
+    diagnostics.record(stage, event, df)
+    if diagnostics.enabled and diagnostics.dump_frames:
+        st.write(f"{stage}: {event}")
+        st.dataframe(df)
+
 # Initialize Groq client with Streamlit secrets
 def get_groq_client():
+    from groq import Groq
     return Groq(api_key=st.secrets.groq.api_key)
 
-# Load BERT model to GPU
-tokenizer = BertTokenizer.from_pretrained(CONFIG["bertrend"]["model_name"])
-bert_model = BertModel.from_pretrained(CONFIG["bertrend"]["model_name"]).to(device)
+# Token-bucket Rate Limiter shared by all report threads
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request token is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Shared Groq client and limiter for report generation
+_report_client = None
+_report_limiter = None
+_report_lock = threading.Lock()
+
+def get_report_client():
+    global _report_client, _report_limiter
+    with _report_lock:
+        if _report_client is None:
+            from groq import Groq
+            # Retries are ours alone (create_chat_completion), so max_attempts is the real request budget
+            _report_client = Groq(api_key=CONFIG["api_key"], base_url=CONFIG["reports"]["base_url"], max_retries=0)
+            _report_limiter = TokenBucket(CONFIG["reports"]["requests_per_minute"], CONFIG["reports"]["burst"])
+        return _report_client, _report_limiter
+
+# BERT model and tokenizer, loaded on first use so importing the pipeline stays cheap
+_model_lock = threading.Lock()
+_tokenizer = None
+_bert_model = None
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        with _model_lock:
+            if _tokenizer is None:
+                from transformers import BertTokenizerFast
+                _tokenizer = BertTokenizerFast.from_pretrained(CONFIG["bertrend"]["model_name"])
+    return _tokenizer
+
+def get_bert_model():
+    global _bert_model
+    if _bert_model is None:
+        with _model_lock:
+            if _bert_model is None:
+                from transformers import BertModel
+                logger.info(f"Loading {CONFIG['bertrend']['model_name']} onto {get_device()}")
+                _bert_model = BertModel.from_pretrained(CONFIG["bertrend"]["model_name"]).to(get_device())
+    return _bert_model
 
 # GPU-optimized Dataset with Pre-batching
-class DRCDataset(Dataset):
-    def __init__(self, texts):
+def valid_posts(df):
+    """Rows DRCDataset would keep, so embeddings line up with the frame"""
+    mask = df['text'].map(lambda t: isinstance(t, (str, bytes)) and len(str(t).strip()) > 0)
+    return df[mask]
+
+# Map-style dataset: DataLoader only needs __len__ and __getitem__, so no torch base class at import
+class DRCDataset:
+    def __init__(self, texts, padding="max_length"):
         # Filter out invalid or empty entries
         self.texts = [str(t).strip() for t in texts if isinstance(t, (str, bytes)) and len(str(t).strip()) > 0]
+        self.padding = padding
+        self.input_ids = None  # Set by token_lengths(); batches are then padded from these ids
+
+    def token_lengths(self):
+        """Token count per text after truncation, used to bucket by length.
+
+        The token ids are kept, so batching afterwards only pads them instead of tokenizing every text again.
+        """
+        if not self.texts:
+            return np.zeros(0, dtype=np.int64)
+        encoded = get_tokenizer()(
+            self.texts,
+            truncation=True,
+            max_length=CONFIG["gpu_params"]["max_seq_length"],
+            return_attention_mask=False,
+            return_token_type_ids=False
+        )
+        self.input_ids = encoded["input_ids"]
+        return np.array([len(ids) for ids in self.input_ids], dtype=np.int64)
 
     def __len__(self):
         return len(self.texts)
@@ -160,9 +302,19 @@ class DRCDataset(Dataset):
     def __getitem__(self, idx):
         if idx >= len(self):
             return ""
-        return self.texts[idx]
+        return self.texts[idx] if self.input_ids is None else self.input_ids[idx]
 
     def collate_fn(self, batch):
+        import torch
+        if self.input_ids is not None:
+            # Already tokenized by token_lengths(): only padding and the attention mask are left
+            return get_tokenizer().pad(
+                {"input_ids": batch},
+                padding=self.padding,
+                max_length=CONFIG["gpu_params"]["max_seq_length"],
+                return_attention_mask=True,
+                return_tensors="pt"
+            )
         # Filter empty strings and None values
         batch = [text for text in batch if isinstance(text, (str, bytes)) and len(text) > 0]
         # Handle empty batches
@@ -171,10 +323,10 @@ class DRCDataset(Dataset):
                     "attention_mask": torch.zeros((0, CONFIG["gpu_params"]["max_seq_length"]), dtype=torch.long)}
         # Tokenize with error handling
         try:
-            return tokenizer(
+            return get_tokenizer()(
                 batch,
                 return_tensors="pt",
-                padding="max_length",
+                padding=self.padding,
                 truncation=True,
                 max_length=CONFIG["gpu_params"]["max_seq_length"],
                 return_attention_mask=True
@@ -184,101 +336,482 @@ class DRCDataset(Dataset):
             return {"input_ids": torch.zeros((len(batch), CONFIG["gpu_params"]["max_seq_length"]), dtype=torch.long),
                     "attention_mask": torch.zeros((len(batch), CONFIG["gpu_params"]["max_seq_length"]), dtype=torch.long)}
 
-# Turbo-charged BERT Embeddings Generator
-def get_bert_embeddings(texts):
-    dataset = DRCDataset(texts)
+# Length-bucketed Batch Sampler
+class LengthBucketSampler:
+    """Yields batches of indices with similar token lengths so padding stays minimal"""
+    def __init__(self, lengths, batch_size):
+        self.order = np.argsort(lengths, kind="stable")
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        for start in range(0, len(self.order), self.batch_size):
+            yield self.order[start:start + self.batch_size].tolist()
+
+    def __len__(self):
+        return (len(self.order) + self.batch_size - 1) // self.batch_size
+
+# Sharded CPU Encoder, started on first use and kept for later calls
+_cpu_encoder = None
+_cpu_encoder_args = None
+_cpu_encoder_lock = threading.Lock()
+
+def use_cpu_engine():
+    return get_device().type == "cpu" and CONFIG["cpu_inference"]["enabled"]
+
+def get_cpu_encoder():
+    global _cpu_encoder, _cpu_encoder_args
+    settings = CONFIG["cpu_inference"]
+    args = dict(
+        model_name=CONFIG["bertrend"]["model_name"],
+        max_seq_length=CONFIG["gpu_params"]["max_seq_length"],
+        pooling=CONFIG["bertrend"]["pooling"],
+        engine=settings["engine"],
+        workers=settings["workers"],
+        threads_per_worker=settings["threads_per_worker"],
+        batch_size=settings["batch_size"],
+        min_rows_for_pool=settings["min_rows_for_pool"],
+        onnx_dir=settings["onnx_dir"]
+    )
+    with _cpu_encoder_lock:
+        if _cpu_encoder is None or _cpu_encoder_args != args:
+            from cpu_inference import CPUEncoder
+            if _cpu_encoder is not None:
+                _cpu_encoder.close()
+            _cpu_encoder, _cpu_encoder_args = CPUEncoder(**args), args
+        return _cpu_encoder
+
+def embedding_model_id():
+    """Model name as used in embedding cache keys; int8 and ONNX engines get entries of their own"""
+    if use_cpu_engine() and CONFIG["cpu_inference"]["engine"] != "torch":
+        return f"{CONFIG['bertrend']['model_name']}+{CONFIG['cpu_inference']['engine']}"
+    return CONFIG["bertrend"]["model_name"]
+
+# Content-addressed Embedding Cache
+class EmbeddingCache:
+    """Append-only on-disk store of pooled BERT embeddings, memory-mapped for reads.
+
+    Several processes (the dashboard and batch.py, say) may share one
+    directory: appends happen under an exclusive lock on the directory's
+    lock file, after picking up whatever other processes appended, so a
+    key always maps to the row its vector was actually written at.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.keys_path = os.path.join(path, "keys.txt")
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.lock_path = os.path.join(path, "lock")
+        self._lock = threading.Lock()
+        self._index = {}
+        self._rows = 0  # Rows in the files this process has read; equals the keys.txt line count
+        self._keys_offset = 0  # Bytes of keys.txt already read
+        self._dim = None
+        self._vectors = None
+        os.makedirs(path, exist_ok=True)
+        with self._lock, self._file_lock():
+            self._repair()
+            self._sync()
+
+    @staticmethod
+    def make_key(text, model_name, max_seq_length, pooling):
+        # Whitespace is collapsed so re-scraped posts with cosmetic differences still hit
+        normalized = " ".join(str(text).split())
+        payload = f"{model_name}\x00{max_seq_length}\x00{pooling}\x00{normalized}"
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Exclusive across processes; a no-op where fcntl is unavailable"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _row_bytes(self):
+        return 4 * self._dim
+
+    def _repair(self):
+        """Drop a partially written tail left behind by an interrupted run; caller holds the file lock"""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            self._dim = json.load(f)["dim"]
+        keys = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "rb") as f:
+                data = f.read()
+            complete = data[:data.rfind(b"\n") + 1]
+            keys = complete.split()
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        n_valid = min(len(keys), size // self._row_bytes())
+        if keys and (n_valid < len(keys) or len(complete) < len(data)):
+            with open(self.keys_path, "wb") as f:
+                f.write(b"".join(k + b"\n" for k in keys[:n_valid]))
+        if size != n_valid * self._row_bytes():
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(n_valid * self._row_bytes())
+
+    def _sync(self):
+        """Index the rows other processes appended since the last read; caller holds both locks"""
+        if self._dim is None:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path) as f:
+                self._dim = json.load(f)["dim"]
+        if not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            tail = f.read()
+        tail = tail[:tail.rfind(b"\n") + 1]
+        keys = tail.split()
+        if not keys:
+            return
+        for key in keys:
+            self._index.setdefault(key.decode("ascii"), self._rows)
+            self._rows += 1
+        self._keys_offset += len(tail)
+        self._vectors = None  # Re-map on next read to cover the new rows
+
+    def __len__(self):
+        return len(self._index)
+
+    def _mmap(self):
+        if self._vectors is None and self._rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                      shape=(self._rows, self._dim))
+        return self._vectors
+
+    def lookup(self, keys):
+        """Return cache row for each key, -1 for misses"""
+        with self._lock:
+            return np.array([self._index.get(k, -1) for k in keys], dtype=np.int64)
+
+    def get(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        with self._lock:
+            vectors = self._mmap()
+            if vectors is None:
+                # Nothing stored yet: only an empty request can be served
+                if rows.size:
+                    raise KeyError(f"Embedding cache at {self.path} is empty")
+                return np.zeros((0, self._dim or 0), dtype=np.float32)
+            return np.asarray(vectors[rows])
+
+    def add(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            if self._dim is None and not os.path.exists(self.meta_path):
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dim": int(vectors.shape[1])}, f)
+            # Other processes may have appended since the last read: rows are numbered after theirs
+            self._sync()
+            new = {}
+            for k, v in zip(keys, vectors):
+                if k not in self._index and k not in new:
+                    new[k] = v
+            if not new:
+                return
+            # A crash between the vector and the key writes can leave extra vectors; write over them
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(self._rows * self._row_bytes())
+            # Vectors are written before keys so a crash never leaves a key without data
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack(list(new.values())).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write("".join(f"{k}\n" for k in new).encode("ascii"))
+            self._sync()
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    global _embedding_cache
+    if not CONFIG["embedding_cache"]["enabled"]:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(CONFIG["embedding_cache"]["path"])
+        return _embedding_cache
+
+# Raw pooled BERT forward pass (no caching, no reduction)
+@diagnostics.instrument
+def encode_texts(texts, dynamic_padding=None):
+    import torch
+    from torch.utils.data import DataLoader
+    from cpu_inference import pool_hidden_states
+
+    if use_cpu_engine():
+        return get_cpu_encoder().encode(DRCDataset(texts).texts)
+    if dynamic_padding is None:
+        dynamic_padding = CONFIG["gpu_params"]["dynamic_padding"]
+    if dynamic_padding:
+        dataset = DRCDataset(texts, padding="longest")
+        # The only tokenization pass; batches reuse its ids
+        with diagnostics.profile("tokenize", rows=len(dataset)):
+            lengths = dataset.token_lengths()
+        sampler = LengthBucketSampler(lengths, CONFIG["gpu_params"]["batch_size"])
+        order = sampler.order
+        loader_args = {"batch_sampler": sampler}
+    else:
+        dataset = DRCDataset(texts)
+        order = np.arange(len(dataset))
+        loader_args = {"batch_size": CONFIG["gpu_params"]["batch_size"], "shuffle": False}
     dataloader = DataLoader(
         dataset,
-        batch_size=CONFIG["gpu_params"]["batch_size"],
         num_workers=0,  # Disable multiprocessing for stability
         collate_fn=dataset.collate_fn,
         pin_memory=True,
-        shuffle=False
+        **loader_args
     )
+    bert_model = get_bert_model()
     embeddings = []
     with torch.no_grad():
         for batch in dataloader:
             # Skip empty batches
             if batch["input_ids"].shape[0] == 0:
                 continue
-            inputs = {k: v.to(device) for k, v in batch.items()}
+            inputs = {k: v.to(get_device()) for k, v in batch.items()}
             outputs = bert_model(**inputs)
-            embeddings.append(outputs.last_hidden_state.mean(dim=1).cpu())
-            torch.cuda.empty_cache()  # Free GPU memory
-    full_embeddings = torch.cat(embeddings)
-    pca = PCA(n_components=CONFIG["bertrend"]["pca_components"])
-    return pca.fit_transform(full_embeddings.cpu().numpy())
-
-# GPU-accelerated Temporal-Spatial Distance Calculator
-def temporal_distance_matrix(embeddings, timestamps):
-    """Hybrid distance calculation with temporal constraints"""
-    emb_tensor = torch.tensor(embeddings, device=device)
-    time_tensor = torch.tensor(timestamps, dtype=torch.float64, device=device)
-    time_diff = torch.abs(time_tensor[:, None] - time_tensor[None, :]) / 3.6e9
-    time_mask = (time_diff < CONFIG["bertrend"]["time_window_hours"]).float()
-    semantic_dists = torch.cdist(emb_tensor, emb_tensor, p=2)
-    combined_dists = (
-        CONFIG["bertrend"]["temporal_weight"] * time_diff +
-        (1 - CONFIG["bertrend"]["temporal_weight"]) * semantic_dists
-    ) * time_mask
-    return combined_dists.cpu().numpy()
+            embeddings.append(pool_hidden_states(outputs.last_hidden_state, inputs["attention_mask"],
+                                                 CONFIG["bertrend"]["pooling"]).cpu())
+    if get_device().type == "cuda":
+        torch.cuda.empty_cache()  # Free GPU memory once, not after every batch
+    # Undo the length sort so rows line up with the input texts again
+    sorted_embeddings = torch.cat(embeddings).numpy()
+    restored = np.empty_like(sorted_embeddings)
+    restored[order] = sorted_embeddings
+    return restored
+
+# Pooled BERT embeddings before dimensionality reduction, served from the cache where possible
+@diagnostics.instrument
+def get_raw_embeddings(texts):
+    texts = DRCDataset(texts).texts
+    cache = get_embedding_cache()
+    if cache is None:
+        return encode_texts(texts)
+    else:
+        model_id = embedding_model_id()
+        keys = [EmbeddingCache.make_key(t, model_id, CONFIG["gpu_params"]["max_seq_length"],
+                                        CONFIG["bertrend"]["pooling"])
+                for t in texts]
+        rows = cache.lookup(keys)
+        misses = {}
+        for key, text, row in zip(keys, texts, rows):
+            if row < 0 and key not in misses:
+                misses[key] = text
+        logger.info(f"Embedding cache: {len(texts) - int((rows < 0).sum())} hits, {len(misses)} unique misses")
+        if misses:
+            cache.add(list(misses.keys()), encode_texts(list(misses.values())))
+            rows = cache.lookup(keys)
+        return cache.get(rows)
+
+# Persisted Projection: one fitted reduction shared by every run, applied as a matrix multiply
+_projection = None
+_projection_mtime = None
+_projection_lock = threading.Lock()
+
+def projection_meta():
+    """What a saved projection must have been fitted for to be reused"""
+    return {
+        "model_name": CONFIG["bertrend"]["model_name"],
+        "pooling": CONFIG["bertrend"]["pooling"],
+        "max_seq_length": CONFIG["gpu_params"]["max_seq_length"],
+        "n_components": CONFIG["bertrend"]["pca_components"]
+    }
+
+def refit_projection(raw, method=None, sample_rows=None):
+    """Fit a projection on a reference sample of raw embeddings and make it the saved one"""
+    global _projection, _projection_mtime
+    from projection import Projection
+    settings = CONFIG["projection"]
+    projection = Projection.fit(
+        raw,
+        CONFIG["bertrend"]["pca_components"],
+        method=method or settings["method"],
+        sample_rows=sample_rows or settings["sample_rows"],
+        batch_size=settings["batch_size"],
+        meta=projection_meta()
+    )
+    with _projection_lock:
+        projection.save(settings["path"])
+        _projection, _projection_mtime = projection, os.path.getmtime(settings["path"])
+    return projection
+
+def saved_projection():
+    """The saved projection, reloaded if it was refit on disk, or None if there is none for this model"""
+    global _projection, _projection_mtime
+    path = CONFIG["projection"]["path"]
+    with _projection_lock:
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime is not None and mtime != _projection_mtime:
+            from projection import Projection
+            _projection, _projection_mtime = Projection.load(path), mtime
+        if _projection is None:
+            return None
+        if not _projection.matches(projection_meta()):
+            logger.warning(f"Saved projection was fitted for {_projection.meta}, not {projection_meta()}")
+            return None
+        return _projection
+
+def get_projection(raw):
+    """The saved projection, bootstrapping one from raw if none fits this model"""
+    projection = saved_projection()
+    if projection is not None:
+        return projection
+    if len(raw) < CONFIG["projection"]["min_fit_rows"]:
+        from projection import Projection
+        # Too small to be a reference sample: project this corpus only, keep nothing
+        return Projection.fit(raw, CONFIG["bertrend"]["pca_components"], method="randomized", meta=projection_meta())
+    return refit_projection(raw)
+
+def projection_version():
+    """Changes whenever the saved projection does, so memoized stages downstream of it are recomputed"""
+    path = CONFIG["projection"]["path"]
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+# Reused Media: images hashed once per manifest version, matched to posts by URL
+_media = None
+_media_key = None
+_media_lock = threading.Lock()
+
+def media_version():
+    """Changes with the media settings or the manifest file, so dependent stages are recomputed"""
+    settings = CONFIG["media_reuse"]
+    if not settings["enabled"] or not settings["manifest"] or not os.path.exists(settings["manifest"]):
+        return None
+    return os.path.getmtime(settings["manifest"])
+
+def get_media_groups():
+    """Manifest rows with their 'Media Group', or None when media reuse is off"""
+    global _media, _media_key
+    settings = CONFIG["media_reuse"]
+    version = media_version()
+    if version is None:
+        return None
+    key = (settings["manifest"], version, settings["max_distance"], settings["dhash_distance"],
+           settings["ssim_threshold"])
+    with _media_lock:
+        if key != _media_key:
+            from media_reuse import load_manifest, media_groups
+            with diagnostics.profile("media_reuse"):
+                _media = media_groups(
+                    load_manifest(settings["manifest"]),
+                    max_distance=settings["max_distance"],
+                    dhash_distance=settings["dhash_distance"],
+                    ssim_threshold=settings["ssim_threshold"],
+                    workers=settings["workers"]
+                )
+            _media_key = key
+        return _media
+
+# Turbo-charged BERT Embeddings Generator
+@diagnostics.instrument
+def get_bert_embeddings(texts):
+    raw = get_raw_embeddings(texts)
+    projection = get_projection(raw)
+    with diagnostics.profile("projection", rows=len(raw)):
+        return projection.transform(raw)
+
+# Sparse Time-windowed Neighbor Graph
+def graph_params():
+    """The bertrend settings the partition workers need, passed explicitly since spawned processes have their own CONFIG"""
+    return {key: CONFIG["bertrend"][key] for key in
+            ("graph_neighbors", "temporal_weight", "time_window_hours", "min_cluster_size", "cluster_threshold")}
+
+@diagnostics.instrument
+def temporal_knn_graph(embeddings, timestamps, n_neighbors=None, block_size=256):
+    """Sparse k-NN graph of combined distances, holding only pairs inside time_window_hours"""
+    import graph_clustering
+    return graph_clustering.temporal_knn_graph(
+        embeddings, timestamps,
+        n_neighbors or CONFIG["bertrend"]["graph_neighbors"],
+        CONFIG["bertrend"]["temporal_weight"],
+        CONFIG["bertrend"]["time_window_hours"],
+        block_size=block_size
+    )
+
+@diagnostics.instrument
+def cluster_candidates(embeddings, timestamps):
+    """HDBSCAN over the sparse temporal graph of one candidate set; -1 marks noise"""
+    from graph_clustering import cluster_graph
+    with diagnostics.profile("hdbscan", rows=len(embeddings)):
+        return cluster_graph(embeddings, timestamps, graph_params())
+
+# Stage Memoization: reruns only recompute stages whose input data or config sections changed
+stage_memo = StageMemo(
+    max_entries=CONFIG["stage_memo"]["max_entries"],
+    max_bytes=CONFIG["stage_memo"]["max_mb"] * 1024 * 1024,
+    enabled=CONFIG["stage_memo"]["enabled"]
+)
 
 # Hyper-optimized BERTrend Analysis
+@diagnostics.instrument
+@stage_memo.stage(CONFIG, "bertrend", "gpu_params", "cpu_inference", "near_duplicates", "projection",
+                  version=projection_version)
 def bertrend_analysis(df):
     """GPU-powered clustering pipeline with temporal constraints"""
-    st.write("Input DataFrame to bertrend_analysis:")
-    st.write(df)
-    st.write(f"Input DataFrame shape: {df.shape}")
-    st.write(f"Input DataFrame is empty: {df.empty}")
+    from neighbors import make_neighbor_index
+    from graph_clustering import time_partitions, cluster_partitions, stitch_partitions
+    from near_duplicates import near_duplicate_groups
+
+    # Columns are added below; the caller's frame, and the memo's stored input fingerprint, stay untouched
+    df = df.copy()
+    diagnose("bertrend_analysis", "input", df)
     try:
         logger.info("Generating turbo-charged BERT embeddings...")
         embeddings = get_bert_embeddings(df['text'].tolist())
         timestamps = df['Timestamp'].astype(np.int64).values
-        ann_index = annoy.AnnoyIndex(embeddings.shape[1], 'euclidean')
-        for i, emb in enumerate(embeddings):
-            ann_index.add_item(i, emb)
-        ann_index.build(20)  # More trees for better accuracy
-        clusters = np.full(len(df), -1, dtype=int)
-        current_cluster = 0
-        chunk_size = CONFIG["bertrend"]["chunk_size"]
-        for i in range(0, len(embeddings), chunk_size):
-            chunk_end = min(i + chunk_size, len(embeddings))
-            logger.info(f"Processing chunk {i//chunk_size + 1}/{(len(embeddings)//chunk_size)+1}")
-            chunk_times = timestamps[i:chunk_end]
-            time_mask = (timestamps >= chunk_times[0]) & (timestamps <= chunk_times[-1])
-            neighbor_candidates = set()
-            for idx in range(i, chunk_end):
-                neighbors = ann_index.get_nns_by_item(
-                    idx,
-                    CONFIG["bertrend"]["ann_neighbors"],
-                    search_k=100000  # Higher search effort
-                )
-                neighbor_candidates.update(neighbors)
-            candidate_indices = np.array(list(neighbor_candidates))
-            candidate_indices = candidate_indices[time_mask[candidate_indices]]
-            if len(candidate_indices) == 0:
-                continue
-            sub_emb = embeddings[candidate_indices]
-            sub_ts = timestamps[candidate_indices]
-            dist_matrix = temporal_distance_matrix(sub_emb, sub_ts)
-            dist_matrix = dist_matrix.astype(np.double)
-            clusterer = HDBSCAN(
-                min_cluster_size=CONFIG["bertrend"]["min_cluster_size"],
-                metric="precomputed",
-                cluster_selection_epsilon=CONFIG["bertrend"]["cluster_threshold"],
-                core_dist_n_jobs=4
+        with diagnostics.profile("ann_build", rows=len(embeddings)):
+            ann_index = make_neighbor_index(
+                embeddings,
+                backend=CONFIG["bertrend"]["ann_backend"],
+                exact_max_rows=CONFIG["bertrend"]["exact_max_rows"],
+                n_trees=CONFIG["bertrend"]["ann_trees"],
+                search_k=CONFIG["bertrend"]["ann_search_k"],
+                cache_dir=CONFIG["bertrend"]["ann_cache_dir"],
+                cache_max_mb=CONFIG["bertrend"]["ann_cache_max_mb"],
+                n_threads=CONFIG["bertrend"]["ann_threads"]
+            )
+        # One batched, multi-threaded query for every post instead of a Python loop per chunk
+        with diagnostics.profile("ann_query", rows=len(embeddings)):
+            all_neighbors, _ = ann_index.query_items(np.arange(len(embeddings)), CONFIG["bertrend"]["ann_neighbors"])
+        # Time-sorted partitions, widened by in-window neighbors so narratives crossing a boundary overlap
+        cores, members = time_partitions(
+            timestamps, all_neighbors, CONFIG["bertrend"]["chunk_size"], CONFIG["bertrend"]["time_window_hours"]
+        )
+        logger.info(f"Clustering {len(cores)} time partitions")
+        with diagnostics.profile("cluster_partitions", rows=len(embeddings)):
+            labels = cluster_partitions(
+                embeddings, timestamps, members, graph_params(),
+                workers=CONFIG["bertrend"]["cluster_workers"],
+                min_rows=CONFIG["bertrend"]["parallel_min_rows"]
+            )
+        with diagnostics.profile("stitch_partitions", rows=len(embeddings)):
+            clusters = stitch_partitions(
+                len(embeddings), embeddings, timestamps, cores, members, labels,
+                min_overlap=CONFIG["bertrend"]["stitch_overlap"],
+                merge_scale=CONFIG["bertrend"]["stitch_scale"]
             )
-            chunk_clusters = clusterer.fit_predict(dist_matrix)
-            valid_mask = chunk_clusters != -1
-            chunk_clusters[valid_mask] += current_cluster
-            clusters[candidate_indices] = chunk_clusters
-            current_cluster = chunk_clusters[valid_mask].max() + 1 if valid_mask.any() else current_cluster
         df['Cluster'] = clusters
+        if CONFIG["near_duplicates"]["enabled"]:
+            # Over the whole corpus, before noise is dropped, so copies outside any cluster still count
+            settings = CONFIG["near_duplicates"]
+            with diagnostics.profile("near_duplicates", rows=len(df)):
+                df['Duplicate Group'] = near_duplicate_groups(
+                    df['text'].tolist(),
+                    threshold=settings["threshold"],
+                    num_perm=settings["num_perm"],
+                    bands=settings["bands"],
+                    shingle_size=settings["shingle_size"]
+                )
         df = df[df['Cluster'] != -1]
-        st.write("DataFrame after clustering:")
-        st.write(df)
-        st.write(f"DataFrame after clustering shape: {df.shape}")
-        st.write(f"DataFrame after clustering is empty: {df.empty}")
+        diagnose("bertrend_analysis", "clustered", df)
         if df.empty:
             logger.error("No valid clusters found after clustering.")
             st.error("❌ No valid clusters found after clustering.")
@@ -289,60 +822,117 @@ def bertrend_analysis(df):
         st.error(f"Error in bertrend_analysis: {e}")
         return pd.DataFrame()
 
-# Optimized Momentum Calculator
+def momentum_decay(delta_hours):
+    return np.exp(-CONFIG["analysis"]["decay_factor"] * (delta_hours ** CONFIG["analysis"]["decay_power"]))
+
+# Vectorized Momentum Calculator
+@diagnostics.instrument
+@stage_memo.stage(CONFIG, "analysis", "bertrend", "media_reuse", version=media_version)
 def calculate_trend_momentum(clustered_df):
-    """Optimized momentum calculation with source tracking"""
-    df = clustered_df.copy()
-    df['time_window'] = df['Timestamp'].dt.floor(CONFIG["analysis"]["time_window"])
-    grouped = df.groupby(['Cluster', 'time_window']).agg(
+    """Momentum for all clusters at once; each step of the decay recurrence runs across every cluster"""
+    from near_duplicates import duplicate_stats
+    from media_reuse import media_stats
+
+    df = clustered_df[clustered_df['Cluster'] != -1]
+    windows = df['Timestamp'].dt.floor(CONFIG["analysis"]["time_window"])
+    grouped = df.assign(time_window=windows).groupby(['Cluster', 'time_window']).agg(
         count=('text', 'size'),
-        sources=('Source', 'unique'),
         last_time=('Timestamp', 'max')
-    ).reset_index()
-    emerging = []
-    momentum_states = {}
-    for cluster, cluster_group in grouped.groupby('Cluster'):
-        if cluster == -1:
-            continue
-        cluster_group = cluster_group.sort_values('time_window')
-        cumulative_sources = set()
-        momentum = 0
-        last_update = None
-        for idx, row in cluster_group.iterrows():
-            if last_update is not None:
-                delta_hours = (row['last_time'] - last_update).total_seconds() / 3600
-                decay = np.exp(-CONFIG["analysis"]["decay_factor"] *
-                             (delta_hours ** CONFIG["analysis"]["decay_power"]))
-                momentum *= decay
-            momentum += row['count']
-            cumulative_sources.update(row['sources'])
-            momentum_score = momentum * len(cumulative_sources) * np.log1p(row['count'])
-            if (momentum_score > CONFIG["bertrend"]["growth_threshold"] and
-                len(cumulative_sources) >= CONFIG["analysis"]["min_sources"]):
-                emerging.append((cluster, momentum_score))
-            last_update = row['last_time']
-        momentum_states[cluster] = {
-            'momentum': momentum,
-            'last_update': last_update,
-            'sources': cumulative_sources
+    )
+    if grouped.empty:
+        return [], {}
+    # Cumulative unique sources: a source counts from the first window it appears in for that cluster
+    source_codes, _ = pd.factorize(df['Source'], use_na_sentinel=False)
+    first_seen = pd.DataFrame({
+        'Cluster': df['Cluster'].to_numpy(),
+        'source': source_codes,
+        'time_window': windows.to_numpy()
+    }).groupby(['Cluster', 'source'])['time_window'].min()
+    new_sources = first_seen.reset_index().groupby(['Cluster', 'time_window']).size()
+    n_sources = new_sources.reindex(grouped.index, fill_value=0).groupby(level=0).cumsum().to_numpy()
+
+    grouped = grouped.reset_index()
+    cluster_ids = grouped['Cluster'].to_numpy()
+    counts = grouped['count'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, cluster_ids[1:] != cluster_ids[:-1]])
+    lengths = np.diff(np.r_[starts, len(grouped)])
+    # Whole microseconds, matching Timedelta.total_seconds() in the scalar recurrence
+    delta_us = grouped['last_time'].diff().to_numpy().astype('timedelta64[us]').astype(np.int64)
+    delta_us[starts] = 0  # Differences across cluster boundaries are meaningless
+    delta_hours = delta_us / 1e6 / 3600
+    # libm pow per element: NumPy's SIMD power can round the last bit differently from the scalar path
+    powered = np.fromiter(map(math.pow, delta_hours.tolist(), repeat(CONFIG["analysis"]["decay_power"])),
+                          dtype=np.float64, count=len(delta_hours))
+    decay = np.exp(-CONFIG["analysis"]["decay_factor"] * powered)
+
+    momentum_per_row = np.empty(len(grouped), dtype=np.float64)
+    momentum = np.zeros(len(starts), dtype=np.float64)
+    for step in range(lengths.max()):
+        active = lengths > step
+        rows = starts[active] + step
+        momentum[active] = momentum[active] * decay[rows] + counts[rows]
+        momentum_per_row[rows] = momentum[active]
+    scores = momentum_per_row * n_sources * np.log1p(counts)
+
+    passing = (scores > CONFIG["bertrend"]["growth_threshold"]) & (n_sources >= CONFIG["analysis"]["min_sources"])
+    emerging = list(zip(cluster_ids[passing].tolist(), scores[passing]))
+    last_rows = starts + lengths - 1
+    sources = df[windows.notna()].groupby('Cluster')['Source'].unique()
+    momentum_states = {
+        cluster: {
+            'momentum': momentum_per_row[row],
+            'last_update': grouped['last_time'].iloc[row],
+            'sources': set(sources[cluster])
         }
+        for cluster, row in zip(cluster_ids[last_rows].tolist(), last_rows)
+    }
+    for cluster, stats in duplicate_stats(df).items():
+        if cluster in momentum_states:
+            momentum_states[cluster]['duplicates'] = stats
+    for cluster, stats in media_stats(df, get_media_groups()).items():
+        if cluster in momentum_states:
+            momentum_states[cluster]['media'] = stats
     return sorted(emerging, key=lambda x: -x[1]), momentum_states
 
 # Visualizations
-def visualize_trends(clustered_df, momentum_states):
-    """Generate interactive trend visualizations"""
-    if clustered_df is None or clustered_df.empty:
-        st.error("❌ No data available for visualization.")
-        return None
-    st.write("DataFrame before pivot_table:")
-    st.write(clustered_df)
-    st.write(f"DataFrame shape: {clustered_df.shape}")
-    st.write(f"Is DataFrame empty? {clustered_df.empty}")
-    plt.figure(figsize=CONFIG["analysis"]["visualization"]["plot_size"])
-    plt.subplot(2, 1, 1)
+@diagnostics.instrument
+@stage_memo.stage(CONFIG, "analysis")
+def trend_activity(clustered_df):
+    """Posts per time bin (rows, every bin in range) and cluster (columns) from a single groupby"""
+    bin_size = CONFIG["analysis"]["visualization"]["time_bin"]
+    bins = clustered_df['Timestamp'].dt.floor(bin_size)
+    counts = clustered_df['text'].groupby([bins, clustered_df['Cluster']]).count()
+    if counts.empty:
+        return pd.DataFrame()
+    activity = counts.unstack('Cluster', fill_value=0)
+    # Empty bins are kept so gaps in activity show up on both charts
+    return activity.reindex(pd.date_range(activity.index.min(), activity.index.max(), freq=bin_size), fill_value=0)
+
+def trend_timelines(activity, momentum_states):
+    """Cumulative post counts per displayed cluster, each spanning its own first to last active bin"""
+    timelines = {}
     for cluster in list(momentum_states.keys())[:CONFIG["analysis"]["visualization"]["max_display_clusters"]]:
-        cluster_data = clustered_df[clustered_df['Cluster'] == cluster]
-        timeline = cluster_data.groupby(pd.Grouper(key='Timestamp', freq='6H'))['text'].count().cumsum()
+        if cluster not in activity.columns:
+            continue
+        column = activity[cluster]
+        active = np.flatnonzero(column.to_numpy())
+        if len(active):
+            timelines[cluster] = column.iloc[active[0]:active[-1] + 1].cumsum()
+    return timelines
+
+def _figure_bytes(fig):
+    return int(np.prod(fig.get_size_inches()) * fig.dpi ** 2 * 4)
+
+@stage_memo.stage(CONFIG, "analysis", copy_result=False, sizeof=_figure_bytes)
+def build_trend_figure(activity, momentum_states):
+    """Matplotlib timeline and heatmap figure"""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from matplotlib.dates import DateFormatter
+
+    fig = plt.figure(figsize=CONFIG["analysis"]["visualization"]["plot_size"])
+    plt.subplot(2, 1, 1)
+    for cluster, timeline in trend_timelines(activity, momentum_states).items():
         plt.plot(timeline.index, timeline, label=f"Cluster {cluster}", lw=2, alpha=0.8)
     plt.gca().xaxis.set_major_formatter(DateFormatter('%Y-%m-%d %H:%M'))
     plt.title("Narrative Momentum Timeline")
@@ -350,59 +940,242 @@ def visualize_trends(clustered_df, momentum_states):
     plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
     plt.grid(True, alpha=0.3)
     plt.subplot(2, 1, 2)
+    sns.heatmap(
+        activity.iloc[:, :CONFIG["analysis"]["visualization"]["max_display_clusters"]].T,
+        cmap=CONFIG["analysis"]["visualization"]["palette"],
+        cbar_kws={'label': 'Activity Level'}
+    )
+    plt.title("Cluster Activity Patterns")
+    plt.xlabel("Time Windows")
+    plt.ylabel("Cluster ID")
+    plt.tight_layout()
+    # Detach from pyplot's figure manager: the memoized figure outlives this call
+    plt.close(fig)
+    return fig
+
+@diagnostics.instrument
+def build_trend_chart(activity, momentum_states):
+    """Altair timeline and heatmap; only the aggregated bins are sent to the browser"""
+    import altair as alt  # Imported on first use: the matplotlib path and batch runs never pay for it
+
+    timelines = trend_timelines(activity, momentum_states)
+    if timelines:
+        timeline_data = pd.concat(
+            [timeline.rename('Cumulative Posts').rename_axis('Timestamp').reset_index().assign(Cluster=str(cluster))
+             for cluster, timeline in timelines.items()],
+            ignore_index=True
+        )
+    else:
+        timeline_data = pd.DataFrame(columns=['Timestamp', 'Cumulative Posts', 'Cluster'])
+    shown = activity.iloc[:, :CONFIG["analysis"]["visualization"]["max_display_clusters"]]
+    heatmap_data = shown.rename_axis('Timestamp').rename_axis('Cluster', axis=1).stack().rename('Posts').reset_index()
+    heatmap_data = heatmap_data[heatmap_data['Posts'] > 0]
+    heatmap_data['Cluster'] = heatmap_data['Cluster'].astype(str)
+    heatmap_data['End'] = heatmap_data['Timestamp'] + pd.Timedelta(CONFIG["analysis"]["visualization"]["time_bin"])
+
+    timeline_chart = alt.Chart(timeline_data, title="Narrative Momentum Timeline").mark_line().encode(
+        x=alt.X('Timestamp:T', title=None),
+        y=alt.Y('Cumulative Posts:Q', title="Cumulative Momentum"),
+        color=alt.Color('Cluster:N'),
+        tooltip=['Cluster', 'Timestamp', 'Cumulative Posts']
+    )
+    heatmap_chart = alt.Chart(heatmap_data, title="Cluster Activity Patterns").mark_rect().encode(
+        x=alt.X('Timestamp:T', title="Time Windows"),
+        x2='End:T',
+        y=alt.Y('Cluster:N', title="Cluster ID"),
+        color=alt.Color('Posts:Q', title="Activity Level",
+                        scale=alt.Scale(scheme=CONFIG["analysis"]["visualization"]["palette"])),
+        tooltip=['Cluster', 'Timestamp', 'Posts']
+    )
+    return alt.vconcat(timeline_chart, heatmap_chart).resolve_scale(color='independent')
+
+@diagnostics.instrument
+def visualize_trends(clustered_df, momentum_states, renderer=None):
+    """Render trend visualizations; returns the Altair chart, or the PNG path for the matplotlib renderer"""
+    if clustered_df is None or clustered_df.empty:
+        st.error("❌ No data available for visualization.")
+        return None
+    diagnose("visualize_trends", "input", clustered_df)
     try:
-        heatmap_data = clustered_df.pivot_table(
-            index=pd.Grouper(key='Timestamp', freq='6H'),
-            columns='Cluster',
-            values='text',
-            aggfunc='count',
-            fill_value=0
-        ).iloc[:, :CONFIG["analysis"]["visualization"]["max_display_clusters"]]
-        st.write("Heatmap Data:")
-        st.write(heatmap_data)
-        st.write(f"Heatmap Data Shape: {heatmap_data.shape}")
-        st.write(f"Heatmap Data Contains NaNs? {heatmap_data.isnull().values.any()}")
-        if heatmap_data.empty or heatmap_data.isnull().all().all():
+        activity = trend_activity(clustered_df)
+        diagnose("visualize_trends", "activity", activity)
+        if activity.empty:
             st.error("❌ Heatmap data is empty or contains only NaN values.")
             return None
-        sns.heatmap(
-            heatmap_data.T,
-            cmap=CONFIG["analysis"]["visualization"]["palette"],
-            cbar_kws={'label': 'Activity Level'}
-        )
-        plt.title("Cluster Activity Patterns")
-        plt.xlabel("Time Windows")
-        plt.ylabel("Cluster ID")
+        renderer = renderer or CONFIG["analysis"]["visualization"]["renderer"]
+        if renderer == "altair":
+            chart = build_trend_chart(activity, momentum_states)
+            st.altair_chart(chart, use_container_width=True)
+            st.success("✅ Visualizations Generated")
+            return chart
+        fig = build_trend_figure(activity, momentum_states)
     except Exception as e:
         st.error(f"❌ Error generating heatmap: {e}")
         return None
-    plt.tight_layout()
-    plt.savefig("trend_visualization.png", bbox_inches='tight')
-    st.pyplot(plt)
-    plt.close()
+    fig.savefig("trend_visualization.png", bbox_inches='tight')
+    st.pyplot(fig)
     st.success("✅ Visualizations Generated")
     return "trend_visualization.png"
 
+# Persistent LLM Report Cache
+class ReportCache:
+    """SQLite store of report completions keyed by a hash of the full request, with TTL and LRU eviction"""
+    def __init__(self, path, ttl_hours, max_entries):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl_hours * 3600
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            "key TEXT PRIMARY KEY, content TEXT, created REAL, accessed REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_id, messages, temperature, max_tokens):
+        payload = json.dumps([model_id, messages, temperature, max_tokens], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content, created FROM reports WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE reports SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, content):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?)", (key, content, now, now))
+            self._conn.execute("DELETE FROM reports WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM reports WHERE key IN ("
+                "SELECT key FROM reports ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+_report_cache = None
+
+def get_report_cache():
+    global _report_cache
+    settings = CONFIG["report_cache"]
+    if not settings["enabled"]:
+        return None
+    with _report_lock:
+        if _report_cache is None:
+            _report_cache = ReportCache(settings["path"], settings["ttl_hours"], settings["max_entries"])
+        return _report_cache
+
+def is_transient_error(exc):
+    """Rate limits, 5xx, timeouts and dropped connections; bad requests, auth and unknown models are final"""
+    import groq
+    if isinstance(exc, (groq.RateLimitError, groq.APIConnectionError)):
+        return True
+    return isinstance(exc, groq.APIStatusError) and exc.status_code >= 500
+
+def _report_backoff(retry_state):
+    settings = CONFIG["reports"]
+    return wait_exponential(multiplier=1, min=settings["backoff_min"], max=settings["backoff_max"])(retry_state)
+
+def _report_attempts_exhausted(retry_state):
+    return retry_state.attempt_number >= CONFIG["reports"]["max_attempts"]
+
+# Rate-limited chat completion with exponential backoff on transient API errors
+@retry(retry=retry_if_exception(is_transient_error),
+       wait=_report_backoff,
+       stop=_report_attempts_exhausted,
+       reraise=True)
+def create_chat_completion(messages, temperature=0.6, max_tokens=800):
+    client, limiter = get_report_client()
+    limiter.acquire()
+    return client.chat.completions.create(
+        model=CONFIG["model_id"],
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens
+    )
+
+def cached_chat_completion(messages, temperature=0.6, max_tokens=800):
+    """Completion text, served from the report cache when the exact same request was made before"""
+    cache = get_report_cache()
+    key = ReportCache.make_key(CONFIG["model_id"], messages, temperature, max_tokens)
+    if cache is not None:
+        content = cache.get(key)
+        if content is not None:
+            logger.info("Report cache hit")
+            return content
+    with diagnostics.profile("llm_completion"):
+        content = create_chat_completion(messages, temperature=temperature, max_tokens=max_tokens).choices[0].message.content
+    if cache is not None:
+        cache.put(key, content)
+    return content
+
+# Evidence Selection for Reports
+@diagnostics.instrument
+def select_report_documents(cluster_data, max_tokens):
+    """Deduplicated documents ranked by closeness to the cluster centroid, packed into the token budget"""
+    docs = cluster_data[['text', 'URL', 'Timestamp']]
+    docs = docs[docs['text'].map(lambda t: isinstance(t, str) and len(t.strip()) > 0)]
+    normalized = docs['text'].map(lambda t: " ".join(t.lower().split()))
+    docs = docs[~normalized.duplicated()]
+    if docs.empty:
+        return []
+    texts = docs['text'].tolist()
+    # One batched pass of the fast tokenizer instead of encode() per document
+    token_counts = [len(ids) for ids in get_tokenizer()(texts, add_special_tokens=False)["input_ids"]]
+    # Raw embeddings come straight from the embedding cache filled by bertrend_analysis
+    embeddings = get_raw_embeddings(texts)
+    centrality = np.linalg.norm(embeddings - embeddings.mean(axis=0), axis=1)
+    selected_docs = []
+    total_tokens = 0
+    for idx in np.argsort(centrality, kind="stable"):
+        # Skip documents that do not fit rather than stopping, so shorter evidence can fill the budget
+        if total_tokens + token_counts[idx] <= max_tokens:
+            selected_docs.append(docs.iloc[idx].tolist())
+            total_tokens += token_counts[idx]
+    return selected_docs
+
+# Corpus-wide repeated-content evidence, which the sampled documents alone cannot show
+def describe_duplicates(duplicates):
+    if not duplicates or not duplicates['duplicate_groups']:
+        return ""
+    return (
+        f"\n\nRepeated content across the whole cluster: {duplicates['duplicate_ratio']:.0%} of posts are near-duplicates "
+        f"in {duplicates['duplicate_groups']} groups. The most widely shared text was posted by "
+        f"{duplicates['max_sources_per_text']} distinct sources within {duplicates['time_spread_hours']:.1f} hours "
+        f"(largest group: {duplicates['largest_group']} posts): {str(duplicates['top_text'])[:280]}"
+    )
+
+def describe_media(media):
+    if not media or not media['media_groups']:
+        return ""
+    return (
+        f"\n\nReused media across the whole cluster: {media['reused_ratio']:.0%} of posts carry an image "
+        f"that was reposted, in {media['media_groups']} reuse groups ({media['cross_cluster_groups']} of them also "
+        f"used by other narratives). The most reposted image was shared by {media['max_sources_per_image']} "
+        f"distinct sources."
+    )
+
 # Report Generation
+@diagnostics.instrument
 def generate_investigative_report(cluster_data, momentum_states, cluster_id, max_tokens=1024):
     """Generate report with top 3 documents and their URLs"""
-    client = Groq(api_key=CONFIG["api_key"])
     try:
         metrics = momentum_states.get(cluster_id, {})
-        sample_docs = cluster_data[['text', 'URL', 'Timestamp']].values.tolist()
-        random.shuffle(sample_docs)
+        duplicates = metrics.get('duplicates')
+        media = metrics.get('media')
         Country = "Gabon"
-        selected_docs = []
-        total_tokens = 0
-        for doc in sample_docs:
-            doc_tokens = len(tokenizer.encode(doc[0]))
-            if total_tokens + doc_tokens <= max_tokens:
-                selected_docs.append(doc)
-                total_tokens += doc_tokens
-            else:
-                break
-        response = client.chat.completions.create(
-            model=CONFIG["model_id"],
+        selected_docs = select_report_documents(cluster_data, max_tokens)
+        report = cached_chat_completion(
             messages=[{
                 "role": "system",
                 "content": f"""
@@ -418,24 +1191,50 @@ def generate_investigative_report(cluster_data, momentum_states, cluster_id, max
             }, {
                 "role": "user",
                 "content": "\n".join([f"Document {i+1}: {doc[0]}\nURL: {doc[1]}\n[TIMESTAMP]: {doc[2]}" for i, doc in enumerate(selected_docs)])
-            }],
-            temperature=0.6,
-            max_tokens=800
+                + describe_duplicates(duplicates)
+                + describe_media(media)
+            }]
         )
         return {
-            "report": response.choices[0].message.content,
+            "report": report,
             "metrics": metrics,
             "sample_texts": [doc[0] for doc in selected_docs],
             "sample_urls": [doc[1] for doc in selected_docs],
             "Time": [doc[2] for doc in selected_docs],
             "all_urls": cluster_data['URL'].head(20).tolist(),
             "source_count": cluster_data['Source'].nunique(),
-            "momentum_score": cluster_data['momentum_score'].iloc[0]
+            "momentum_score": cluster_data['momentum_score'].iloc[0],
+            "duplicates": duplicates,
+            "media": media
         }
     except Exception as e:
         logger.error(f"Report generation failed: {str(e)}")
         return {"error": str(e)}
 
+# Concurrent Report Generation
+def generate_reports(clustered_df, emerging, momentum_states, max_tokens=1024, max_workers=None):
+    """Fan out reports for the emerging clusters and yield (cluster_id, report) as each one completes"""
+    # emerging may list a cluster once per window; it is sorted, so the first entry is its peak score
+    peak_scores = {}
+    for cluster_id, score in emerging:
+        peak_scores.setdefault(cluster_id, score)
+    groups = clustered_df.groupby('Cluster')
+    with ThreadPoolExecutor(max_workers=max_workers or CONFIG["reports"]["max_workers"]) as pool:
+        futures = {
+            # Each report thread runs in a copy of the caller's context, so it sees the session's diagnostics flags
+            pool.submit(
+                contextvars.copy_context().run,
+                generate_investigative_report,
+                groups.get_group(cluster_id).assign(momentum_score=score),
+                momentum_states,
+                cluster_id,
+                max_tokens
+            ): cluster_id
+            for cluster_id, score in peak_scores.items()
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
 # Threat Categorization
 def categorize_momentum(score):
     score = float(score)
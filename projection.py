@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Persisted dimensionality reduction for post embeddings.
+
+The projection is fitted once on a reference sample, with IncrementalPCA or
+randomized SVD, and saved to disk. Every later run projects with a single
+matrix multiply into the same space, so reduced embeddings stay comparable
+across daily runs and reduction costs O(N * d) instead of a fresh fit.
+
+Refit explicitly when the model or the mix of posts changes:
+
+    python projection.py refit --data raw_posts.csv [--sample 50000] [--method randomized]
+    python projection.py info
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("incremental", "randomized")
+
+class Projection:
+    """Mean-centred linear projection, identical to PCA.transform without whitening"""
+    def __init__(self, mean, components, meta):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.meta = meta
+
+    @property
+    def n_components(self):
+        return self.components.shape[0]
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        return (X - self.mean) @ self.components.T
+
+    def matches(self, meta):
+        """True if this projection was fitted for the same model, pooling, sequence length and size"""
+        return all(self.meta.get(key) == value for key, value in meta.items())
+
+    @classmethod
+    def fit(cls, raw, n_components, method="incremental", sample_rows=50000, batch_size=4096, seed=0, meta=None):
+        """Fit on at most sample_rows rows drawn uniformly from raw"""
+        if method not in METHODS:
+            raise ValueError(f"Unknown projection method {method!r}; expected one of {METHODS}")
+        # Only fitting needs scikit-learn; loading and applying a saved projection is plain NumPy
+        from sklearn.decomposition import PCA, IncrementalPCA
+        raw = np.asarray(raw, dtype=np.float32)
+        if len(raw) > sample_rows:
+            raw = raw[np.sort(np.random.default_rng(seed).choice(len(raw), sample_rows, replace=False))]
+        n_components = min(n_components, raw.shape[0], raw.shape[1])
+        start = time.perf_counter()
+        if method == "incremental":
+            # Every partial_fit batch needs at least n_components rows
+            model = IncrementalPCA(n_components=n_components, batch_size=max(batch_size, n_components))
+        else:
+            model = PCA(n_components=n_components, svd_solver="randomized", random_state=seed)
+        model.fit(raw)
+        meta = dict(meta or {})
+        meta.update(
+            method=method,
+            fitted_rows=len(raw),
+            explained_variance=float(np.sum(model.explained_variance_ratio_)),
+            fitted_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+            fit_seconds=round(time.perf_counter() - start, 2)
+        )
+        return cls(model.mean_, model.components_, meta)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, mean=self.mean, components=self.components, meta=json.dumps(self.meta))
+        os.replace(tmp_path, path)
+        logger.info(f"Saved {self.n_components}-component projection to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Saved projection, or None if there is none"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"], json.loads(str(data["meta"])))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    refit = sub.add_parser("refit", help="fit a new projection on a reference sample and save it")
+    refit.add_argument("--data", required=True, help="raw posts (CSV/Excel/Parquet) to sample from")
+    refit.add_argument("--sample", type=int, help="rows to fit on (default: projection.sample_rows)")
+    refit.add_argument("--method", choices=METHODS, help="default: projection.method")
+    sub.add_parser("info", help="show the saved projection's metadata")
+    args = parser.parse_args()
+
+    # The pipeline is only needed to embed the reference sample
+    import pipeline
+    from ingest import load_raw_posts
+
+    settings = pipeline.CONFIG["projection"]
+    if args.command == "info":
+        projection = Projection.load(settings["path"])
+        print(json.dumps(projection.meta, indent=2) if projection else f"No projection at {settings['path']}")
+        return
+    sample_rows = args.sample or settings["sample_rows"]
+    texts = load_raw_posts(args.data)['text'].dropna()
+    texts = texts.sample(min(sample_rows, len(texts)), random_state=0).tolist()
+    projection = pipeline.refit_projection(
+        pipeline.get_raw_embeddings(texts), method=args.method or settings["method"], sample_rows=sample_rows
+    )
+    print(json.dumps(projection.meta, indent=2))
+
+if __name__ == "__main__":
+    main()
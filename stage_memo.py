@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""In-process memoization of pipeline stages.
+
+A stage result is keyed on a fingerprint of its input data and of the CONFIG
+sections it reads, so a Streamlit rerun caused by an unrelated widget, or a
+change to a setting another stage depends on, does not recompute it. Entries
+are held in one LRU bounded by count and by estimated bytes.
+
+This sits beside Streamlit's cache rather than on st.cache_data: the keys
+need the CONFIG sections and outside versions (the saved projection, the
+media manifest) each stage reads, which st.cache_data never sees; the same
+stages run in batch.py and benchmark.py without a Streamlit runtime; and
+per-stage hit/miss/eviction counts are needed for tuning. The dashboard
+loads uploads through st.cache_data and shows and clears both caches from
+one sidebar panel (app.show_cache_stats).
+"""
+import contextlib
+import copy
+import functools
+import hashlib
+import logging
+import sys
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+def _update(h, obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        h.update(type(obj).__name__.encode())
+        if isinstance(obj, pd.DataFrame):
+            h.update(repr(list(obj.columns)).encode())
+        h.update(repr(obj.dtypes.tolist() if isinstance(obj, pd.DataFrame) else obj.dtype).encode())
+        try:
+            hashed = pd.util.hash_pandas_object(obj, index=True)
+        except TypeError:
+            # Unhashable cells (lists, sets) are fingerprinted through their string form
+            hashed = pd.util.hash_pandas_object(obj.astype(str), index=True)
+        h.update(hashed.to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(f"ndarray{obj.dtype}{obj.shape}".encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        h.update(b"dict")
+        for key in sorted(obj, key=repr):
+            _update(h, key)
+            _update(h, obj[key])
+    elif isinstance(obj, (set, frozenset)):
+        h.update(b"set")
+        for item in sorted(obj, key=repr):
+            _update(h, item)
+    elif isinstance(obj, (list, tuple)):
+        h.update(type(obj).__name__.encode())
+        for item in obj:
+            _update(h, item)
+    else:
+        h.update(f"{type(obj).__name__}:{obj!r}".encode())
+    h.update(b"|")
+
+def fingerprint(*objs):
+    """Content hash of DataFrames, arrays and plain containers of scalars"""
+    h = hashlib.blake2b(digest_size=16)
+    for obj in objs:
+        _update(h, obj)
+    return h.hexdigest()
+
+def estimate_bytes(obj):
+    """Rough in-memory size used for the cache's byte budget"""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(obj, pd.DataFrame) else usage)
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_bytes(k) + estimate_bytes(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_bytes(item) for item in obj)
+    return sys.getsizeof(obj)
+
+def _cacheable(result):
+    # Failed stages return None or an empty DataFrame; those are retried rather than remembered
+    if result is None:
+        return False
+    if isinstance(result, pd.DataFrame) and result.empty:
+        return False
+    return True
+
+class StageMemo:
+    """Bounded LRU of stage results with per-stage hit/miss/eviction counters"""
+    def __init__(self, max_entries=32, max_bytes=1 << 30, enabled=True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries = OrderedDict()  # key -> (stage, value, nbytes)
+        self._bytes = 0
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (True, value) and mark it recently used, or (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counts[(key[0], "misses")] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._counts[(key[0], "hits")] += 1
+            return True, entry[1]
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if nbytes > self.max_bytes:
+                logger.info(f"Not memoizing {key[0]}: {nbytes / 1e6:.1f} MB exceeds the cache budget")
+                return
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (key[0], value, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (stage, _, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self._counts[(stage, "evictions")] += 1
+
+    @contextlib.contextmanager
+    def disabled(self):
+        """Call stages straight through inside the block, then restore the previous setting"""
+        previous = self.enabled
+        self.enabled = False
+        try:
+            yield
+        finally:
+            self.enabled = previous
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Per-stage hits, misses, evictions, live entries and bytes, as a DataFrame"""
+        with self._lock:
+            stages = sorted({stage for stage, _ in self._counts} | {e[0] for e in self._entries.values()})
+            rows = []
+            for stage in stages:
+                live = [e[2] for e in self._entries.values() if e[0] == stage]
+                hits, misses = self._counts[(stage, "hits")], self._counts[(stage, "misses")]
+                rows.append({
+                    "stage": stage,
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                    "evictions": self._counts[(stage, "evictions")],
+                    "entries": len(live),
+                    "mb": sum(live) / 1e6
+                })
+        return pd.DataFrame(rows, columns=["stage", "hits", "misses", "hit_rate", "evictions", "entries", "mb"])
+
+    def stage(self, config, *sections, copy_result=True, sizeof=estimate_bytes, version=None):
+        """Decorator memoizing a stage on its arguments and config[section] for each section.
+
+        version, if given, is called on every lookup and its return value is
+        part of the key, for state outside CONFIG that the stage depends on.
+        It is called again after a miss, and the result stored under that
+        value.
+
+        Results are deep-copied on the way out so callers that mutate them
+        cannot corrupt the cached value; pass copy_result=False for read-only
+        results such as figures.
+        """
+        def decorator(func):
+            name = func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                settings = {s: config[s] for s in sections}
+                if version is not None:
+                    settings["__version__"] = version()
+                key = (name, fingerprint(args, kwargs), fingerprint(settings))
+                hit, value = self.get(key)
+                if not hit:
+                    value = func(*args, **kwargs)
+                    if not _cacheable(value):
+                        return value
+                    if version is not None:
+                        # The stage may itself change the version (bertrend_analysis saves the projection it
+                        # fits), so the result is stored under the version it actually ran with
+                        settings["__version__"] = version()
+                        key = key[:2] + (fingerprint(settings),)
+                    self.put(key, value, sizeof(value))
+                return copy.deepcopy(value) if copy_result else value
+
+            return wrapper
+        return decorator
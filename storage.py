@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Columnar storage for cluster reports.
+
+Reports are kept as Parquet with 'Unique Sources' and 'All URLs' as real
+list<string> columns instead of a stringified Python set and a newline-joined
+blob. ReportStore reads only the columns and rows a caller asks for, so the
+dashboard never materializes the heavy text columns it is not showing.
+"""
+import ast
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+REPORT_COLUMNS = [
+    'Cluster ID',
+    'First Detected',
+    'Last Updated',
+    'Momentum Score',
+    'Total Posts',
+    'Peak Activity',
+    'Unique Sources',
+    'Report Summary',
+    'All URLs',
+    'Thread Categorization'
+]
+LIST_COLUMNS = ['Unique Sources', 'All URLs']
+DATE_COLUMNS = ['First Detected', 'Last Updated']
+
+# A quoted Python string literal, single or double quoted, with escapes
+QUOTED = re.compile(r"'(?:[^'\\]|\\.)*'" r'|"(?:[^"\\]|\\.)*"')
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+def _parse_sources(value):
+    if isinstance(value, (list, tuple, set)):
+        return sorted(str(v) for v in value if not _is_missing(v))
+    if not isinstance(value, str) or not value.strip():
+        return []
+    stripped = value.strip()
+    if stripped == "set()":
+        return []
+    if stripped[0] in "{[(":
+        # A stringified set/list: keep the quoted elements; bare nan/None entries are dropped
+        return sorted(ast.literal_eval(element) for element in QUOTED.findall(stripped))
+    # Not a literal: treat as a comma-separated list
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+def _parse_urls(value):
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    if not isinstance(value, str):
+        return []
+    return [url.strip() for url in value.splitlines() if url.strip()]
+
+def normalize_report(df):
+    """Convert CSV-style report cells into list columns and datetimes"""
+    df = df.copy()
+    if 'Unique Sources' in df.columns:
+        df['Unique Sources'] = df['Unique Sources'].map(_parse_sources)
+    if 'All URLs' in df.columns:
+        df['All URLs'] = df['All URLs'].map(_parse_urls)
+    for column in DATE_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    return df
+
+def to_csv_frame(df):
+    """Inverse of normalize_report, for CSV downloads that older tooling still expects"""
+    df = df.copy()
+    if 'Unique Sources' in df.columns:
+        df['Unique Sources'] = df['Unique Sources'].map(lambda v: str(set(v)) if len(v) else "set()")
+    if 'All URLs' in df.columns:
+        df['All URLs'] = df['All URLs'].map(lambda v: "\n".join(v))
+    return df
+
+def write_report_parquet(df, path):
+    normalize_report(df).to_parquet(path, index=False)
+
+class ReportStore:
+    """Column- and predicate-pushdown reads over a report saved as Parquet"""
+    def __init__(self, path):
+        self.path = path
+        parquet = pq.ParquetFile(path)
+        # The Arrow schema names top-level columns; the Parquet schema would list list-column leaves as 'element'
+        self.columns = list(parquet.schema_arrow.names)
+        self.num_rows = parquet.metadata.num_rows
+
+    def __len__(self):
+        return self.num_rows
+
+    def load(self, columns=None, filters=None):
+        """Read only the given columns, and only row groups/rows matching pyarrow-style filters"""
+        return pd.read_parquet(self.path, columns=columns, filters=filters)
+
+    @classmethod
+    def from_frame(cls, df, cache_dir):
+        """Persist a report DataFrame once per content and open it as a store"""
+        digest = hashlib.sha1(pd.util.hash_pandas_object(df.astype(str), index=False).values.tobytes())
+        return cls._from_digest(digest.hexdigest(), cache_dir, lambda path: write_report_parquet(df, path))
+
+    @classmethod
+    def from_upload(cls, file, cache_dir):
+        """Open an uploaded CSV or Parquet report; CSVs are converted to Parquet on first sight"""
+        data = file.getvalue() if hasattr(file, 'getvalue') else file.read()
+        return cls.from_bytes(data, getattr(file, 'name', ''), cache_dir)
+
+    @classmethod
+    def from_bytes(cls, data, name, cache_dir):
+        def convert(path):
+            if name.endswith('.parquet'):
+                df = pd.read_parquet(io.BytesIO(data))
+            else:
+                df = pd.read_csv(io.BytesIO(data), encoding='utf-8')
+            write_report_parquet(df, path)
+
+        return cls._from_digest(hashlib.sha1(data).hexdigest(), cache_dir, convert)
+
+    @classmethod
+    def _from_digest(cls, digest, cache_dir, write):
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"{digest}.parquet")
+        if not os.path.exists(path):
+            # A temp name of its own per writer, so two sessions storing the same report never share one
+            fd, tmp_path = tempfile.mkstemp(suffix=".parquet.tmp", dir=cache_dir)
+            os.close(fd)
+            try:
+                write(tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            logger.info(f"Stored report as {path}")
+        return cls(path)
+
+class ReportIndex:
+    """In-memory index of the light report columns keyed by 'Cluster ID'; heavy cells stay in the store.
+
+    Filtering, sorting and paging run against the index only, so a rerun
+    costs one pass over a few numeric columns however large the report is.
+    Sources, URLs and summaries are read from the store for one cluster at
+    a time, when it is selected.
+    """
+    def __init__(self, store, columns):
+        self.store = store
+        columns = [c for c in columns if c in store.columns]
+        frame = store.load(columns=columns)
+        self.frame = frame.drop_duplicates('Cluster ID').set_index('Cluster ID').sort_index()
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def tiers(self):
+        return sorted(self.frame['Thread Categorization'].dropna().unique())
+
+    def date_range(self, column='First Detected'):
+        dates = self.frame[column].dropna()
+        return (dates.min(), dates.max()) if len(dates) else (None, None)
+
+    def filter(self, tiers=None, start=None, end=None, min_score=None, max_score=None, date_column='First Detected'):
+        """Boolean selection of the index rows matching every given condition"""
+        keep = pd.Series(True, index=self.frame.index)
+        if tiers:
+            keep &= self.frame['Thread Categorization'].isin(tiers)
+        if start is not None:
+            keep &= self.frame[date_column] >= pd.Timestamp(start)
+        if end is not None:
+            # end is a day: include everything up to its last instant
+            keep &= self.frame[date_column] < pd.Timestamp(end) + pd.Timedelta(days=1)
+        if min_score is not None:
+            keep &= self.frame['Momentum Score'] >= min_score
+        if max_score is not None:
+            keep &= self.frame['Momentum Score'] <= max_score
+        return self.frame[keep]
+
+    @staticmethod
+    def page(selection, page, page_size, sort_by='Momentum Score', ascending=False, columns=None):
+        """One page of an already filtered selection, with only the requested columns"""
+        ordered = selection.sort_values(sort_by, ascending=ascending, kind="stable") if sort_by else selection
+        rows = ordered.iloc[page * page_size:(page + 1) * page_size]
+        return rows[columns] if columns is not None else rows
+
+    def detail(self, cluster_id, columns):
+        """Heavy columns of one cluster, read with predicate pushdown; empty if it is not in the report"""
+        if cluster_id not in self.frame.index:
+            return pd.DataFrame(columns=columns)
+        return self.store.load(columns=['Cluster ID', *columns], filters=[('Cluster ID', '==', cluster_id)])
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""Incremental narrative clustering for micro-batches of new posts.
+
+NarrativeStream keeps centroids, a fitted projection and per-cluster
+momentum between calls, so each update costs O(batch x clusters) rather
+than re-running bertrend_analysis over the full history.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pipeline import (CONFIG, NS_PER_HOUR, get_raw_embeddings, get_projection, saved_projection,
+                      cluster_candidates, momentum_decay, valid_posts)
+
+logger = logging.getLogger(__name__)
+
+def _momentum_view(state):
+    """Momentum state with the open time window folded in, as calculate_trend_momentum reports it"""
+    momentum = state['momentum']
+    if state['last_update'] is not None and state['window_last'] is not None:
+        delta_hours = (state['window_last'] - state['last_update']).total_seconds() / 3600
+        momentum *= momentum_decay(delta_hours)
+    momentum += state['window_count']
+    sources = state['sources'] | state['window_sources']
+    return {
+        'momentum': momentum,
+        'last_update': state['window_last'] if state['window_last'] is not None else state['last_update'],
+        'sources': sources,
+        'momentum_score': momentum * len(sources) * np.log1p(state['window_count'])
+    }
+
+def _close_window(state):
+    view = _momentum_view(state)
+    state.update(momentum=view['momentum'], last_update=view['last_update'], sources=view['sources'],
+                 window=None, window_count=0, window_sources=set(), window_last=None)
+
+def _new_momentum_state():
+    return {'momentum': 0, 'last_update': None, 'sources': set(),
+            'window': None, 'window_count': 0, 'window_sources': set(), 'window_last': None}
+
+class NarrativeStream:
+    """Assigns micro-batches to existing narratives, spawning new ones from unassigned posts"""
+    def __init__(self):
+        self.settings = CONFIG["streaming"]
+        self.pca = None
+        self.centroids = np.zeros((0, CONFIG["bertrend"]["pca_components"]), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.radii = np.zeros(0, dtype=np.float64)  # Mean member distance to centroid
+        self.last_seen = np.zeros(0, dtype=np.int64)
+        self.momentum_states = {}
+        self.aliases = {}  # Cluster ids merged away by reconsolidation -> surviving id
+        self.frames = []  # Clustered posts within retention_hours of the newest one
+        self.newest = None
+        self.batches_seen = 0
+        self._warmup = []
+        self._pending = None
+        self._pending_emb = None
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._reconsolidation = None
+
+    # -- public API -------------------------------------------------------
+    def update(self, batch_df):
+        """Cluster one micro-batch and return it with a 'Cluster' column (-1 while pending)"""
+        batch_df = valid_posts(batch_df).copy()
+        if batch_df.empty:
+            return batch_df.assign(Cluster=pd.Series(dtype=int))
+        # Nanoseconds whatever resolution pandas inferred, since timestamps are compared as NS_PER_HOUR integers
+        batch_df['Timestamp'] = pd.to_datetime(batch_df['Timestamp']).astype('datetime64[ns]')
+        raw = get_raw_embeddings(batch_df['text'].tolist())
+        with self._lock:
+            if self.pca is None:
+                # A saved projection puts the stream in the same space as batch runs from the first batch
+                self.pca = saved_projection()
+            current = len(batch_df)
+            if self.pca is None:
+                self._warmup.append((batch_df, raw))
+                if sum(len(df) for df, _ in self._warmup) < self.settings["warmup_rows"]:
+                    return batch_df.assign(Cluster=-1)
+                # Fit the projection once; every later batch is projected into the same space
+                batch_df = pd.concat([df for df, _ in self._warmup])
+                raw = np.concatenate([emb for _, emb in self._warmup])
+                self._warmup = []
+                self.pca = get_projection(raw)
+            embeddings = self.pca.transform(raw).astype(np.float32)
+            labels = self._assign(embeddings, batch_df['Timestamp'].astype(np.int64).values)
+            unassigned = labels == -1
+            assigned = batch_df[~unassigned].assign(Cluster=labels[~unassigned])
+            # _spawn records the posts that found new narratives itself; only their ids come back here
+            labels[unassigned] = self._spawn(batch_df[unassigned], embeddings[unassigned])
+            batch_df['Cluster'] = labels
+            self._update_momentum(assigned)
+            self.frames.append(assigned)
+            self._prune_frames(batch_df['Timestamp'].max())
+            self.batches_seen += 1
+            if self.batches_seen % self.settings["reconsolidate_every"] == 0:
+                self._schedule_reconsolidation()
+            # Warmup rows from earlier batches were already returned as pending
+            return batch_df.iloc[len(batch_df) - current:]
+
+    @property
+    def clustered_df(self):
+        with self._lock:
+            if not self.frames:
+                return pd.DataFrame(columns=['text', 'Timestamp', 'URL', 'Source', 'Cluster'])
+            df = pd.concat(self.frames, ignore_index=True)
+            df['Cluster'] = df['Cluster'].map(self.resolve)
+            return df
+
+    def resolve(self, cluster):
+        while cluster in self.aliases:
+            cluster = self.aliases[cluster]
+        return cluster
+
+    def emerging(self):
+        """Latest score per live cluster that passes the growth and source thresholds"""
+        with self._lock:
+            emerging = []
+            for cluster, state in self.momentum_states.items():
+                view = _momentum_view(state)
+                if (view['momentum_score'] > CONFIG["bertrend"]["growth_threshold"] and
+                        len(view['sources']) >= CONFIG["analysis"]["min_sources"]):
+                    emerging.append((cluster, view['momentum_score']))
+            return sorted(emerging, key=lambda x: -x[1])
+
+    def current_momentum_states(self):
+        with self._lock:
+            return {cluster: {k: v for k, v in _momentum_view(state).items() if k != 'momentum_score'}
+                    for cluster, state in self.momentum_states.items()}
+
+    def wait(self):
+        """Block until any background reconsolidation has finished"""
+        if self._reconsolidation is not None:
+            self._reconsolidation.result()
+
+    # -- assignment -------------------------------------------------------
+    def _active_clusters(self, timestamps):
+        """Ids of narratives within the time window of any of the timestamps; merged ones never are"""
+        window = CONFIG["bertrend"]["time_window_hours"] * NS_PER_HOUR
+        return np.flatnonzero((self.last_seen > timestamps.min() - window) &
+                              (self.last_seen < timestamps.max() + window))
+
+    def _assign(self, embeddings, timestamps):
+        labels = np.full(len(embeddings), -1, dtype=int)
+        # Distances only to narratives that can accept these posts, not every centroid ever spawned
+        active = self._active_clusters(timestamps) if len(self.centroids) else []
+        if not len(active):
+            return labels
+        centroids = self.centroids[active]
+        sq = (np.einsum("ij,ij->i", embeddings, embeddings)[:, None] +
+              np.einsum("ij,ij->i", centroids, centroids)[None, :] -
+              2 * embeddings @ centroids.T)
+        dists = np.sqrt(np.maximum(sq, 0))
+        # Only narratives active within the time window of each post accept it
+        gap_hours = np.abs(timestamps[:, None] - self.last_seen[active][None, :]) / NS_PER_HOUR
+        dists[gap_hours >= CONFIG["bertrend"]["time_window_hours"]] = np.inf
+        nearest = np.argmin(dists, axis=1)
+        best = dists[np.arange(len(embeddings)), nearest]
+        nearest = active[nearest]
+        threshold = np.maximum(self.radii[nearest] * self.settings["radius_scale"],
+                               CONFIG["bertrend"]["cluster_threshold"])
+        hit = best <= threshold
+        labels[hit] = nearest[hit]
+        for cluster in np.unique(labels[hit]):
+            members = hit & (labels == cluster)
+            self._absorb(cluster, embeddings[members], best[members], timestamps[members].max())
+        return labels
+
+    def _absorb(self, cluster, embeddings, dists, last_seen):
+        n_old, n_new = self.counts[cluster], len(embeddings)
+        total = n_old + n_new
+        self.centroids[cluster] = (self.centroids[cluster] * n_old + embeddings.sum(axis=0)) / total
+        self.radii[cluster] = (self.radii[cluster] * n_old + dists.sum()) / total
+        self.counts[cluster] = total
+        self.last_seen[cluster] = max(self.last_seen[cluster], last_seen)
+
+    def _spawn(self, pending_df, pending_emb):
+        """Cluster unassigned posts together with the still-recent pending buffer.
+
+        Returns the narrative id of each row of pending_df, -1 for posts still pending.
+        """
+        n_new = len(pending_df)
+        if self._pending is not None:
+            pending_df = pd.concat([self._pending, pending_df])
+            pending_emb = np.concatenate([self._pending_emb, pending_emb])
+        if pending_df.empty:
+            self._pending, self._pending_emb = None, None
+            return np.zeros(0, dtype=int)
+        timestamps = pending_df['Timestamp'].astype(np.int64).values
+        labels = cluster_candidates(pending_emb, timestamps)
+        spawned_ids = np.full(len(pending_df), -1, dtype=int)
+        for label in np.unique(labels[labels != -1]):
+            members = labels == label
+            cluster = len(self.centroids)
+            centroid = pending_emb[members].mean(axis=0)
+            self.centroids = np.vstack([self.centroids, centroid[None, :]])
+            self.counts = np.append(self.counts, members.sum())
+            self.radii = np.append(self.radii, np.linalg.norm(pending_emb[members] - centroid, axis=1).mean())
+            self.last_seen = np.append(self.last_seen, timestamps[members].max())
+            self.momentum_states[cluster] = _new_momentum_state()
+            spawned_ids[members] = cluster
+            spawned = pending_df[members].assign(Cluster=cluster)
+            self._update_momentum(spawned)
+            self.frames.append(spawned)
+        # Posts that stayed noise wait one time window for companions, then are dropped
+        horizon = timestamps.max() - CONFIG["bertrend"]["time_window_hours"] * NS_PER_HOUR
+        keep = (labels == -1) & (timestamps >= horizon)
+        self._pending, self._pending_emb = pending_df[keep], pending_emb[keep]
+        return spawned_ids[len(spawned_ids) - n_new:]
+
+    def _prune_frames(self, newest):
+        """Drop clustered posts older than retention_hours before the newest post seen"""
+        self.newest = newest if self.newest is None else max(self.newest, newest)
+        horizon = self.newest - pd.Timedelta(hours=self.settings["retention_hours"])
+        frames = []
+        for frame in self.frames:
+            if frame.empty or frame['Timestamp'].max() < horizon:
+                continue
+            if frame['Timestamp'].min() < horizon:
+                frame = frame[frame['Timestamp'] >= horizon]
+            frames.append(frame)
+        self.frames = frames
+
+    # -- momentum ---------------------------------------------------------
+    def _update_momentum(self, assigned_df):
+        if assigned_df.empty:
+            return
+        windows = assigned_df['Timestamp'].dt.floor(CONFIG["analysis"]["time_window"])
+        grouped = assigned_df.assign(time_window=windows).groupby(['Cluster', 'time_window']).agg(
+            count=('text', 'size'),
+            sources=('Source', 'unique'),
+            last_time=('Timestamp', 'max')
+        ).reset_index().sort_values('time_window')
+        for cluster, window, count, sources, last_time in grouped.itertuples(index=False):
+            state = self.momentum_states[self.resolve(cluster)]
+            if state['window'] is not None and window > state['window']:
+                _close_window(state)
+            # Late posts for an already-closed window are folded into the open one
+            if state['window'] is None or window > state['window']:
+                state['window'] = window
+            state['window_count'] += count
+            state['window_sources'].update(sources)
+            if state['window_last'] is None or last_time > state['window_last']:
+                state['window_last'] = last_time
+
+    # -- reconsolidation --------------------------------------------------
+    def _schedule_reconsolidation(self):
+        if self._reconsolidation is not None and not self._reconsolidation.done():
+            return
+        self._reconsolidation = self._executor.submit(self.reconsolidate)
+
+    def reconsolidate(self):
+        """Merge live narratives whose centroids drifted within each other's radius"""
+        with self._lock:
+            live = np.array([c for c in range(len(self.centroids)) if c not in self.aliases], dtype=int)
+            centroids, radii = self.centroids[live].copy(), self.radii[live].copy()
+        if len(live) < 2:
+            return 0
+        sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+        dists = np.sqrt(np.maximum(sq_norms[:, None] + sq_norms[None, :] - 2 * centroids @ centroids.T, 0))
+        limit = self.settings["merge_scale"] * (radii[:, None] + radii[None, :]) / 2
+        pairs = np.argwhere(np.triu(dists <= limit, k=1))
+        merged = 0
+        with self._lock:
+            for a, b in pairs:
+                keep, drop = self.resolve(int(live[a])), self.resolve(int(live[b]))
+                if keep == drop:
+                    continue
+                if keep > drop:
+                    keep, drop = drop, keep
+                self._merge(keep, drop)
+                merged += 1
+        if merged:
+            logger.info(f"Reconsolidation merged {merged} narrative pairs")
+        return merged
+
+    def _merge(self, keep, drop):
+        n_keep, n_drop = self.counts[keep], self.counts[drop]
+        total = n_keep + n_drop
+        self.centroids[keep] = (self.centroids[keep] * n_keep + self.centroids[drop] * n_drop) / total
+        self.radii[keep] = (self.radii[keep] * n_keep + self.radii[drop] * n_drop) / total
+        self.counts[keep] = total
+        self.last_seen[keep] = max(self.last_seen[keep], self.last_seen[drop])
+        # Park the dropped centroid far away so it never attracts posts again
+        self.last_seen[drop] = np.iinfo(np.int64).min // 2
+        a, b = self.momentum_states[keep], self.momentum_states.pop(drop)
+        # a keeps the most recent open window; b's window is merged into it or closed
+        if a['window'] is None or (b['window'] is not None and b['window'] > a['window']):
+            a, b = b, a
+        if b['window'] is not None and b['window'] == a['window']:
+            a['window_count'] += b['window_count']
+            a['window_sources'] |= b['window_sources']
+            a['window_last'] = max(a['window_last'], b['window_last'])
+        else:
+            _close_window(b)
+        if b['last_update'] is not None:
+            if a['last_update'] is None:
+                a['momentum'], a['last_update'] = b['momentum'], b['last_update']
+            else:
+                # Decay both closed momenta to the later timestamp before adding
+                newer = max(a['last_update'], b['last_update'])
+                a['momentum'] = (a['momentum'] * momentum_decay((newer - a['last_update']).total_seconds() / 3600) +
+                                 b['momentum'] * momentum_decay((newer - b['last_update']).total_seconds() / 3600))
+                a['last_update'] = newer
+        a['sources'] |= b['sources']
+        self.momentum_states[keep] = a
+        self.aliases[drop] = keep
@@ -0,0 +1,137 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("groq")
+pytest.importorskip("streamlit")
+batch = pytest.importorskip("batch")
+from pipeline import CONFIG
+
+class Crash(Exception):
+    pass
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    """A raw export, fake clustering and report stages that count their calls, and isolated settings"""
+    rng = np.random.default_rng(0)
+    n = 120
+    pd.DataFrame({
+        'text': [f"narrative{i % 3} post {i}" for i in range(n)],
+        'Timestamp': pd.Timestamp("2025-03-01") + pd.to_timedelta(np.sort(rng.uniform(0, 48, n)), unit='h'),
+        'URL': [f"https://x.com/p/{i}" for i in range(n)],
+        'Source': [f"source{s}" for s in rng.integers(0, 10, n)]
+    }).to_csv(tmp_path / "posts.csv", index=False)
+    projection_path = tmp_path / "projection.npz"
+    calls = {"clusters": 0, "momentum": 0, "reports": 0}
+    state = SimpleNamespace(data=str(tmp_path / "posts.csv"), workdir=str(tmp_path / "work"),
+                            out=str(tmp_path / "report.parquet"), tmp_path=tmp_path, calls=calls,
+                            crash_momentum=False, crash_after_reports=None)
+
+    def fake_bertrend(posts):
+        calls["clusters"] += 1
+        # Like the real stage, the first run fits and saves the projection while clustering
+        projection_path.write_bytes(b"projection")
+        return posts.assign(Cluster=posts['text'].str.extract(r"narrative(\d)")[0].astype(int))
+
+    real_momentum = batch.calculate_trend_momentum
+
+    def momentum(clustered):
+        calls["momentum"] += 1
+        if state.crash_momentum:
+            raise Crash()
+        return real_momentum(clustered)
+
+    def fake_reports(clustered, emerging, momentum_states, max_workers=None):
+        # emerging lists a cluster once per window; like generate_reports, report each cluster once
+        for cluster_id in dict.fromkeys(cluster_id for cluster_id, _ in emerging):
+            if state.crash_after_reports is not None and calls["reports"] >= state.crash_after_reports:
+                raise Crash()
+            calls["reports"] += 1
+            yield cluster_id, {'report': f"report {cluster_id}", 'sample_texts': ["a"], 'sample_urls': ["u"]}
+
+    monkeypatch.setattr(batch, "bertrend_analysis", fake_bertrend)
+    monkeypatch.setattr(batch, "calculate_trend_momentum", momentum)
+    monkeypatch.setattr(batch, "generate_reports", fake_reports)
+    monkeypatch.setitem(CONFIG["projection"], "path", str(projection_path))
+    monkeypatch.setitem(CONFIG["media_reuse"], "enabled", False)
+    return state
+
+def checkpoints(env):
+    digest = batch.file_digest(env.data)
+    return batch.Checkpoints(os.path.join(env.workdir, digest[:16]), digest)
+
+def test_run_interrupted_after_clustering_resumes_without_reclustering(env):
+    env.crash_momentum = True
+    with pytest.raises(Crash):
+        batch.run(env.data, env.out, env.workdir)
+    assert env.calls["clusters"] == 1
+    # Keyed by the projection version the stage itself saved, so the checkpoint is reusable
+    assert checkpoints(env).done("clusters")
+    assert not checkpoints(env).done("momentum")
+
+    env.crash_momentum = False
+    assert batch.run(env.data, env.out, env.workdir) == 0
+    assert env.calls == {"clusters": 1, "momentum": 2, "reports": env.calls["reports"]}
+    report = pd.read_parquet(env.out)
+    assert len(report) == env.calls["reports"] > 0
+
+    # A finished run resumes every stage, including the reports already on disk
+    assert batch.run(env.data, env.out, env.workdir) == 0
+    assert env.calls["clusters"] == 1 and env.calls["momentum"] == 2 and env.calls["reports"] == len(report)
+
+def test_new_projection_invalidates_clusters_and_everything_after(env):
+    batch.run(env.data, env.out, env.workdir)
+    assert all(checkpoints(env).done(stage) for stage in batch.STAGES)
+    projection = env.tmp_path / "projection.npz"
+    projection.write_bytes(b"refitted")
+    os.utime(projection, (1, 1))
+    state = checkpoints(env)
+    assert state.done("posts")
+    assert not any(state.done(stage) for stage in ("clusters", "momentum", "reports"))
+    batch.run(env.data, env.out, env.workdir)
+    assert env.calls["clusters"] == 2 and env.calls["momentum"] == 2
+
+def test_new_media_manifest_invalidates_momentum_and_reports_only(env, monkeypatch):
+    batch.run(env.data, env.out, env.workdir)
+    manifest = env.tmp_path / "media.csv"
+    manifest.write_text("URL,Media Path\n")
+    monkeypatch.setitem(CONFIG["media_reuse"], "enabled", True)
+    monkeypatch.setitem(CONFIG["media_reuse"], "manifest", str(manifest))
+    before = checkpoints(env)
+    assert before.done("posts") and before.done("clusters")
+    assert not before.done("momentum") and not before.done("reports")
+    # Touching the manifest is a new version too
+    os.utime(manifest, (1, 1))
+    after = checkpoints(env)
+    assert after.keys["momentum"] != before.keys["momentum"]
+    assert after.keys["clusters"] == before.keys["clusters"]
+
+def test_reports_are_done_only_once_one_is_on_disk(env):
+    env.crash_after_reports = 0
+    with pytest.raises(Crash):
+        batch.run(env.data, env.out, env.workdir)
+    assert checkpoints(env).done("momentum") and not checkpoints(env).done("reports")
+
+    env.crash_after_reports = 1
+    with pytest.raises(Crash):
+        batch.run(env.data, env.out, env.workdir)
+    state = checkpoints(env)
+    assert state.done("reports")
+    assert len(batch.read_finished_reports(state.path("reports"))) == 1
+
+    env.crash_after_reports = None
+    assert batch.run(env.data, env.out, env.workdir) == 0
+    # The report written before the crash was not generated again
+    assert env.calls["reports"] == len(pd.read_parquet(env.out)) > 1
+
+def test_run_leaves_the_memo_setting_as_it_found_it(env):
+    assert batch.stage_memo.enabled
+    batch.run(env.data, env.out, env.workdir)
+    assert batch.stage_memo.enabled
+    env.crash_momentum = True
+    with pytest.raises(Crash):
+        batch.run(env.data, env.out, str(env.tmp_path / "other"))
+    assert batch.stage_memo.enabled
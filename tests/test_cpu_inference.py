@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+from cpu_inference import CPUEncoder, pool_hidden_states
+
+WORDS = ["élection", "gabon", "vote", "france", "russie", "campagne", "le", "la", "de", "président"]
+TEXTS = [
+    "vote",
+    "le président de la campagne",
+    "gabon",
+    "la france et la russie dans la campagne pour le vote au gabon",
+    "élection",
+    "de la campagne",
+    "président gabon vote"
+]
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    """A randomly initialised two-layer BERT with a tiny vocabulary, saved locally so nothing is downloaded"""
+    path = tmp_path_factory.mktemp("tiny-bert")
+    vocab = path / "vocab.txt"
+    vocab.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *WORDS]) + "\n", encoding="utf-8")
+    transformers.BertTokenizerFast(vocab_file=str(vocab), do_lower_case=True).save_pretrained(path)
+    torch.manual_seed(0)
+    config = transformers.BertConfig(vocab_size=5 + len(WORDS), hidden_size=32, num_hidden_layers=2,
+                                     num_attention_heads=2, intermediate_size=64, max_position_embeddings=64)
+    transformers.BertModel(config).eval().save_pretrained(path)
+    return str(path)
+
+def test_pooling_matches_original_mean_without_padding():
+    hidden = torch.randn(3, 7, 16)
+    mask = torch.ones(3, 7, dtype=torch.long)
+    # The original embedder took a plain mean over every position
+    torch.testing.assert_close(pool_hidden_states(hidden, mask), hidden.mean(dim=1))
+    torch.testing.assert_close(pool_hidden_states(hidden, mask, "cls"), hidden[:, 0])
+    torch.testing.assert_close(pool_hidden_states(hidden, mask, "max"), hidden.max(dim=1).values)
+
+def test_pooling_ignores_padding():
+    hidden = torch.randn(3, 9, 16)
+    lengths = [9, 4, 1]
+    mask = (torch.arange(9)[None, :] < torch.tensor(lengths)[:, None]).long()
+    mean, largest = pool_hidden_states(hidden, mask), pool_hidden_states(hidden, mask, "max")
+    for row, length in enumerate(lengths):
+        # Each row equals the original mean over that text alone, unpadded
+        torch.testing.assert_close(mean[row], hidden[row, :length].mean(dim=0))
+        torch.testing.assert_close(largest[row], hidden[row, :length].max(dim=0).values)
+    with pytest.raises(ValueError):
+        pool_hidden_states(hidden, mask, "sum")
+
+@pytest.mark.parametrize("engine", ["torch", "int8"])
+def test_encode_restores_input_order(tiny_model, engine):
+    encoder = CPUEncoder(tiny_model, max_seq_length=32, engine=engine, workers=1, batch_size=2)
+    try:
+        embeddings = encoder.encode(TEXTS)
+        # One text at a time there is no sorting and no padding
+        singles = np.concatenate([encoder.encode([text]) for text in TEXTS])
+    finally:
+        encoder.close()
+    assert embeddings.shape == (len(TEXTS), 32)
+    assert embeddings.dtype == np.float32
+    # Every row lands back at its own text
+    distances = np.linalg.norm(embeddings[:, None] - singles[None], axis=-1)
+    np.testing.assert_array_equal(distances.argmin(axis=1), np.arange(len(TEXTS)))
+    if engine == "torch":
+        np.testing.assert_allclose(embeddings, singles, rtol=1e-4, atol=1e-5)
+    assert encoder.encode([]).shape[0] == 0
+
+class CountingTokenizer:
+    """Wraps a tokenizer and counts tokenization passes; padding is passed through"""
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.tokenizer(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.tokenizer, name)
+
+def test_length_bucketed_encode_restores_input_order(tiny_model, monkeypatch):
+    pytest.importorskip("streamlit")
+    pytest.importorskip("groq")
+    import pipeline
+    tokenizer = CountingTokenizer(transformers.BertTokenizerFast.from_pretrained(tiny_model))
+    model = transformers.BertModel.from_pretrained(tiny_model).eval()
+    monkeypatch.setattr(pipeline, "get_tokenizer", lambda: tokenizer)
+    monkeypatch.setattr(pipeline, "get_bert_model", lambda: model)
+    monkeypatch.setattr(pipeline, "get_device", lambda: torch.device("cpu"))
+    monkeypatch.setitem(pipeline.CONFIG["cpu_inference"], "enabled", False)
+    monkeypatch.setitem(pipeline.CONFIG["gpu_params"], "batch_size", 2)
+    monkeypatch.setitem(pipeline.CONFIG["gpu_params"], "max_seq_length", 32)
+    # Lengths in no particular order, so the length sort moves every text
+    texts = [TEXTS[i] for i in np.random.default_rng(0).permutation(len(TEXTS))]
+
+    embeddings = pipeline.encode_texts(texts, dynamic_padding=True)
+    assert tokenizer.calls == 1
+    singles = np.concatenate([pipeline.encode_texts([text], dynamic_padding=True) for text in texts])
+    np.testing.assert_allclose(embeddings, singles, rtol=1e-4, atol=1e-5)
+    # The fixed-width path agrees, since pooling ignores padding
+    np.testing.assert_allclose(pipeline.encode_texts(texts, dynamic_padding=False), singles, rtol=1e-4, atol=1e-5)
@@ -0,0 +1,97 @@
+import json
+import re
+import threading
+import tracemalloc
+
+import numpy as np
+
+from diagnostics import Diagnostics
+
+def test_tracing_stops_with_the_last_traced_block():
+    diagnostics = Diagnostics(enabled=True, trace_memory=True)
+    with diagnostics.profile("outer"):
+        with diagnostics.profile("inner"):
+            block = np.ones(1_000_000)
+        assert tracemalloc.is_tracing()
+    del block
+    assert not tracemalloc.is_tracing()
+    peaks = diagnostics.records().set_index("stage")["peak_mb"]
+    assert peaks["inner"] >= 8 and peaks["outer"] >= peaks["inner"]
+
+def test_tracing_started_elsewhere_is_left_running():
+    diagnostics = Diagnostics(enabled=True, trace_memory=True)
+    tracemalloc.start()
+    try:
+        with diagnostics.profile("stage"):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+def test_flags_are_per_context():
+    diagnostics = Diagnostics()
+    seen = {}
+
+    def session(name, enabled):
+        diagnostics.use_flags(enabled=enabled)
+        with diagnostics.profile(name):
+            pass
+        seen[name] = diagnostics.enabled
+
+    threads = [threading.Thread(target=session, args=(name, enabled))
+               for name, enabled in [("on", True), ("off", False)]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen == {"on": True, "off": False}
+    assert diagnostics.records()["stage"].tolist() == ["on"]
+    # The thread that never chose keeps the process-wide default
+    assert not diagnostics.enabled
+    diagnostics.enabled = True
+    assert diagnostics.enabled
+
+def profiled():
+    """Two stages, one without rows, so the summary carries missing values"""
+    diagnostics = Diagnostics(enabled=True)
+    for rows in (100, 300):
+        with diagnostics.profile("embed", rows=rows):
+            pass
+    with diagnostics.profile("report"):
+        pass
+    return diagnostics
+
+def test_summary_totals_per_stage():
+    summary = profiled().summary().set_index("stage")
+    assert summary.loc["embed", "calls"] == 2 and summary.loc["embed", "rows"] == 400
+    assert summary.loc["report", "calls"] == 1 and summary.loc["report", "rows"] == 0
+    assert list(summary.columns) == ["calls", "seconds", "cpu_seconds", "rows", "rows_per_sec",
+                                     "peak_mb", "max_rss_mb"]
+
+def test_json_is_strict():
+    def reject(constant):
+        raise ValueError(constant)
+
+    data = json.loads(profiled().to_json(), parse_constant=reject)
+    report = next(row for row in data["summary"] if row["stage"] == "report")
+    assert report["peak_mb"] is None and report["calls"] == 1
+    assert len(data["records"]) == 3 and data["records"][-1]["rows_processed"] is None
+
+def test_prometheus_text_format():
+    text = profiled().to_prometheus()
+    assert text.endswith("\n")
+    sample = re.compile(r'radar_stage_[a-z_]+\{stage="[a-z]+"\} -?\d+(\.\d+)?(e-?\d+)?')
+    for line in text.splitlines():
+        assert line.startswith(("# HELP ", "# TYPE ")) or sample.fullmatch(line), line
+    assert "# TYPE radar_stage_calls_total counter" in text
+    assert "# TYPE radar_stage_rows_per_sec gauge" in text
+    assert 'radar_stage_calls_total{stage="embed"} 2.0' in text
+    # Missing values are left out rather than written as NaN
+    assert 'radar_stage_peak_mb{stage="report"}' not in text
+
+def test_export_format_follows_the_extension(tmp_path):
+    diagnostics = profiled()
+    diagnostics.export(str(tmp_path / "stages.prom"))
+    diagnostics.export(str(tmp_path / "stages.json"))
+    assert (tmp_path / "stages.prom").read_text() == diagnostics.to_prometheus()
+    assert json.loads((tmp_path / "stages.json").read_text())["summary"][0]["stage"] in ("embed", "report")
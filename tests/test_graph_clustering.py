@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("hdbscan")
+from graph_clustering import (NS_PER_HOUR, UnionFind, cluster_graph, cluster_partitions, stitch_partitions,
+                              time_partitions)
+
+PARAMS = {"graph_neighbors": 30, "temporal_weight": 0.5, "time_window_hours": 12,
+          "min_cluster_size": 4, "cluster_threshold": 0.35}
+
+def two_narratives(n_per_topic=200, minutes=3, seed=0):
+    """Two topics posting in turn every few minutes, shuffled out of time order"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(scale=10.0, size=(2, 8))
+    topics = np.tile([0, 1], n_per_topic)
+    embeddings = (centres[topics] + rng.normal(scale=0.05, size=(len(topics), 8))).astype(np.float32)
+    timestamps = (np.arange(len(topics)) // 2 * minutes * 60 * 1e9).astype(np.int64) + 1_740_787_200 * 10 ** 9
+    order = rng.permutation(len(topics))
+    return embeddings[order], timestamps[order], topics[order]
+
+def neighbors(embeddings, k=30):
+    sq = ((embeddings[:, None, :] - embeddings[None, :, :]) ** 2).sum(axis=2)
+    return np.argsort(sq, axis=1, kind="stable")[:, :k]
+
+def run(embeddings, timestamps, partition_size):
+    cores, members = time_partitions(timestamps, neighbors(embeddings), partition_size, PARAMS["time_window_hours"])
+    labels = cluster_partitions(embeddings, timestamps, members, PARAMS, workers=1)
+    return stitch_partitions(len(embeddings), embeddings, timestamps, cores, members, labels), cores
+
+def test_narrative_spanning_partitions_gets_one_id():
+    embeddings, timestamps, topics = two_narratives()
+    clusters, cores = run(embeddings, timestamps, partition_size=100)
+    assert len(cores) == 4
+    for topic in (0, 1):
+        assert np.unique(clusters[topics == topic]).tolist() != [-1]
+        assert len(np.unique(clusters[topics == topic])) == 1
+    assert clusters[topics == 0][0] != clusters[topics == 1][0]
+
+def test_noise_in_core_takes_its_overlap_label():
+    embeddings = np.array([[0, 0], [0, 0.1], [0.1, 0], [0.1, 0.1], [50, 50], [50, 50.1]], dtype=np.float32)
+    timestamps = np.arange(6, dtype=np.int64) * int(NS_PER_HOUR)
+    cores = [np.array([0, 1, 2]), np.array([3, 4, 5])]
+    members = [np.array([0, 1, 2, 3]), np.array([2, 3, 4, 5])]
+    # Post 3 is noise in its own partition but clustered in the one it overlaps
+    labels = [np.array([0, 0, 0, 0]), np.array([-1, -1, 0, 0])]
+    clusters = stitch_partitions(6, embeddings, timestamps, cores, members, labels)
+    assert clusters.tolist() == [0, 0, 0, 0, 1, 1]
+
+def test_ids_are_dense_and_numbered_by_first_post():
+    embeddings, timestamps, _ = two_narratives(seed=1)
+    clusters, _ = run(embeddings, timestamps, partition_size=100)
+    found = clusters[clusters >= 0]
+    assert sorted(np.unique(found)) == list(range(len(np.unique(found))))
+    in_time = clusters[np.argsort(timestamps, kind="stable")]
+    in_time = in_time[in_time >= 0]
+    _, first = np.unique(in_time, return_index=True)
+    assert in_time[np.sort(first)].tolist() == list(range(len(first)))
+    again, _ = run(embeddings, timestamps, partition_size=100)
+    assert np.array_equal(clusters, again)
+
+def test_single_partition_matches_cluster_graph():
+    embeddings, timestamps, _ = two_narratives(n_per_topic=60, minutes=20, seed=2)
+    clusters, cores = run(embeddings, timestamps, partition_size=len(embeddings))
+    assert len(cores) == 1
+    expected = cluster_graph(embeddings, timestamps, PARAMS)
+    assert np.array_equal(clusters == -1, expected == -1)
+    # Same partition of the posts, up to renumbering
+    pairs = set(zip(clusters[clusters >= 0].tolist(), expected[expected >= 0].tolist()))
+    assert len(pairs) == len(set(clusters[clusters >= 0])) == len(set(expected[expected >= 0]))
+
+def test_union_find_keeps_the_lowest_id():
+    uf = UnionFind(5)
+    uf.union(3, 1)
+    uf.union(4, 3)
+    uf.union(2, 0)
+    assert uf.roots().tolist() == [0, 1, 0, 1, 1]
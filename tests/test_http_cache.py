@@ -0,0 +1,92 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip("requests")
+from http_cache import HTTPCache
+
+class Origin(BaseHTTPRequestHandler):
+    """Serves server.body under server.etag, answering 304 when the client already has it"""
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def origin():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Origin)
+    server.requests, server.body, server.etag = [], b"first", '"v1"'
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/heatmap.png"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_fetch_stores_body(origin, tmp_path):
+    cache = HTTPCache(str(tmp_path))
+    path = cache.fetch(origin.url)
+    assert read(path) == b"first"
+    # Within max_age the cached copy is served without asking the origin
+    assert cache.fetch(origin.url) == path
+    assert len(origin.requests) == 1
+
+def test_unchanged_body_is_revalidated(origin, tmp_path):
+    cache = HTTPCache(str(tmp_path), max_age=0)
+    path = cache.fetch(origin.url)
+    derived = cache.derived_path(origin.url, "800x600.png")
+    with open(derived, "wb") as f:
+        f.write(b"resized")
+    assert cache.fetch(origin.url) == path
+    assert origin.requests[-1]["If-None-Match"] == '"v1"'
+    assert read(path) == b"first"
+    assert read(derived) == b"resized"
+
+def test_changed_etag_replaces_body_and_derived_files(origin, tmp_path):
+    cache = HTTPCache(str(tmp_path), max_age=0)
+    cache.fetch(origin.url)
+    derived = cache.derived_path(origin.url, "800x600.png")
+    with open(derived, "wb") as f:
+        f.write(b"resized")
+    origin.body, origin.etag = b"second", '"v2"'
+    path = cache.fetch(origin.url)
+    assert read(path) == b"second"
+    assert not os.path.exists(derived)
+    assert cache.fetch(origin.url) == path
+    assert origin.requests[-1]["If-None-Match"] == '"v2"'
+
+def test_offline_falls_back_to_cache(origin, tmp_path):
+    cache = HTTPCache(str(tmp_path), timeout=2, max_age=0)
+    path = cache.fetch(origin.url)
+    origin.shutdown()
+    origin.server_close()
+    assert cache.fetch(origin.url) == path
+    assert read(path) == b"first"
+    # With nothing cached there is nothing to fall back to
+    with pytest.raises(requests.RequestException):
+        HTTPCache(str(tmp_path / "empty"), timeout=2).fetch(origin.url)
+
+def test_concurrent_fetches_leave_one_body_and_no_temp_files(origin, tmp_path):
+    cache = HTTPCache(str(tmp_path), max_age=0)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        paths = set(pool.map(lambda _: cache.fetch(origin.url), range(8)))
+    assert len(paths) == 1 and read(paths.pop()) == b"first"
+    assert sorted(name.rsplit(".", 1)[1] for name in os.listdir(tmp_path)) == ["body", "json"]
@@ -0,0 +1,103 @@
+import codecs
+import io
+import warnings
+
+import pandas as pd
+import pytest
+
+from ingest import RAW_COLUMNS, iter_raw_batches, load_raw_posts, sniff_csv
+
+ROWS = [
+    ("Élection présidentielle à Libreville", "2025-03-01T08:00:00+00:00", "https://x.com/a/1", "Agence Gabonaise"),
+    ("Débat télévisé ce soir; opposition présente", "2025-03-01T09:30:00+01:00", "https://x.com/b/2", "L'Union"),
+    ("Résultats provisoires annoncés", "2025-03-01T12:00:00+02:00", "https://x.com/c/3", "Agence Gabonaise"),
+    ("Manifestation à Port-Gentil", "not a date", "https://x.com/d/4", "Gabon Média"),
+    ("Appel au calme du gouvernement", "2025-03-02T07:15:00-05:00", "https://x.com/e/5", "L'Union"),
+]
+
+def export(encoding="cp1252", delimiter=";", extra_column=True):
+    """A scrape export with a column the pipeline does not read, and a quoted delimiter inside one text"""
+    header = ["text", "Timestamp", "URL", "Source"] + (["Likes"] if extra_column else [])
+    lines = [delimiter.join(header)]
+    for i, (text, timestamp, url, source) in enumerate(ROWS):
+        fields = [f'"{text}"', timestamp, url, source] + ([str(i)] if extra_column else [])
+        lines.append(delimiter.join(fields))
+    return ("\r\n".join(lines) + "\r\n").encode(encoding)
+
+@pytest.fixture
+def latin_export(tmp_path):
+    path = tmp_path / "posts.csv"
+    path.write_bytes(export())
+    return str(path)
+
+@pytest.mark.parametrize("encoding,delimiter,expected", [
+    ("cp1252", ";", "latin-1"),
+    ("utf-8", ",", "utf-8"),
+    ("utf-8-sig", "\t", "utf-8-sig"),
+    ("utf-16", "|", "utf-16"),
+])
+def test_sniff_csv(encoding, delimiter, expected):
+    buffer = io.BytesIO(export(encoding, delimiter))
+    assert sniff_csv(buffer) == (expected, delimiter)
+    assert buffer.tell() == 0
+
+def test_sniff_csv_keeps_utf8_cut_mid_character():
+    data = export("utf-8")
+    cut = data.index("É".encode("utf-8")) + 1
+    assert sniff_csv(io.BytesIO(data), sample_size=cut)[0] == "utf-8"
+
+def test_chunked_load_of_latin1_semicolon_export(latin_export):
+    batches = list(iter_raw_batches(latin_export, chunksize=2))
+    assert [len(b) for b in batches] == [2, 2, 1]
+    df = load_raw_posts(latin_export, chunksize=2)
+    assert list(df.columns) == RAW_COLUMNS
+    assert df['text'].tolist() == [row[0] for row in ROWS]
+    assert df['Source'].dtype == "category"
+    assert df['Source'].tolist() == [row[3] for row in ROWS]
+    assert df['Timestamp'].dtype == "datetime64[ns]"
+    # Mixed offsets are folded into naive UTC; unparseable values become NaT
+    assert df['Timestamp'].tolist()[:3] == [pd.Timestamp("2025-03-01 08:00"), pd.Timestamp("2025-03-01 08:30"),
+                                            pd.Timestamp("2025-03-01 10:00")]
+    assert pd.isna(df['Timestamp'].iloc[3])
+    assert df['Timestamp'].iloc[4] == pd.Timestamp("2025-03-02 12:15")
+
+def test_chunked_load_matches_one_chunk(latin_export):
+    # Categories are merged in order of appearance per chunk, so only their values are compared
+    pd.testing.assert_frame_equal(load_raw_posts(latin_export, chunksize=2), load_raw_posts(latin_export),
+                                  check_categorical=False)
+
+def test_naive_timestamps_are_kept_as_is(tmp_path):
+    path = tmp_path / "posts.csv"
+    path.write_bytes("text;Timestamp;URL;Source\nbonjour;2025-03-01 08:00:00;https://x.com/a;A\n".encode("cp1252"))
+    assert load_raw_posts(str(path))['Timestamp'].tolist() == [pd.Timestamp("2025-03-01 08:00")]
+
+def test_missing_column_is_reported(tmp_path):
+    path = tmp_path / "posts.csv"
+    path.write_bytes("text;Timestamp;URL\nbonjour;2025-03-01;https://x.com/a\n".encode("cp1252"))
+    with pytest.raises(ValueError, match="Source"):
+        load_raw_posts(str(path))
+
+def test_buffer_upload_is_read_like_a_path(latin_export):
+    with open(latin_export, "rb") as f:
+        buffer = io.BytesIO(f.read())
+    buffer.name = "upload.csv"
+    pd.testing.assert_frame_equal(load_raw_posts(buffer, chunksize=3), load_raw_posts(latin_export),
+                                  check_categorical=False)
+
+def test_bom_is_not_part_of_the_header():
+    assert codecs.BOM_UTF8 + b"text" in export("utf-8-sig")
+    buffer = io.BytesIO(export("utf-8-sig", ","))
+    buffer.name = "posts.csv"
+    assert list(load_raw_posts(buffer).columns) == RAW_COLUMNS
+
+def test_formats_mixed_row_to_row_parse_without_warning(tmp_path):
+    path = tmp_path / "posts.csv"
+    path.write_text("text,Timestamp,URL,Source\n"
+                    "a,2025-03-01 08:00:00,https://x.com/a,A\n"
+                    "b,01 Mar 2025 09:30,https://x.com/b,A\n"
+                    "c,2025-03-01T10:00:00Z,https://x.com/c,B\n", encoding="utf-8")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        df = load_raw_posts(str(path))
+    assert df['Timestamp'].tolist() == [pd.Timestamp("2025-03-01 08:00"), pd.Timestamp("2025-03-01 09:30"),
+                                        pd.Timestamp("2025-03-01 10:00")]
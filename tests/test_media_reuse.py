@@ -0,0 +1,61 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("skimage")
+from media_reuse import MultiIndexHamming, hamming, reuse_groups
+
+def clustered_hashes(n_bases=40, variants=8, max_flips=10, seed=0):
+    """Random 64-bit hashes, each with variants a few random bit flips away, so many pairs sit near the radius"""
+    rng = np.random.default_rng(seed)
+    bases = rng.integers(0, 2 ** 63, size=n_bases, dtype=np.int64).astype(np.uint64) << np.uint64(1)
+    hashes = []
+    for base in bases:
+        for _ in range(variants):
+            flipped = rng.choice(64, size=rng.integers(0, max_flips + 1), replace=False)
+            hashes.append(base ^ np.uint64(sum(1 << int(b) for b in flipped)))
+    return np.array(hashes, dtype=np.uint64)
+
+def brute_force_pairs(hashes, max_distance):
+    pairs = np.array(list(combinations(range(len(hashes)), 2)))
+    distances = hamming(hashes[pairs[:, 0]], hashes[pairs[:, 1]])
+    return {tuple(p) for p in pairs[distances <= max_distance].tolist()}
+
+@pytest.mark.parametrize("max_distance,blocks", [(6, 4), (3, 4), (7, 4), (6, 8)])
+def test_pairs_match_brute_force(max_distance, blocks):
+    hashes = clustered_hashes()
+    index = MultiIndexHamming(hashes, max_distance, blocks=blocks)
+    pairs, distances = index.pairs()
+    assert {tuple(p) for p in pairs.tolist()} == brute_force_pairs(hashes, max_distance)
+    assert np.array_equal(distances, hamming(hashes[pairs[:, 0]], hashes[pairs[:, 1]]))
+
+def test_query_matches_brute_force():
+    hashes = clustered_hashes(seed=1)
+    index = MultiIndexHamming(hashes, 6)
+    for h in hashes[::37]:
+        distances = hamming(hashes, np.uint64(h))
+        found = index.query(h)
+        assert set(found.tolist()) == set(np.flatnonzero(distances <= 6).tolist())
+        assert np.all(np.diff(distances[found]) >= 0)
+
+def scene(seed, size=256):
+    """A photo-like grayscale image: smooth gradients plus a few bright and dark blobs"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    image = 80 * np.sin(2 * np.pi * (x * rng.uniform(0.5, 2) + y * rng.uniform(0.5, 2))) + 128
+    for _ in range(6):
+        cy, cx, r = rng.uniform(0.1, 0.9), rng.uniform(0.1, 0.9), rng.uniform(0.05, 0.2)
+        image += rng.choice([-90, 90]) * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * r ** 2))
+    return Image.fromarray(np.clip(image, 0, 255).astype(np.uint8)).convert("RGB")
+
+def test_resized_reencoded_copy_is_grouped_and_unrelated_image_is_not(tmp_path):
+    original, copy, unrelated = (str(tmp_path / name) for name in ("original.png", "copy.jpg", "other.png"))
+    scene(0).save(original)
+    scene(0).resize((160, 160), Image.BILINEAR).save(copy, quality=60)
+    scene(1).save(unrelated)
+    groups = reuse_groups([original, copy, unrelated, str(tmp_path / "missing.jpg")], workers=1)
+    assert groups[0] >= 0 and groups[0] == groups[1]
+    assert groups[2] == -1
+    assert groups[3] == -1
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("annoy")
+benchmark = pytest.importorskip("benchmark")
+from pipeline import calculate_trend_momentum
+
+STATE_KEYS = ('momentum', 'last_update', 'sources')
+
+def _source_names(sources):
+    """Comparable form of a source set; NaN compares unequal to itself"""
+    return sorted("<nan>" if pd.isna(s) else str(s) for s in sources)
+
+def assert_matches_reference(clustered):
+    expected_emerging, expected_states = benchmark.reference_trend_momentum(clustered)
+    emerging, states = calculate_trend_momentum(clustered)
+    assert emerging == expected_emerging
+    assert states.keys() == expected_states.keys()
+    for cluster, expected in expected_states.items():
+        state = states[cluster]
+        assert state['momentum'] == expected['momentum']
+        assert state['last_update'] == expected['last_update']
+        assert _source_names(state['sources']) == _source_names(expected['sources'])
+
+@pytest.mark.parametrize("seed", [0, 1, 2, 3])
+def test_matches_reference(seed):
+    assert_matches_reference(benchmark.sample_clustered(20, 30, n_sources=40, seed=seed))
+
+def test_nan_sources():
+    clustered = benchmark.sample_clustered(10, 20, n_sources=15, seed=4)
+    clustered.loc[clustered.sample(frac=0.2, random_state=4).index, 'Source'] = np.nan
+    assert_matches_reference(clustered)
+
+def test_nat_timestamps():
+    clustered = benchmark.sample_clustered(10, 20, n_sources=15, seed=5)
+    clustered.loc[clustered.sample(frac=0.1, random_state=5).index, 'Timestamp'] = pd.NaT
+    assert_matches_reference(clustered)
+
+def test_categorical_source():
+    clustered = benchmark.sample_clustered(10, 20, n_sources=15, seed=6)
+    assert_matches_reference(clustered.assign(Source=clustered['Source'].astype('category')))
+
+def test_single_window_clusters():
+    window = pd.Timedelta(benchmark.CONFIG["analysis"]["time_window"])
+    start = pd.Timestamp("2025-03-01")
+    clustered = pd.DataFrame({
+        'text': "post",
+        # Cluster 0 has one window, cluster 1 several, cluster 2 a single post
+        'Timestamp': [start, start, start + window / 4, start, start + 3 * window, start + 9 * window, start],
+        'Source': ["a", "b", "c", "a", "b", "c", "d"],
+        'Cluster': [0, 0, 0, 1, 1, 1, 2]
+    })
+    assert_matches_reference(clustered)
+    assert_matches_reference(clustered[clustered['Cluster'] == 0])
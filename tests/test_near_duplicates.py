@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+pytest.importorskip("sklearn")
+from near_duplicates import bucket_pairs, near_duplicate_groups
+
+def _pairs(sources, targets):
+    return {tuple(sorted(p)) for p in zip(sources.tolist(), targets.tolist())}
+
+def test_small_buckets_yield_every_pair():
+    members = np.arange(6)
+    bucket = np.array([0, 0, 1, 0, 2, 1])
+    sources, targets = bucket_pairs(members, bucket, rank=np.arange(6))
+    assert _pairs(sources, targets) == {(0, 1), (0, 3), (1, 3), (2, 5)}
+
+def test_large_buckets_chain_in_rank_order():
+    members = np.arange(10)
+    rank = np.array([9, 8, 7, 6, 5, 4, 3, 2, 1, 0])
+    sources, targets = bucket_pairs(members, np.zeros(10, dtype=np.int64), rank, all_pairs_bucket=4)
+    assert _pairs(sources, targets) == {(i, i + 1) for i in range(9)}
+
+def test_pairs_missed_by_a_leader_are_grouped():
+    base = "vote early at the polling station tomorrow morning and bring your id card with you"
+    texts = [
+        "breaking " + base,
+        base + " today",
+        base + " today please",
+        "final football scores from the league match played tonight in the capital",
+        ""
+    ]
+    groups = near_duplicate_groups(texts, threshold=0.7)
+    assert groups[1] >= 0 and groups[1] == groups[2]
+    assert groups[3] == -1 and groups[4] == -1
+
+def test_empty_and_blank_inputs():
+    assert len(near_duplicate_groups([])) == 0
+    assert (near_duplicate_groups(["", None, "   "]) == -1).all()
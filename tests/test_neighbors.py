@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+pytest.importorskip("annoy")
+from neighbors import AnnoyNeighborIndex, ExactNeighborIndex, make_neighbor_index, vectors_fingerprint
+
+def test_blocked_annoy_queries_match_single_item_queries():
+    vectors = np.random.default_rng(0).normal(size=(700, 8)).astype(np.float32)
+    index = AnnoyNeighborIndex.build(vectors, n_trees=5, n_threads=4)
+    index.block_size = 64
+    items = np.arange(len(vectors))
+    indices, dists = index.query_items(items, 10)
+    assert indices.shape == dists.shape == (700, 10)
+    for item in [0, 63, 64, 699]:
+        expected, expected_dists = index.index.get_nns_by_item(item, 10, include_distances=True)
+        assert indices[item].tolist() == expected
+        assert dists[item] == pytest.approx(expected_dists, rel=1e-6)
+
+def test_saved_indexes_are_evicted_least_recently_used_first(tmp_path):
+    rng = np.random.default_rng(1)
+    sets = [rng.normal(size=(3000, 16)).astype(np.float32) for _ in range(3)]
+    paths = [str(tmp_path / f"{vectors_fingerprint(v)}_5.ann") for v in sets]
+    build = dict(backend="annoy", n_trees=5, cache_dir=str(tmp_path))
+    make_neighbor_index(sets[0], **build)
+    budget = 2.5 * os.path.getsize(paths[0]) / 1024 / 1024
+    make_neighbor_index(sets[1], cache_max_mb=budget, **build)
+    os.utime(paths[0], (0, 0))
+    os.utime(paths[1], (1, 1))
+    # Reuse marks the first index as recently used, leaving the second to be evicted
+    make_neighbor_index(sets[0], cache_max_mb=budget, **build)
+    make_neighbor_index(sets[2], cache_max_mb=budget, **build)
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in (paths[0], paths[2]))
+
+@pytest.mark.parametrize("block_size,n_threads", [(64, 3), (500, 1), (1000, 2)])
+def test_exact_index_matches_brute_force(block_size, n_threads):
+    vectors = np.random.default_rng(2).normal(size=(500, 8)).astype(np.float32)
+    index = ExactNeighborIndex(vectors, n_threads=n_threads, block_size=block_size)
+    # Queried out of order and not a multiple of the block size
+    items = np.random.default_rng(3).permutation(len(vectors))[:437]
+    indices, dists = index.query_items(items, 10)
+    expected_dists = cdist(vectors[items].astype(np.float64), vectors.astype(np.float64))
+    expected = np.argsort(expected_dists, axis=1, kind="stable")[:, :10]
+    assert indices.shape == dists.shape == (len(items), 10)
+    np.testing.assert_array_equal(indices, expected)
+    np.testing.assert_allclose(dists, np.take_along_axis(expected_dists, expected, axis=1), atol=1e-3)
+    assert (indices[:, 0] == items).all()
+
+def test_exact_index_with_fewer_items_than_k():
+    vectors = np.random.default_rng(4).normal(size=(5, 3)).astype(np.float32)
+    indices, dists = ExactNeighborIndex(vectors, block_size=2).query_items([4, 0, 2], 10)
+    assert indices.shape == (3, 5)
+    assert indices[:, 0].tolist() == [4, 0, 2]
+    assert all(sorted(row) == list(range(5)) for row in indices.tolist())
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+from sklearn.decomposition import PCA
+
+from projection import Projection
+
+def embeddings(n=600, d=32, seed=0):
+    """Eight distinct leading directions over a small noise floor, so every fitted component is well defined"""
+    rng = np.random.default_rng(seed)
+    basis = np.linalg.qr(rng.normal(size=(d, d)))[0]
+    scale = np.concatenate([np.geomspace(10, 2, 8), np.full(d - 8, 0.05)])
+    return (rng.normal(size=(n, d)) * scale) @ basis.T + rng.normal(size=d)
+
+@pytest.mark.parametrize("method", ["incremental", "randomized"])
+def test_fit_matches_pca_up_to_sign(method):
+    raw = embeddings()
+    projection = Projection.fit(raw, 8, method=method, batch_size=128)
+    reference = PCA(n_components=8, svd_solver="full").fit(raw)
+    np.testing.assert_allclose(projection.mean, reference.mean_, atol=1e-4)
+    # Components agree up to sign, and so do the projected rows
+    signs = np.sign(np.sum(projection.components * reference.components_, axis=1))
+    np.testing.assert_allclose(projection.components * signs[:, None], reference.components_, atol=1e-3)
+    np.testing.assert_allclose(projection.transform(raw) * signs, reference.transform(raw), rtol=1e-3, atol=1e-2)
+    assert projection.meta["method"] == method and projection.meta["fitted_rows"] == len(raw)
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError, match="svd"):
+        Projection.fit(embeddings(), 8, method="svd")
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "nested" / "projection.npz")
+    assert Projection.load(path) is None
+    projection = Projection.fit(embeddings(), 8, method="randomized", meta={"model_name": "m"})
+    projection.save(path)
+    loaded = Projection.load(path)
+    np.testing.assert_array_equal(loaded.mean, projection.mean)
+    np.testing.assert_array_equal(loaded.components, projection.components)
+    assert loaded.meta == projection.meta
+    assert not list((tmp_path / "nested").glob("*.tmp*"))
+
+def test_matches_rejects_another_model_or_size():
+    meta = {"model_name": "m", "pooling": "mean", "max_seq_length": 128, "n_components": 8}
+    projection = Projection.fit(embeddings(), 8, method="randomized", meta=meta)
+    assert projection.matches(meta)
+    assert not projection.matches({**meta, "model_name": "other"})
+    assert not projection.matches({**meta, "n_components": 16})
+    assert not projection.matches({**meta, "max_seq_length": 256})
+
+def test_small_corpus_gets_a_throwaway_fit(tmp_path, monkeypatch):
+    pytest.importorskip("groq")
+    pytest.importorskip("streamlit")
+    pipeline = pytest.importorskip("pipeline")
+    path = tmp_path / "projection.npz"
+    monkeypatch.setitem(pipeline.CONFIG["projection"], "path", str(path))
+    monkeypatch.setitem(pipeline.CONFIG["projection"], "min_fit_rows", 500)
+    monkeypatch.setitem(pipeline.CONFIG["bertrend"], "pca_components", 8)
+    monkeypatch.setattr(pipeline, "_projection", None)
+    monkeypatch.setattr(pipeline, "_projection_mtime", None)
+
+    small = pipeline.get_projection(embeddings(n=200))
+    assert small.n_components == 8 and small.meta["fitted_rows"] == 200
+    assert not path.exists() and pipeline.saved_projection() is None
+
+    # A reference-sized corpus becomes the saved projection, reused by the next call
+    saved = pipeline.get_projection(embeddings(n=600))
+    assert path.exists() and saved.meta["fitted_rows"] == 600
+    assert pipeline.get_projection(embeddings(n=200, seed=1)) is saved
+
+    # Switching models invalidates it
+    monkeypatch.setitem(pipeline.CONFIG["bertrend"], "pca_components", 4)
+    assert pipeline.saved_projection() is None
+    assert pipeline.get_projection(embeddings(n=200)).n_components == 4
@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("groq")
+pytest.importorskip("streamlit")
+pipeline = pytest.importorskip("pipeline")
+
+RATE_PER_MINUTE = 600  # One request every 0.1 s once the single-token burst is spent
+
+class StubGroq(BaseHTTPRequestHandler):
+    """Chat completions endpoint answering by the cluster named in the request"""
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        cluster = body["messages"][1]["content"].split()[4]
+        server = self.server
+        with server.lock:
+            server.requests.append((time.monotonic(), cluster))
+            attempt = sum(1 for _, c in server.requests if c == cluster)
+        if cluster == "flaky" and attempt == 1:
+            return self._reply(429, {"error": {"message": "rate limited", "type": "rate_limit"}})
+        if cluster == "broken":
+            return self._reply(400, {"error": {"message": "bad request", "type": "invalid_request_error"}})
+        self._reply(200, {
+            "id": f"chatcmpl-{cluster}", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"report on {cluster}"}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        })
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGroq)
+    server.lock, server.requests = threading.Lock(), []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    reports = pipeline.CONFIG["reports"]
+    monkeypatch.setitem(reports, "base_url", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setitem(reports, "requests_per_minute", RATE_PER_MINUTE)
+    monkeypatch.setitem(reports, "burst", 1)
+    monkeypatch.setitem(reports, "backoff_min", 0.01)
+    monkeypatch.setitem(reports, "backoff_max", 0.01)
+    monkeypatch.setitem(pipeline.CONFIG["report_cache"], "enabled", False)
+    monkeypatch.setattr(pipeline, "_report_client", None)
+    monkeypatch.setattr(pipeline, "_report_limiter", None)
+    # Evidence selection needs the BERT tokenizer and embeddings; only the API path is under test here
+    monkeypatch.setattr(pipeline, "select_report_documents",
+                        lambda cluster_data, max_tokens: cluster_data[['text', 'URL', 'Timestamp']].values.tolist())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_generate_reports_against_stub(stub_server):
+    names = {1: "flaky", 2: "broken", 3: "steady"}
+    clustered = pd.DataFrame({
+        'Cluster': list(names),
+        'text': [f"posts about {name}" for name in names.values()],
+        'URL': [f"https://example.com/{name}" for name in names.values()],
+        'Source': ["a", "b", "c"],
+        'Timestamp': pd.to_datetime(["2025-03-01 10:00"] * 3)
+    })
+    emerging = [(cluster_id, 1.0) for cluster_id in names]
+
+    start = time.monotonic()
+    reports = dict(pipeline.generate_reports(clustered, emerging, {}, max_workers=3))
+
+    # A failing cluster is reported as an error without affecting the others
+    assert set(reports) == set(names)
+    assert "error" in reports[2]
+    assert reports[1]["report"] == "report on flaky"
+    assert reports[3]["report"] == "report on steady"
+    # The 429 was retried, the 400 was not
+    attempts = pd.Series([cluster for _, cluster in stub_server.requests]).value_counts()
+    assert attempts.to_dict() == {"flaky": 2, "broken": 1, "steady": 1}
+    # Every request, retries included, waited for the shared token bucket
+    last = max(t for t, _ in stub_server.requests)
+    assert last - start >= 0.95 * (len(stub_server.requests) - 1) * 60 / RATE_PER_MINUTE
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls the time ReportCache sees"""
+    now = [1000.0]
+    monkeypatch.setattr(pipeline, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+def test_report_cache_entries_expire_after_ttl(tmp_path, clock):
+    cache = pipeline.ReportCache(str(tmp_path / "reports.sqlite"), ttl_hours=1, max_entries=10)
+    cache.put("a", "report a")
+    clock[0] += 3599
+    assert cache.get("a") == "report a"
+    # Reading does not extend the TTL, which counts from when the report was written
+    clock[0] += 2
+    assert cache.get("a") is None
+    cache.put("a", "report a, again")
+    assert cache.get("a") == "report a, again"
+
+def test_report_cache_evicts_least_recently_used(tmp_path, clock):
+    path = str(tmp_path / "reports.sqlite")
+    cache = pipeline.ReportCache(path, ttl_hours=24, max_entries=2)
+    cache.put("a", "report a")
+    clock[0] += 1
+    cache.put("b", "report b")
+    clock[0] += 1
+    assert cache.get("a") == "report a"  # a is now more recent than b
+    clock[0] += 1
+    cache.put("c", "report c")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("report a", "report c")
+    # Entries outlive the process
+    assert pipeline.ReportCache(path, ttl_hours=24, max_entries=2).get("c") == "report c"
+
+def test_report_cache_key_covers_the_whole_request():
+    messages = [{"role": "user", "content": "cluster 1"}]
+    key = pipeline.ReportCache.make_key("model", messages, 0.2, 512)
+    assert key == pipeline.ReportCache.make_key("model", [dict(messages[0])], 0.2, 512)
+    assert key != pipeline.ReportCache.make_key("model", messages, 0.3, 512)
+    assert key != pipeline.ReportCache.make_key("other", messages, 0.2, 512)
+
+def test_select_report_documents(monkeypatch):
+    # One token per word; embeddings put "core" posts at the centroid and "edge" posts far from it
+    monkeypatch.setattr(pipeline, "get_tokenizer",
+                        lambda: lambda texts, add_special_tokens: {"input_ids": [t.split() for t in texts]})
+    distance = {"core": 0.0, "near": 1.0, "edge": 5.0}
+
+    def embed(texts):
+        vectors = [[distance[t.split()[0]] * (-1) ** i, 0.0] for i, t in enumerate(texts)]
+        return np.asarray(vectors) - np.mean(vectors, axis=0)
+
+    monkeypatch.setattr(pipeline, "get_raw_embeddings", embed)
+    texts = ["edge one two three four five six", "core a b", "Core  A b", "near a b c", "edge x",
+             "core c d", "", None]
+    cluster = pd.DataFrame({
+        'text': texts,
+        'URL': [f"https://x.com/{i}" for i in range(len(texts))],
+        'Timestamp': pd.Timestamp("2025-03-01")
+    })
+
+    selected = pipeline.select_report_documents(cluster, max_tokens=12)
+    chosen = [doc[0] for doc in selected]
+    # Case and whitespace variants and empty posts are dropped, central posts come first
+    assert chosen == ["core a b", "core c d", "near a b c", "edge x"]
+    assert sum(len(text.split()) for text in chosen) <= 12
+    for budget in range(0, 20):
+        picked = pipeline.select_report_documents(cluster, max_tokens=budget)
+        assert sum(len(doc[0].split()) for doc in picked) <= budget
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+
+from stage_memo import StageMemo, fingerprint
+
+def counted(memo, config, *sections, name="stage", **options):
+    """A memoized stage that records every real call; entries are keyed by its name"""
+    calls = []
+
+    def stage(df):
+        calls.append(len(df))
+        return {"rows": len(df), "items": [1, 2, 3]}
+
+    stage.__name__ = name
+    return memo.stage(config, *sections, **options)(stage), calls
+
+def frame(n):
+    return pd.DataFrame({"text": [f"post {i}" for i in range(n)], "x": np.arange(n)})
+
+def test_fingerprint_follows_content():
+    assert fingerprint(frame(3)) == fingerprint(frame(3))
+    assert fingerprint(frame(3)) != fingerprint(frame(4))
+    assert fingerprint({"a": 1, "b": {2, 3}}) == fingerprint({"b": {3, 2}, "a": 1})
+    assert fingerprint(np.zeros(3)) != fingerprint(np.zeros(3, dtype=np.float32))
+
+def test_hits_misses_and_stats():
+    memo = StageMemo()
+    stage, calls = counted(memo, {"analysis": {"window": "12h"}}, "analysis")
+    stage(frame(3))
+    stage(frame(3))
+    stage(frame(4))
+    assert calls == [3, 4]
+    stats = memo.stats().set_index("stage").loc["stage"]
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+    assert stats["hit_rate"] == 1 / 3
+
+def test_least_recently_used_entry_is_evicted_first():
+    memo = StageMemo(max_entries=2)
+    stage, calls = counted(memo, {})
+    stage(frame(1))
+    stage(frame(2))
+    stage(frame(1))  # 1 is now more recent than 2
+    stage(frame(3))  # evicts 2
+    stage(frame(1))
+    stage(frame(2))
+    assert calls == [1, 2, 3, 2]
+    assert memo.stats().set_index("stage").at["stage", "evictions"] == 2
+
+def test_byte_budget_uses_sizeof():
+    memo = StageMemo(max_bytes=250)
+    stage, calls = counted(memo, {}, sizeof=lambda value: 100)
+    for n in (1, 2, 3):
+        stage(frame(n))
+    stage(frame(1))
+    stage(frame(3))
+    assert calls == [1, 2, 3, 1]
+    assert memo.stats().set_index("stage").at["stage", "mb"] == 200 / 1e6
+    # A result larger than the whole budget is returned but never stored
+    big, big_calls = counted(memo, {}, name="big", sizeof=lambda value: 1000)
+    big(frame(1))
+    big(frame(1))
+    assert big_calls == [1, 1]
+
+def test_change_in_a_listed_section_misses():
+    config = {"analysis": {"window": "12h"}, "other": {"x": 1}}
+    memo = StageMemo()
+    stage, calls = counted(memo, config, "analysis")
+    stage(frame(2))
+    config["other"]["x"] = 2  # Not listed: still a hit
+    stage(frame(2))
+    config["analysis"]["window"] = "6h"
+    stage(frame(2))
+    assert calls == [2, 2]
+
+def test_change_in_version_misses():
+    version = [1]
+    memo = StageMemo()
+    stage, calls = counted(memo, {}, version=lambda: version[0])
+    stage(frame(2))
+    stage(frame(2))
+    version[0] = 2
+    stage(frame(2))
+    stage(frame(2))
+    assert calls == [2, 2]
+
+def test_version_changed_by_the_stage_itself_still_hits():
+    # Like bertrend_analysis, whose first run fits and saves the projection its key depends on
+    saved = [None]
+    memo = StageMemo()
+    calls = []
+
+    @memo.stage({}, version=lambda: saved[0])
+    def fits(df):
+        calls.append(1)
+        saved[0] = saved[0] or "fitted"
+        return {"rows": len(df)}
+
+    fits(frame(2))
+    fits(frame(2))
+    assert len(calls) == 1
+
+def test_results_are_copied_unless_copy_result_is_off():
+    memo = StageMemo()
+    stage, _ = counted(memo, {})
+    first = stage(frame(2))
+    first["items"].append(4)
+    assert stage(frame(2))["items"] == [1, 2, 3]
+
+    shared, _ = counted(memo, {}, name="figure", copy_result=False)
+    assert shared(frame(2)) is shared(frame(2))
+
+def test_disabled_memo_always_calls_through():
+    memo = StageMemo(enabled=False)
+    stage, calls = counted(memo, {})
+    stage(frame(2))
+    stage(frame(2))
+    assert calls == [2, 2]
+    assert memo.stats().empty
+
+def test_disabled_block_restores_the_setting():
+    memo = StageMemo()
+    stage, calls = counted(memo, {})
+    try:
+        with memo.disabled():
+            stage(frame(2))
+            stage(frame(2))
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert memo.enabled
+    stage(frame(2))
+    stage(frame(2))
+    assert calls == [2, 2, 2]
+
+def test_failed_results_are_not_kept():
+    memo = StageMemo()
+    calls = []
+
+    @memo.stage({})
+    def failing(df):
+        calls.append(1)
+        return pd.DataFrame()
+
+    failing(frame(2))
+    failing(frame(2))
+    assert len(calls) == 2
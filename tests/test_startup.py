@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Needed only to analyse raw uploads; viewing a preprocessed report must not load any of them
+HEAVY_MODULES = ["torch", "transformers", "groq", "matplotlib", "seaborn", "hdbscan", "sklearn", "PIL",
+                 "cpu_inference", "near_duplicates", "media_reuse", "projection"]
+IMPORT_BUDGET_SECONDS = 5
+
+def test_pipeline_import_skips_heavy_modules():
+    pytest.importorskip("streamlit")
+    probe = f"import json, sys; import pipeline; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == []
+
+def test_pipeline_import_within_budget():
+    pytest.importorskip("streamlit")
+    pytest.importorskip("annoy")
+    out = subprocess.run(
+        [sys.executable, "benchmark.py", "startup", "--module", "pipeline",
+         "--max-seconds", str(IMPORT_BUDGET_SECONDS)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    assert out.returncode == 0, out.stderr[-2000:]
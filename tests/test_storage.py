@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from storage import REPORT_COLUMNS, ReportStore, normalize_report, to_csv_frame, _parse_sources
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_REPORT = os.path.join(ROOT, "Gabon_intelligence_reportMarch.csv")
+
+@pytest.fixture
+def sample_store(tmp_path):
+    with open(SAMPLE_REPORT, "rb") as f:
+        return ReportStore.from_bytes(f.read(), "sample.csv", str(tmp_path))
+
+def test_sample_sources_parse_to_clean_names():
+    raw = pd.read_csv(SAMPLE_REPORT)['Unique Sources']
+    for value in raw:
+        sources = _parse_sources(value)
+        assert sources
+        assert "nan" not in sources
+        assert not any(s.startswith(("{", "'", '"')) or s.endswith(("}", "'")) for s in sources)
+    assert "Ed Dove" in _parse_sources(raw.iloc[0])
+
+def test_parse_sources_variants():
+    assert _parse_sources("{'a', nan, \"L'Heure\", 'x\\'y'}") == ["L'Heure", "a", "x'y"]
+    assert _parse_sources("set()") == []
+    assert _parse_sources("a, b") == ["a", "b"]
+    assert _parse_sources(["b", float("nan"), "a"]) == ["a", "b"]
+
+def test_csv_round_trip_keeps_sources():
+    report = normalize_report(pd.read_csv(SAMPLE_REPORT))
+    again = normalize_report(to_csv_frame(report))
+    assert again['Unique Sources'].tolist() == report['Unique Sources'].tolist()
+    assert again['All URLs'].tolist() == report['All URLs'].tolist()
+
+def test_store_lists_top_level_columns(sample_store):
+    assert set(REPORT_COLUMNS) <= set(sample_store.columns)
+    assert "element" not in sample_store.columns
+    urls = sample_store.load(columns=['Cluster ID', 'All URLs'], filters=[('Cluster ID', '==', 1)])['All URLs']
+    assert len(urls.iloc[0]) > 1 and all(u.startswith("http") for u in urls.iloc[0])
+
+def test_display_results_accepts_stored_report(sample_store, monkeypatch):
+    pytest.importorskip("streamlit")
+    app = pytest.importorskip("app")
+
+    class PassedColumnCheck(Exception):
+        pass
+
+    def fail(message):
+        raise AssertionError(message)
+
+    def index_reached(path):
+        raise PassedColumnCheck()
+
+    monkeypatch.setattr(app.st, "error", fail)
+    monkeypatch.setattr(app, "get_report_index", index_reached)
+    with pytest.raises(PassedColumnCheck):
+        app.display_results(sample_store)
+
+def test_concurrent_stores_of_one_report_do_not_collide(tmp_path):
+    with open(SAMPLE_REPORT, "rb") as f:
+        data = f.read()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        stores = list(pool.map(lambda _: ReportStore.from_bytes(data, "sample.csv", str(tmp_path)), range(8)))
+    assert len({store.path for store in stores}) == 1
+    assert all(len(store) == len(stores[0]) > 0 for store in stores)
+    assert os.listdir(tmp_path) == [os.path.basename(stores[0].path)]
+
+def test_failed_store_leaves_no_temp_file(tmp_path):
+    with pytest.raises(Exception):
+        ReportStore.from_bytes(b"\x00not a parquet", "broken.parquet", str(tmp_path))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("hdbscan")
+import pipeline
+import streaming
+from pipeline import CONFIG, calculate_trend_momentum
+
+DIM = 16
+START = pd.Timestamp("2025-03-01")
+
+@pytest.fixture
+def stream(tmp_path, monkeypatch):
+    """A NarrativeStream over fake embeddings: each text is "<topic> <i>" and embeds near its topic's centre"""
+    centres = np.random.default_rng(0).normal(scale=10.0, size=(8, DIM))
+
+    def fake_embeddings(texts):
+        rows = []
+        for text in texts:
+            topic, i = (int(part) for part in text.split())
+            rows.append(centres[topic] + np.random.default_rng(i).normal(scale=0.05, size=DIM))
+        return np.array(rows, dtype=np.float32)
+
+    monkeypatch.setattr(streaming, "get_raw_embeddings", fake_embeddings)
+    monkeypatch.setitem(CONFIG["bertrend"], "pca_components", 8)
+    monkeypatch.setitem(CONFIG["streaming"], "warmup_rows", 40)
+    monkeypatch.setitem(CONFIG["streaming"], "reconsolidate_every", 10 ** 6)
+    monkeypatch.setitem(CONFIG["projection"], "path", str(tmp_path / "projection.npz"))
+    monkeypatch.setattr(pipeline, "_projection", None)
+    monkeypatch.setattr(pipeline, "_projection_mtime", None)
+    monkeypatch.setattr(pipeline.stage_memo, "enabled", False)
+    return streaming.NarrativeStream()
+
+_post_ids = iter(range(10 ** 9))
+
+def batch(topics, hours, per_topic=10, n_sources=6, seed=0):
+    """per_topic posts for each topic, a few minutes apart, starting hours after START"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for topic in topics:
+        for k in range(per_topic):
+            i = next(_post_ids)
+            rows.append({
+                'text': f"{topic} {i}",
+                'Timestamp': START + pd.Timedelta(hours=hours) + pd.Timedelta(minutes=3 * k),
+                'URL': f"https://example.org/{i}",
+                'Source': f"source{rng.integers(n_sources)}"
+            })
+    return pd.DataFrame(rows)
+
+def topics_of(df):
+    return df['text'].str.split().str[0].astype(int)
+
+def test_warmup_returns_only_the_current_batch_with_spawned_ids(stream):
+    first = stream.update(batch([0, 1], hours=0))
+    assert (first['Cluster'] == -1).all()
+    second_batch = batch([0, 1], hours=0.5)
+    second = stream.update(second_batch)
+    assert second['text'].tolist() == second_batch['text'].tolist()
+    # Posts that founded a narrative come back with its id, not as pending
+    assert (second['Cluster'] >= 0).all()
+    per_topic = second.groupby(topics_of(second))['Cluster'].unique()
+    assert all(len(ids) == 1 for ids in per_topic)
+    assert per_topic[0][0] != per_topic[1][0]
+    assert len(stream.clustered_df) == 40
+
+def test_new_posts_join_their_narrative_and_new_topics_spawn(stream):
+    stream.update(batch([0, 1], hours=0))
+    warm = stream.update(batch([0, 1], hours=0.5))
+    ids = warm.groupby(topics_of(warm))['Cluster'].first()
+    result = stream.update(batch([0, 2, 3], hours=3))
+    topics = topics_of(result)
+    assert (result.loc[topics == 0, 'Cluster'] == ids[0]).all()
+    spawned = result[topics > 0].groupby(topics[topics > 0])['Cluster'].unique()
+    assert all(len(labels) == 1 and labels[0] >= 0 for labels in spawned)
+    new_ids = {labels[0] for labels in spawned}
+    assert len(new_ids) == 2 and not new_ids & set(ids)
+    assert set(stream.momentum_states) == set(ids) | new_ids
+
+def test_reconsolidation_merges_a_narrative_split_by_a_gap(stream):
+    stream.update(batch([0, 1], hours=0))
+    before = stream.update(batch([0, 1], hours=0.5))
+    # Beyond time_window_hours the old narrative accepts no posts, so the same topic spawns a second one
+    after = stream.update(batch([0, 2], hours=CONFIG["bertrend"]["time_window_hours"] + 2))
+    old = before.loc[topics_of(before) == 0, 'Cluster'].iloc[0]
+    new = after.loc[topics_of(after) == 0, 'Cluster'].iloc[0]
+    assert new >= 0 and new != old
+    assert stream.reconsolidate() == 1
+    assert stream.resolve(new) == old
+    assert new not in stream.momentum_states
+    clustered = stream.clustered_df
+    assert (clustered.loc[topics_of(clustered) == 0, 'Cluster'] == old).all()
+
+def test_momentum_matches_calculate_trend_momentum(stream):
+    for step in range(8):
+        stream.update(batch([0, 1, 2], hours=4 * step, n_sources=12, seed=step))
+    _, expected = calculate_trend_momentum(stream.clustered_df)
+    states = stream.current_momentum_states()
+    assert states.keys() == expected.keys()
+    for cluster, state in states.items():
+        assert state['momentum'] == pytest.approx(expected[cluster]['momentum'])
+        assert state['last_update'] == expected[cluster]['last_update']
+        assert state['sources'] == expected[cluster]['sources']
+
+def test_merged_and_stale_narratives_are_not_scanned(stream):
+    stream.update(batch([0, 1], hours=0))
+    before = stream.update(batch([0, 1], hours=0.5))
+    window = CONFIG["bertrend"]["time_window_hours"]
+    after = stream.update(batch([0, 2], hours=window + 2))
+    old = before.groupby(topics_of(before))['Cluster'].first()
+    new = after.loc[topics_of(after) == 0, 'Cluster'].iloc[0]
+    spawned = set(after['Cluster'].unique().tolist())
+    now = batch([0], hours=window + 3)['Timestamp'].astype('datetime64[ns]').astype(np.int64).values
+    # Both warmup narratives went quiet more than a window ago
+    assert set(stream._active_clusters(now).tolist()) == spawned
+    stream.reconsolidate()
+    # The merged-away narrative is never scanned again; the survivor took over its last activity
+    assert set(stream._active_clusters(now).tolist()) == spawned - {new} | {old[0]}
+
+def test_clustered_posts_are_kept_for_retention_hours(stream, monkeypatch):
+    monkeypatch.setitem(CONFIG["streaming"], "retention_hours", 10)
+    stream.update(batch([0, 1], hours=0))
+    stream.update(batch([0, 1], hours=0.5))
+    for hours in (6, 12, 18):
+        stream.update(batch([0, 1], hours=hours))
+    clustered = stream.clustered_df
+    assert clustered['Timestamp'].min() >= START + pd.Timedelta(hours=18 - 10)
+    assert len(clustered) == 40
+    # Momentum still counts the posts that aged out
+    assert sum(state['momentum'] for state in stream.current_momentum_states().values()) > 0